@@ -1,7 +1,9 @@
 # 方案3：创建兼容BGEM3FlagModel接口的包装器
-import requests
 import numpy as np
 from typing import List, Union, Dict, Any
+from ollama_embedding_client import OllamaEmbeddingClient
+from embedding_cache import EmbeddingCache
+from sparse_index import lexical_weights
 
 class OllamaBGEM3FlagModel:
     """
@@ -26,6 +28,8 @@ class OllamaBGEM3FlagModel:
                  return_sparse: bool = False,
                  return_colbert_vecs: bool = False,
                  base_url: str = "http://localhost:11434",
+                 max_concurrency: int = 4,
+                 cache: EmbeddingCache = None,
                  **kwargs):
         """
         初始化OllamaBGEM3FlagModel
@@ -33,8 +37,10 @@ class OllamaBGEM3FlagModel:
         Args:
             model_name_or_path: ollama模型名称，如 "bge-m3:567m"
             normalize_embeddings: 是否标准化嵌入向量
-            use_fp16: 是否使用fp16（这里主要用于兼容性）
+            use_fp16: 是否使用fp16（这里主要用于兼容性，压缩存储见 AdvancedRetrievalSystem.build_index）
             base_url: ollama服务地址
+            max_concurrency: 并发请求数上限，建议与ollama的OLLAMA_NUM_PARALLEL一致
+            cache: 可选的嵌入向量缓存，命中的文本不再请求ollama
             其他参数: 为了兼容BGEM3FlagModel接口而保留
         """
         self.model_name = model_name_or_path
@@ -47,6 +53,8 @@ class OllamaBGEM3FlagModel:
         self.return_colbert_vecs = return_colbert_vecs
         self.base_url = base_url
         self.api_url = f"{base_url}/api/embed"
+        self.client = OllamaEmbeddingClient(self.model_name, base_url, max_concurrency=max_concurrency)
+        self.cache = cache
         
         print(f"初始化OllamaBGEM3FlagModel，使用模型: {self.model_name}")
     
@@ -64,7 +72,7 @@ class OllamaBGEM3FlagModel:
             batch_size: 批处理大小
             max_length: 最大长度
             return_dense: 是否返回dense向量
-            return_sparse: 是否返回sparse向量
+            return_sparse: 是否返回sparse向量（ollama不提供，使用本地分词的词频权重代替）
             return_colbert_vecs: 是否返回colbert向量
         
         Returns:
@@ -93,30 +101,13 @@ class OllamaBGEM3FlagModel:
                 processed_sentence = sentence
             processed_sentences.append(processed_sentence)
         
-        # 获取嵌入向量
-        embeddings = []
-        for sentence in processed_sentences:
-            try:
-                response = requests.post(
-                    self.api_url,
-                    json={"model": self.model_name, "input": sentence},
-                    timeout=30
-                )
-                response.raise_for_status()
-                result = response.json()
-                embedding = result["embeddings"][0]
-                embeddings.append(embedding)
-            except Exception as e:
-                print(f"获取嵌入向量时出错: {e}")
-                # 返回零向量作为fallback
-                embeddings.append([0.0] * 1024)
-        
-        embeddings = np.array(embeddings)
-        
-        # 标准化嵌入向量（如果需要）
-        if self.normalize_embeddings:
-            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-            embeddings = embeddings / (norms + 1e-12)  # 避免除零
+        if not processed_sentences:
+            # 空输入不请求ollama，返回 (0, 维度) 的数组，与非空结果的形状和类型一致
+            embeddings = np.zeros((0, self.client.embedding_dim), dtype=np.float32)
+        elif self.cache is None:
+            embeddings = self._embed(processed_sentences, batch_size)
+        else:
+            embeddings = self._encode_with_cache(sentences, processed_sentences, batch_size)
         
         # 构建返回结果
         result = {}
@@ -125,9 +116,8 @@ class OllamaBGEM3FlagModel:
             result['dense_vecs'] = embeddings
         
         if return_sparse:
-            # ollama的bge-m3不直接支持sparse向量，这里返回空的sparse表示
-            print("警告: ollama的bge-m3模型不支持sparse向量，返回空结果")
-            result['lexical_weights'] = [[] for _ in sentences]
+            # ollama的bge-m3不输出模型学习到的sparse权重，这里用本地分词的词频权重代替
+            result['lexical_weights'] = [lexical_weights(sentence) for sentence in sentences]
         
         if return_colbert_vecs:
             # ollama的bge-m3不直接支持colbert向量，这里返回空的colbert表示
@@ -135,6 +125,41 @@ class OllamaBGEM3FlagModel:
             result['colbert_vecs'] = [[] for _ in sentences]
         
         return result
+    
+    def _embed(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """请求ollama获取嵌入向量，并按需标准化"""
+        # 按batch_size分批并发获取嵌入向量，每批只发送一次请求
+        # float32足以表示模型输出，内存是float64的一半
+        embeddings = np.array(self.client.embed(texts, batch_size=batch_size), dtype=np.float32)
+        
+        # 标准化嵌入向量（如果需要）
+        if self.normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / (norms + np.float32(1e-12))  # 避免除零
+        return embeddings
+    
+    def _encode_with_cache(self, sentences: List[str], processed_sentences: List[str],
+                           batch_size: int) -> np.ndarray:
+        """先查缓存，只为未命中的文本（去重后）请求ollama"""
+        instruction = None
+        if self.query_instruction_for_retrieval:
+            instruction = self.query_instruction_format.format(self.query_instruction_for_retrieval, "")
+        keys = [EmbeddingCache.make_key(self.model_name, self.normalize_embeddings, instruction, sentence)
+                for sentence in sentences]
+        
+        vectors = self.cache.get_many(keys)
+        missing = {}
+        for key, text in zip(keys, processed_sentences):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+        
+        if missing:
+            embeddings = self._embed(list(missing.values()), batch_size)
+            fresh = dict(zip(missing.keys(), embeddings))
+            self.cache.put_many(fresh)
+            vectors.update(fresh)
+        
+        return np.stack([vectors[key] for key in keys])
 
 # 使用示例 - 完全兼容原来的BGEM3FlagModel代码
 if __name__ == "__main__":
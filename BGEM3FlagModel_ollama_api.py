@@ -1,12 +1,14 @@
 # 方案2：直接使用ollama API调用bge-m3模型
-import requests
 import numpy as np
+from ollama_embedding_client import OllamaEmbeddingClient
 
 class OllamaBGEM3:
-    def __init__(self, model_name="bge-m3:567m", base_url="http://localhost:11434"):
+    def __init__(self, model_name="bge-m3:567m", base_url="http://localhost:11434", max_concurrency=4):
         self.model_name = model_name
         self.base_url = base_url
         self.api_url = f"{base_url}/api/embed"
+        # 复用连接池，并发发送批次请求
+        self.client = OllamaEmbeddingClient(model_name, base_url, max_concurrency=max_concurrency)
     
     def encode(self, texts, batch_size=12, max_length=8192):
         """
@@ -14,7 +16,7 @@ class OllamaBGEM3:
         
         Args:
             texts: 文本列表或单个文本
-            batch_size: 批处理大小（这里主要用于兼容性）
+            batch_size: 每个请求包含的文本数量
             max_length: 最大长度（这里主要用于兼容性）
         
         Returns:
@@ -23,23 +25,7 @@ class OllamaBGEM3:
         if isinstance(texts, str):
             texts = [texts]
         
-        embeddings = []
-        for text in texts:
-            try:
-                response = requests.post(
-                    self.api_url,
-                    json={"model": self.model_name, "input": text},
-                    timeout=30
-                )
-                response.raise_for_status()
-                result = response.json()
-                # ollama的embed API返回的是embeddings数组，取第一个
-                embedding = result["embeddings"][0]
-                embeddings.append(embedding)
-            except Exception as e:
-                print(f"获取嵌入向量时出错: {e}")
-                # 返回零向量作为fallback
-                embeddings.append([0.0] * 1024)  # bge-m3通常是1024维
+        embeddings = self.client.embed(texts, batch_size=batch_size)
         
         return {'dense_vecs': np.array(embeddings)}
     
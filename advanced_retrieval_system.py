@@ -1,88 +1,492 @@
 # 高级文档检索系统
 from BGEM3FlagModel_compatible import OllamaBGEM3FlagModel
+from embedding_cache import EmbeddingCache
+from vector_index import VectorIndex, FlatIndex, create_index, benchmark_index, select_top_k
+from sparse_index import BM25Index, reciprocal_rank_fusion, weighted_score_fusion
+from metadata_index import MetadataIndex
+from columnar_store import DocumentStore
+from ingestion import TextChunker, ingest, DEFAULT_QUEUE_SIZE
 import numpy as np
-from typing import List, Tuple, Dict
+from typing import Callable, List, Tuple, Dict, Iterable, Iterator
 import json
+import os
 from datetime import datetime
 
+# 精确检索时，过滤后剩余比例低于该值则只对剩余行打分（预过滤），否则全量打分后屏蔽（后过滤）
+EXACT_PREFILTER_SELECTIVITY = 0.5
+
+# save()/load() 使用的文件名
+EMBEDDINGS_FILE = "embeddings.npy"
+METADATA_FILE = "metadata.json"
+
 class AdvancedRetrievalSystem:
-    def __init__(self, model_name: str = "bge-m3:567m"):
-        """初始化高级检索系统"""
-        self.model = OllamaBGEM3FlagModel(model_name, use_fp16=True)
-        self.documents = []
-        self.doc_embeddings = None
-        self.doc_metadata = []
+    def __init__(self, model_name: str = "bge-m3:567m", cache: EmbeddingCache = None):
+        """初始化高级检索系统，cache为可选的嵌入向量缓存"""
+        self.model = OllamaBGEM3FlagModel(model_name, use_fp16=True, cache=cache)
+        # 文本和元数据按列存储，documents / doc_metadata 为按行惰性读取的视图
+        self.store = DocumentStore()
+        # 预分配的嵌入向量缓冲区，前len(self.documents)行有效，容量不足时按倍数扩容
+        self._embedding_buffer = None
+        # 可选的近似最近邻索引，为None时对全部向量做精确内积
+        self.index: VectorIndex = None
+        self._index_dirty = False
+        # BM25倒排索引，首次稀疏/混合检索时构建
+        self._sparse_index: BM25Index = None
+        self._sparse_dirty = False
+        # 元数据字段索引，首次带过滤条件检索时构建，文档变化后重建
+        self._metadata_index: MetadataIndex = None
+        # 使用近似索引时，过滤后剩余比例低于该值则直接对剩余行精确打分，否则在近似结果上后过滤
+        self.prefilter_selectivity = 0.05
+    
+    @property
+    def documents(self):
+        """文档文本视图，支持下标访问、切片和迭代"""
+        return self.store.texts
+    
+    @property
+    def doc_metadata(self):
+        """文档元数据视图，按行还原为dict"""
+        return self.store.metadata
+    
+    @property
+    def doc_embeddings(self):
+        """当前所有文档的嵌入向量矩阵（缓冲区有效部分的视图）"""
+        if self._embedding_buffer is None or not self.documents:
+            return None
+        return self._embedding_buffer[:len(self.documents)]
+    
+    def _append_embeddings(self, embeddings: np.ndarray):
+        """将新向量追加到缓冲区末尾，必要时扩容"""
+        num_docs = len(self.documents)
+        required = num_docs + len(embeddings)
         
+        if self._embedding_buffer is None:
+            capacity = max(required, 64)
+            self._embedding_buffer = np.empty((capacity, embeddings.shape[1]), dtype=embeddings.dtype)
+        elif required > self._embedding_buffer.shape[0] or not self._embedding_buffer.flags.writeable:
+            capacity = max(required, self._embedding_buffer.shape[0] * 2)
+            buffer = np.empty((capacity, self._embedding_buffer.shape[1]), dtype=self._embedding_buffer.dtype)
+            buffer[:num_docs] = self._embedding_buffer[:num_docs]
+            self._embedding_buffer = buffer
+        
+        self._embedding_buffer[num_docs:required] = embeddings
+    
+    def _ensure_writable(self):
+        """内存映射加载的向量是只读的，原地修改前先复制到内存"""
+        if self._embedding_buffer is not None and not self._embedding_buffer.flags.writeable:
+            self._embedding_buffer = np.array(self._embedding_buffer)
+    
     def add_documents(self, docs: List[str], metadata: List[Dict] = None):
-        """添加文档到检索系统"""
-        self.documents.extend(docs)
+        """添加文档到检索系统，只为新文档生成嵌入向量"""
+        if not docs:
+            return
         
         if metadata is None:
-            metadata = [{"id": len(self.documents) + i, "added_at": datetime.now().isoformat()} 
+            start = len(self.documents)
+            metadata = [{"id": start + i, "added_at": datetime.now().isoformat()} 
                        for i in range(len(docs))]
-        self.doc_metadata.extend(metadata)
         
-        # 重新计算所有文档的嵌入向量
-        print(f"正在为 {len(self.documents)} 个文档生成嵌入向量...")
-        self.doc_embeddings = self.model.encode(self.documents)['dense_vecs']
+        print(f"正在为 {len(docs)} 个新文档生成嵌入向量...")
+        embeddings = self.model.encode(docs)['dense_vecs']
+        self.add_embedded_documents(docs, embeddings, metadata)
         print(f"嵌入向量形状: {self.doc_embeddings.shape}")
     
-    def search(self, query: str, top_k: int = 5, threshold: float = 0.0) -> List[Tuple[int, float, str, Dict]]:
+    def add_embedded_documents(self, docs: List[str], embeddings: np.ndarray, metadata: List[Dict]):
+        """追加已生成嵌入向量的文档，并同步更新已构建的索引"""
+        self._append_embeddings(embeddings)
+        self.store.append(docs, metadata)
+        self._metadata_index = None
+        if self.index is not None and not self._index_dirty:
+            self.index.add(embeddings)
+        if self._sparse_index is not None and not self._sparse_dirty:
+            self._sparse_index.add_documents(docs)
+    
+    def ingest(self, sources: Iterable, chunker: TextChunker = None, batch_size: int = 64,
+               queue_size: int = DEFAULT_QUEUE_SIZE, replace_existing: bool = False,
+               on_added: Callable[[List[Dict]], None] = None) -> Iterator[Dict]:
+        """
+        流式导入文件、langchain Document 等数据源：分块后分批嵌入并追加，内存占用与语料大小无关
+        
+        返回生成器，每追加一批产出一次进度，需迭代完才会导入全部数据；参数见 ingestion.ingest
+        """
+        return ingest(self, sources, chunker=chunker, batch_size=batch_size, queue_size=queue_size,
+                      replace_existing=replace_existing, on_added=on_added)
+    
+    def remove_documents(self, indices: List[int]):
+        """
+        删除指定位置的文档
+        
+        被删除位置之后的向量整体前移，不重新生成任何嵌入向量；删除后后续文档的位置会随之变化
+        """
+        num_docs = len(self.documents)
+        remove = sorted({int(i) for i in indices})
+        if not remove:
+            return
+        if remove[0] < 0 or remove[-1] >= num_docs:
+            raise IndexError(f"文档位置超出范围: {remove}")
+        
+        keep_mask = np.ones(num_docs, dtype=bool)
+        keep_mask[remove] = False
+        kept = np.flatnonzero(keep_mask)
+        
+        # 第一个被删除位置之前的行保持不动，只搬移其后的行
+        self._ensure_writable()
+        first = remove[0]
+        self._embedding_buffer[first:len(kept)] = self._embedding_buffer[kept[first:]]
+        self.store.delete(remove)
+        # 行号发生变化，索引在下次检索时重建
+        self._index_dirty = True
+        self._sparse_dirty = True
+        self._metadata_index = None
+        print(f"已删除 {len(remove)} 个文档，剩余 {len(self.documents)} 个")
+    
+    def update_documents(self, indices: List[int], docs: List[str], metadata: List[Dict] = None):
+        """
+        更新指定位置的文档内容，只为这些文档重新生成嵌入向量
+        
+        未提供metadata时保留原有元数据并记录updated_at
+        """
+        if len(indices) != len(docs):
+            raise ValueError("indices 与 docs 的数量必须一致")
+        if metadata is not None and len(metadata) != len(docs):
+            raise ValueError("metadata 与 docs 的数量必须一致")
+        if not docs:
+            return
+        num_docs = len(self.documents)
+        for idx in indices:
+            if idx < 0 or idx >= num_docs:
+                raise IndexError(f"文档位置超出范围: {idx}")
+        
+        print(f"正在为 {len(docs)} 个更新的文档重新生成嵌入向量...")
+        embeddings = self.model.encode(docs)['dense_vecs']
+        self._ensure_writable()
+        self._embedding_buffer[list(indices)] = embeddings
+        self._index_dirty = True
+        self._sparse_dirty = True
+        self._metadata_index = None
+        
+        now = datetime.now().isoformat()
+        for i, (idx, doc) in enumerate(zip(indices, docs)):
+            self.documents[idx] = doc
+            if metadata is not None:
+                self.doc_metadata[idx] = metadata[i]
+            else:
+                self.doc_metadata[idx] = {**self.doc_metadata[idx], "updated_at": now}
+    
+    def save(self, path: str, dtype: str = "float32"):
+        """
+        将检索系统保存到目录，下次启动可直接加载而无需重新生成嵌入向量
+        
+        Args:
+            path: 保存目录，包含 embeddings.npy、metadata.json 以及列式存储的文本和元数据文件
+            dtype: 向量存储精度，"float32" 或 "float16"（体积减半，精度略降）
+        """
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"不支持的存储精度: {dtype}")
+        os.makedirs(path, exist_ok=True)
+        
+        embeddings = self.doc_embeddings
+        if embeddings is None:
+            embeddings = np.empty((0, 0))
+        
+        # 先写临时文件再替换，避免中途失败留下不完整的索引
+        embeddings_path = os.path.join(path, EMBEDDINGS_FILE)
+        with open(embeddings_path + ".tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(embeddings, dtype=dtype))
+        
+        schema = self.store.save(path)
+        
+        metadata_path = os.path.join(path, METADATA_FILE)
+        with open(metadata_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "model": self.model.model_name,
+                "dtype": dtype,
+                "store": schema,
+            }, f, ensure_ascii=False, separators=(",", ":"))
+        
+        os.replace(embeddings_path + ".tmp", embeddings_path)
+        os.replace(metadata_path + ".tmp", metadata_path)
+        print(f"已保存 {len(self.documents)} 个文档到 {path}")
+    
+    @classmethod
+    def load(cls, path: str, mmap: bool = True, cache: EmbeddingCache = None) -> "AdvancedRetrievalSystem":
+        """
+        从save()生成的目录加载检索系统
+        
+        Args:
+            path: 保存目录
+            mmap: 是否以内存映射方式加载向量矩阵和文本。多个进程加载同一文件时共享页缓存，
+                  启动时不读取整个矩阵；之后的增删改会先复制到内存
+            cache: 可选的嵌入向量缓存
+        """
+        with open(os.path.join(path, METADATA_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        
+        system = cls(meta["model"], cache=cache)
+        if "store" in meta:
+            system.store = DocumentStore.load(path, meta["store"], mmap=mmap)
+        else:
+            # 兼容旧版本：文本和元数据直接保存在metadata.json中
+            system.store.append(meta["documents"], meta["doc_metadata"])
+        if system.documents:
+            system._embedding_buffer = np.load(os.path.join(path, EMBEDDINGS_FILE),
+                                               mmap_mode="r" if mmap else None)
+        print(f"已从 {path} 加载 {len(system.documents)} 个文档")
+        return system
+    
+    def build_index(self, kind: str = "ivf", **params) -> VectorIndex:
+        """
+        为当前文档构建近似最近邻索引，之后的search/batch_search都通过该索引检索
+        
+        Args:
+            kind: "flat"（精确）、"ivf"、"hnsw"，或压缩存储 "fp16"、"sq8"、"pq"
+            params: 索引参数，如 nlist/nprobe、M/ef_construction/ef_search、m/rescore
+        
+        新增文档会直接追加到索引；删除或更新文档后，索引在下次检索时重建。
+        压缩索引开启rescore时用doc_embeddings精确重排候选；配合 load(mmap=True)，
+        原始矩阵留在磁盘上，常驻内存的只有压缩码
+        """
+        if self.doc_embeddings is None:
+            raise ValueError("请先添加文档")
+        index = create_index(kind, **params)
+        print(f"正在为 {len(self.documents)} 个文档构建 {kind} 索引...")
+        index.build(self.doc_embeddings)
+        self.index = index
+        self._index_dirty = False
+        return index
+    
+    def drop_index(self):
+        """删除近似索引，恢复精确检索"""
+        self.index = None
+        self._index_dirty = False
+    
+    def set_search_params(self, **params):
+        """调整索引的检索参数，如 nprobe 或 ef_search"""
+        if self.index is None:
+            raise ValueError("请先调用 build_index")
+        self.index.set_search_params(**params)
+    
+    def index_report(self, queries: List[str], top_k: int = 10, search_params_list: List[Dict] = None) -> List[Dict]:
+        """对比当前近似索引与精确检索的 recall@k 和延迟"""
+        if self.index is None:
+            raise ValueError("请先调用 build_index")
+        self._refresh_index()
+        exact = FlatIndex()
+        exact.build(self.doc_embeddings)
+        query_embeddings = self.model.encode(list(queries))['dense_vecs']
+        return benchmark_index(self.index, exact, query_embeddings, top_k, search_params_list)
+    
+    def _refresh_index(self):
+        if self.index is not None and self._index_dirty:
+            print("文档已变化，正在重建索引...")
+            self.index.build(self.doc_embeddings)
+            self._index_dirty = False
+    
+    def filter_mask(self, filters: Dict) -> np.ndarray:
+        """
+        对元数据过滤表达式求值，返回每个文档是否满足条件的布尔数组
+        
+        表达式语法见 MetadataIndex，例如 {"category": {"$in": ["NLP", "AI/ML"]}, "added_at": {"$gte": "2025-01-01"}}
+        """
+        if self._metadata_index is None:
+            self._metadata_index = MetadataIndex()
+            self._metadata_index.build_from_store(self.store)
+        return self._metadata_index.evaluate(filters)
+    
+    def _score(self, query_embeddings: np.ndarray, top_k: int, threshold: float,
+               allowed: np.ndarray = None):
+        """
+        对一组查询向量检索top_k，返回 (indices, scores, mask)
+        
+        allowed为元数据过滤得到的布尔数组，根据剩余比例选择预过滤或后过滤
+        """
+        if allowed is not None:
+            return self._score_filtered(query_embeddings, top_k, threshold, allowed)
+        
+        if self.index is None:
+            similarities = query_embeddings @ self.doc_embeddings.T
+            return select_top_k(similarities, top_k, threshold)
+        
+        return self._search_index(query_embeddings, top_k, threshold)
+    
+    def _search_index(self, query_embeddings: np.ndarray, top_k: int, threshold: float):
+        self._refresh_index()
+        if getattr(self.index, "rescore", False):
+            # 缓冲区可能因扩容而更换，每次检索前重新指向
+            self.index.rescore_vectors = self.doc_embeddings
+        indices, scores = self.index.search(query_embeddings, top_k)
+        return indices, scores, (indices >= 0) & (scores >= threshold)
+    
+    def _score_filtered(self, query_embeddings: np.ndarray, top_k: int, threshold: float,
+                        allowed: np.ndarray):
+        rows = np.flatnonzero(allowed)
+        selectivity = len(rows) / max(len(allowed), 1)
+        
+        if self.index is None:
+            if selectivity >= EXACT_PREFILTER_SELECTIVITY:
+                # 后过滤：全量矩阵乘法，不满足条件的行置为-inf
+                similarities = query_embeddings @ self.doc_embeddings.T
+                similarities[:, ~allowed] = -np.inf
+                indices, scores, mask = select_top_k(similarities, top_k, threshold)
+                return indices, scores, mask & np.isfinite(scores)
+            return self._score_rows(query_embeddings, rows, top_k, threshold)
+        
+        if selectivity <= self.prefilter_selectivity:
+            return self._score_rows(query_embeddings, rows, top_k, threshold)
+        
+        # 近似索引后过滤：按剩余比例多取候选，不足top_k个的查询退回到对剩余行精确打分
+        fetch = min(len(allowed), int(np.ceil(top_k / selectivity)) * 2)
+        candidates, candidate_scores, _ = self._search_index(query_embeddings, fetch, -np.inf)
+        keep = (candidates >= 0) & allowed[np.maximum(candidates, 0)]
+        
+        k = min(top_k, len(rows))
+        indices = np.full((len(query_embeddings), k), -1, dtype=np.int64)
+        scores = np.full((len(query_embeddings), k), -np.inf, dtype=np.float32)
+        for row in range(len(query_embeddings)):
+            found = candidates[row][keep[row]][:k]
+            if len(found) < k:
+                fallback, fallback_scores, _ = self._score_rows(query_embeddings[row:row + 1], rows, k, -np.inf)
+                indices[row], scores[row] = fallback[0], fallback_scores[0]
+            else:
+                indices[row], scores[row] = found, candidate_scores[row][keep[row]][:k]
+        return indices, scores, (indices >= 0) & (scores >= threshold)
+    
+    def _score_rows(self, query_embeddings: np.ndarray, rows: np.ndarray, top_k: int, threshold: float):
+        """预过滤：只对指定行精确打分"""
+        similarities = query_embeddings @ self.doc_embeddings[rows].T
+        indices, scores, mask = select_top_k(similarities, top_k, threshold)
+        return rows[indices], scores, mask
+    
+    def _get_sparse_index(self) -> BM25Index:
+        if self._sparse_index is None or self._sparse_dirty:
+            print(f"正在为 {len(self.documents)} 个文档构建BM25倒排索引...")
+            self._sparse_index = BM25Index()
+            self._sparse_index.build(self.documents)
+            self._sparse_dirty = False
+        return self._sparse_index
+    
+    def search(self, query: str, top_k: int = 5, threshold: float = 0.0,
+               mode: str = "dense", fusion: str = "rrf", dense_weight: float = 0.5,
+               candidate_factor: int = 4, filters: Dict = None) -> List[Tuple[int, float, str, Dict]]:
         """
         搜索最相关的文档
         
         Args:
             query: 查询文本
             top_k: 返回前k个结果
-            threshold: 相似度阈值
+            threshold: 相似度阈值，只作用于稠密相似度（dense、sparse_rerank模式）
+            mode: "dense" 稠密向量检索；"sparse" BM25检索；
+                  "hybrid" 稠密与BM25各召回 top_k*candidate_factor 个候选后融合；
+                  "sparse_rerank" 先用BM25召回候选，只对候选计算稠密相似度
+            fusion: hybrid模式的融合方式，"rrf"（倒数排名融合）或 "weighted"（归一化得分加权）
+            dense_weight: 融合时稠密检索的权重，BM25权重为 1-dense_weight
+            candidate_factor: 每路召回的候选数量为 top_k 的倍数
+            filters: 元数据过滤表达式，如 {"category": "NLP"}，只返回满足条件的文档
             
         Returns:
-            List of (index, similarity, document, metadata)
+            List of (index, similarity, document, metadata)，sparse/hybrid模式下similarity为BM25/融合得分
         """
         if self.doc_embeddings is None:
             raise ValueError("请先添加文档")
+        if mode not in ("dense", "sparse", "hybrid", "sparse_rerank"):
+            raise ValueError(f"未知的检索模式: {mode}")
+        
+        allowed = self.filter_mask(filters) if filters else None
+        if allowed is not None and not allowed.any():
+            return []
+        
+        if mode == "sparse":
+            hits = self._get_sparse_index().search(query, top_k, allowed)
+            return [(idx, score, self.documents[idx], self.doc_metadata[idx]) for idx, score in hits]
         
         # 生成查询嵌入向量
         query_embedding = self.model.encode([query])['dense_vecs']
         
-        # 计算相似度
-        similarities = query_embedding @ self.doc_embeddings.T
-        similarities = similarities[0]
+        if mode == "dense":
+            # 获取top_k个最相似的文档
+            indices, scores, mask = self._score(query_embedding, top_k, threshold, allowed)
+            return self._build_results(indices[0], scores[0], mask[0])
         
-        # 获取top_k个最相似的文档
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        num_candidates = top_k * candidate_factor
+        sparse_hits = self._get_sparse_index().search(query, num_candidates, allowed)
         
-        results = []
-        for idx in top_indices:
-            similarity = similarities[idx]
-            if similarity >= threshold:
-                results.append((
-                    idx, 
-                    similarity, 
-                    self.documents[idx], 
-                    self.doc_metadata[idx]
-                ))
+        if mode == "sparse_rerank":
+            candidates = np.array([idx for idx, _ in sparse_hits], dtype=np.int64)
+            if len(candidates) == 0:
+                return []
+            similarities = (self.doc_embeddings[candidates] @ query_embedding[0])[None, :]
+            top, scores, mask = select_top_k(similarities, top_k, threshold)
+            return self._build_results(candidates[top[0]], scores[0], mask[0])
         
-        return results
+        indices, _, mask = self._score(query_embedding, num_candidates, -np.inf, allowed)
+        dense_ids = indices[0][mask[0]]
+        if fusion == "rrf":
+            fused = reciprocal_rank_fusion([dense_ids.tolist(), [idx for idx, _ in sparse_hits]],
+                                           weights=[dense_weight, 1 - dense_weight])
+        elif fusion == "weighted":
+            # 两路候选的并集都计算精确的稠密相似度，BM25未召回的按0计
+            union = np.union1d(dense_ids, np.array([idx for idx, _ in sparse_hits], dtype=np.int64))
+            dense_scores = self.doc_embeddings[union] @ query_embedding[0]
+            fused = weighted_score_fusion([dict(zip(union.tolist(), dense_scores.tolist())), dict(sparse_hits)],
+                                          [dense_weight, 1 - dense_weight])
+        else:
+            raise ValueError(f"未知的融合方式: {fusion}")
+        
+        return [(idx, score, self.documents[idx], self.doc_metadata[idx]) for idx, score in fused[:top_k]]
     
-    def batch_search(self, queries: List[str], top_k: int = 3) -> Dict[str, List[Tuple]]:
-        """批量搜索多个查询"""
+    def batch_search(self, queries: List[str], top_k: int = 3, threshold: float = 0.0,
+                     query_chunk_size: int = 256, filters: Dict = None) -> Dict[str, List[Tuple]]:
+        """
+        批量搜索多个查询
+        
+        所有查询一次性编码，并按query_chunk_size分块做矩阵乘法，避免 (Q×D) 相似度矩阵过大；
+        filters 为所有查询共用的元数据过滤表达式
+        """
+        if self.doc_embeddings is None:
+            raise ValueError("请先添加文档")
+        if not queries:
+            return {}
+        
+        allowed = self.filter_mask(filters) if filters else None
+        if allowed is not None and not allowed.any():
+            return {query: [] for query in queries}
+        
+        query_embeddings = self.model.encode(list(queries))['dense_vecs']
+        
         results = {}
-        for query in queries:
-            results[query] = self.search(query, top_k)
+        for start in range(0, len(queries), query_chunk_size):
+            chunk = query_embeddings[start:start + query_chunk_size]
+            indices, scores, mask = self._score(chunk, top_k, threshold, allowed)
+            for row, query in enumerate(queries[start:start + query_chunk_size]):
+                results[query] = self._build_results(indices[row], scores[row], mask[row])
         return results
     
+    def _build_results(self, indices: np.ndarray, scores: np.ndarray, mask: np.ndarray) -> List[Tuple]:
+        """将top-k选择结果组装为 (index, similarity, document, metadata)"""
+        return [
+            (idx, similarity, self.documents[idx], self.doc_metadata[idx])
+            for idx, similarity in zip(indices[mask], scores[mask])
+        ]
+    
     def get_statistics(self) -> Dict:
         """获取系统统计信息"""
         if self.doc_embeddings is None:
             return {"documents": 0, "embedding_dim": 0}
         
-        return {
+        stats = {
             "documents": len(self.documents),
             "embedding_dim": self.doc_embeddings.shape[1],
             "model": self.model.model_name,
-            "avg_doc_length": np.mean([len(doc.split()) for doc in self.documents])
+            "avg_doc_length": np.mean([len(doc.split()) for doc in self.documents]),
+            "store_bytes": self.store.nbytes(),
         }
+        if self.model.cache is not None:
+            stats["cache"] = self.model.cache.stats()
+        if self.index is not None:
+            stats["index"] = {"type": self.index.name, **self.index.get_params()}
+        if self._sparse_index is not None:
+            stats["sparse_index"] = self._sparse_index.get_statistics()
+        return stats
 
 def create_comprehensive_knowledge_base():
     """创建综合知识库"""
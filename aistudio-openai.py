@@ -26,16 +26,90 @@ for chunk in completion:
 # 通过fastap封装接口
 
 # pip install fastapi uvicorn pydantic
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Union
+from contextlib import asynccontextmanager
+import asyncio
+import base64
+import os
+import struct
 import uvicorn
 import json
-from openai import OpenAI
+import httpx
+import openai
+from proxy_cache import ResponseCache, CachedCaller
+from proxy_router import UpstreamRouter, NoUpstreamAvailable
+from proxy_ratelimit import (AdmissionQueue, RateLimiter, RateLimitExceeded, StreamUsage, count_tokens,
+                             estimate_prompt_tokens, estimate_tokens, render_metrics)
+from embedding_batcher import EmbeddingBatcher, ollama_backend, openai_backend
+
+AISTUDIO_API_KEY = os.environ.get("AISTUDIO_API_KEY", "115925abb19ec543cdcbe8af4506ff463ea2b5e8")
+AISTUDIO_BASE_URL = os.environ.get("AISTUDIO_BASE_URL", "https://api-77aaidn1l8c5b7xa.aistudio-app.com/v1")
+# 同时发往上游的最大请求数（流式请求在整个流结束前都占用名额），超出的请求排队等待
+UPSTREAM_CONCURRENCY = int(os.environ.get("UPSTREAM_CONCURRENCY", "64"))
+# 连接池中保持的最大连接数
+UPSTREAM_MAX_CONNECTIONS = int(os.environ.get("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_TIMEOUT = float(os.environ.get("UPSTREAM_TIMEOUT", "120"))
+# 非流式响应缓存：默认只缓存 temperature=0 或带seed的请求，RESPONSE_CACHE_ALL=1 时缓存全部
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_ALL = os.environ.get("RESPONSE_CACHE_ALL", "0") == "1"
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "300"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "4096"))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# 多上游配置文件（格式见 proxy_upstreams.example.json），未设置时只使用上面的AI Studio上游
+PROXY_UPSTREAMS_FILE = os.environ.get("PROXY_UPSTREAMS_FILE")
+# 负载均衡策略: least_outstanding（最少在途请求）或 ewma（EWMA延迟加权），设置时覆盖配置文件
+UPSTREAM_STRATEGY = os.environ.get("UPSTREAM_STRATEGY")
+# 请求超过该时间（秒）未返回时向另一个上游发出对冲请求，设置时覆盖配置文件
+UPSTREAM_HEDGE_DELAY = float(os.environ["UPSTREAM_HEDGE_DELAY"]) if os.environ.get("UPSTREAM_HEDGE_DELAY") else None
+# 流式响应直接转发上游的SSE字节；设为0时逐个解析chunk并按本服务的格式重新生成
+STREAM_PASSTHROUGH = os.environ.get("STREAM_PASSTHROUGH", "1") == "1"
+# 按API Key/模型的限流配置文件（格式见 RateLimiter.from_file），未设置时不限流
+RATE_LIMITS_FILE = os.environ.get("RATE_LIMITS_FILE")
+# 批量请求（X-Priority: batch）最多占用的上游并发名额，其余名额留给交互请求
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", str(max(1, UPSTREAM_CONCURRENCY * 3 // 4))))
+# 等待上游名额的最大排队请求数，超过时返回429
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "1000"))
+# /v1/embeddings 的后端: ollama（/api/embed）或 openai（OpenAI兼容的 /embeddings）
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "ollama")
+EMBEDDING_BASE_URL = os.environ.get("EMBEDDING_BASE_URL", "http://localhost:11434")
+EMBEDDING_API_KEY = os.environ.get("EMBEDDING_API_KEY", "")
+# 并发的嵌入请求最多等待 EMBEDDING_BATCH_DELAY 秒或攒够 EMBEDDING_BATCH_SIZE 条后合并为一次后端调用
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_BATCH_DELAY = float(os.environ.get("EMBEDDING_BATCH_DELAY", "0.005"))
+EMBEDDING_CONCURRENT_BATCHES = int(os.environ.get("EMBEDDING_CONCURRENT_BATCHES", "4"))
+
+# 进程内共享的上游路由（每个上游一个连接池）和按优先级分配上游并发名额的准入队列，在应用启动时创建
+router: Optional[UpstreamRouter] = None
+admission: Optional[AdmissionQueue] = None
+embedding_batcher: Optional[EmbeddingBatcher] = None
+rate_limiter = RateLimiter.from_file(RATE_LIMITS_FILE) if RATE_LIMITS_FILE else RateLimiter()
+cached_caller = CachedCaller(
+    ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_BYTES)
+    if RESPONSE_CACHE_ENABLED else None,
+    cache_all=RESPONSE_CACHE_ALL,
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global router, admission, embedding_batcher
+    router = create_router()
+    router.start()
+    admission = AdmissionQueue(UPSTREAM_CONCURRENCY, batch_limit=BATCH_CONCURRENCY, max_queue=ADMISSION_MAX_QUEUE)
+    embedding_client = httpx.AsyncClient(timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=10))
+    backend = (openai_backend(embedding_client, EMBEDDING_BASE_URL, EMBEDDING_API_KEY)
+               if EMBEDDING_BACKEND == "openai" else ollama_backend(embedding_client, EMBEDDING_BASE_URL))
+    embedding_batcher = EmbeddingBatcher(backend, EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_DELAY,
+                                         EMBEDDING_CONCURRENT_BATCHES)
+    yield
+    await embedding_batcher.close()
+    await embedding_client.aclose()
+    await router.close()
 
 # 创建FastAPI应用
-app = FastAPI(title="AI Studio OpenAI API", description="基于百度AI Studio的OpenAI兼容API封装")
+app = FastAPI(title="AI Studio OpenAI API", description="基于百度AI Studio的OpenAI兼容API封装", lifespan=lifespan)
 
 # 定义请求模型
 class Message(BaseModel):
@@ -54,6 +128,12 @@ class ChatCompletionRequest(BaseModel):
     frequency_penalty: Optional[float] = None
     user: Optional[str] = None
 
+class EmbeddingRequest(BaseModel):
+    model: str
+    input: Union[str, List[str]]
+    encoding_format: Optional[str] = None
+    user: Optional[str] = None
+
 # 定义响应模型
 class ChatCompletionResponse(BaseModel):
     id: str
@@ -63,49 +143,178 @@ class ChatCompletionResponse(BaseModel):
     choices: List[Dict[str, Any]]
     usage: Dict[str, int]
 
-# 创建OpenAI客户端函数
-def get_openai_client():
-    return OpenAI(
-        api_key="115925abb19ec543cdcbe8af4506ff463ea2b5e8",
-        base_url="https://api-77aaidn1l8c5b7xa.aistudio-app.com/v1"
-    )
+def create_router() -> UpstreamRouter:
+    """从 PROXY_UPSTREAMS_FILE 创建上游路由；未配置时所有模型都转发到AI Studio"""
+    options = {}
+    if UPSTREAM_STRATEGY:
+        options["strategy"] = UPSTREAM_STRATEGY
+    if UPSTREAM_HEDGE_DELAY is not None:
+        options["hedge_delay"] = UPSTREAM_HEDGE_DELAY
+    if PROXY_UPSTREAMS_FILE:
+        return UpstreamRouter.from_file(PROXY_UPSTREAMS_FILE, **options)
+    return UpstreamRouter.from_config({
+        "upstreams": [{"name": "aistudio", "base_url": AISTUDIO_BASE_URL, "api_key": AISTUDIO_API_KEY,
+                       "max_connections": UPSTREAM_MAX_CONNECTIONS, "timeout": UPSTREAM_TIMEOUT}],
+        "default_route": ["aistudio"],
+    }, **options)
+
+def build_upstream_params(request: ChatCompletionRequest) -> Dict[str, Any]:
+    """把请求中设置了的参数转发给上游"""
+    params = {
+        "model": request.model,
+        "messages": [{"role": msg.role, "content": msg.content} for msg in request.messages],
+        "temperature": request.temperature,
+    }
+    for name in ("top_p", "n", "max_tokens", "presence_penalty", "frequency_penalty", "user"):
+        value = getattr(request, name)
+        if value is not None:
+            params[name] = value
+    return params
+
+def request_identity(http_request: Request) -> Tuple[str, str]:
+    """从请求头取API Key（Authorization: Bearer）和优先级（X-Priority: interactive/batch）"""
+    authorization = http_request.headers.get("authorization", "")
+    api_key = authorization[7:].strip() if authorization.lower().startswith("bearer ") else "anonymous"
+    priority = http_request.headers.get("x-priority") or rate_limiter.default_priority(api_key)
+    if priority not in ("interactive", "batch"):
+        raise HTTPException(status_code=400, detail=f"未知的优先级: {priority}")
+    return api_key, priority
+
+def too_many_requests(error: RateLimitExceeded) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(error),
+                         headers={"Retry-After": str(max(1, int(error.retry_after + 0.999)))})
+
+def upstream_error_response(error: Exception) -> Optional[Response]:
+    """
+    上游返回的错误（参数错误、鉴权失败、429等）按原状态码和错误内容返回给客户端，而不是统一的500
+
+    openai.APIStatusError 来自SDK调用，httpx.HTTPStatusError 来自透传流式请求（Upstream.open_stream 已读取错误内容）
+    和嵌入后端（raise_for_status）
+    """
+    if not isinstance(error, (openai.APIStatusError, httpx.HTTPStatusError)):
+        return None
+    upstream_response = error.response
+    retry_after = upstream_response.headers.get("retry-after")
+    headers = {"Retry-After": retry_after} if retry_after else None
+    return Response(content=upstream_response.content, status_code=upstream_response.status_code,
+                    media_type=upstream_response.headers.get("content-type", "application/json"), headers=headers)
 
 # 健康检查端点
 @app.get("/health")
 def health_check():
-    return {"status": "ok", "message": "服务正常运行"}
+    return {"status": "ok", "message": "服务正常运行", "response_cache": cached_caller.stats(),
+            "upstreams": router.stats() if router is not None else None,
+            "admission": admission.stats() if admission is not None else None,
+            "embedding_batcher": embedding_batcher.stats() if embedding_batcher is not None else None}
+
+# Prometheus格式的指标：准入队列深度、排队等待时间、限流拒绝数
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(render_metrics(admission, rate_limiter))
 
 # 聊天完成端点
 @app.post("/v1/chat/completions")
-async def chat_completions(request: ChatCompletionRequest):
-    client = get_openai_client()
+async def chat_completions(request: ChatCompletionRequest, http_request: Request):
+    params = build_upstream_params(request)
+    api_key, priority = request_identity(http_request)
+    try:
+        # 按API Key和模型的令牌桶预扣请求数和预估token数，超出额度时等待或返回429
+        reservation = await rate_limiter.acquire(
+            api_key, request.model, estimate_tokens(params["messages"], request.max_tokens), priority)
+    except RateLimitExceeded as e:
+        raise too_many_requests(e)
 
     try:
         # 处理流式响应
         if request.stream:
+            # 流结束（包括客户端断开）时按实际输出修正预扣的token数
+            usage = StreamUsage(estimate_prompt_tokens(params["messages"]))
+
+        if request.stream and STREAM_PASSTHROUGH:
+            async def passthrough_stream():
+                async with admission.slot(priority):
+                    response, upstream = await router.call(
+                        request.model,
+                        lambda upstream, model: upstream.open_stream(
+                            "chat/completions", {**params, "model": model, "stream": True}),
+                        discard=lambda response: response.aclose(),
+                    )
+                    # 上游SSE字节原样转发，不解析、不重新序列化（reasoning_content 等字段一并保留）。
+                    # 客户端读得慢时 send 会等待，生成器暂停，不再从上游读取，背压经TCP传回上游；
+                    # 客户端断开时生成器被取消或关闭，finally 中关闭响应即断开上游连接、停止生成
+                    try:
+                        async with upstream.hold():
+                            async for chunk in response.aiter_raw():
+                                usage.feed(chunk)
+                                yield chunk
+                    finally:
+                        await response.aclose()
+                        reservation.settle(usage.total_tokens)
+
+            # 先取到第一块再返回：上游全部不可用时在发送响应头之前返回正确的状态码
+            stream = passthrough_stream()
+            try:
+                first_chunk = await stream.__anext__()
+            except StopAsyncIteration:
+                first_chunk = b""
+
+            async def body():
+                try:
+                    yield first_chunk
+                    async for chunk in stream:
+                        yield chunk
+                finally:
+                    await stream.aclose()
+
+            return StreamingResponse(body(), media_type="text/event-stream",
+                                     headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+        elif request.stream:
             async def generate_stream():
-                completion = client.chat.completions.create(
-                    model=request.model,
-                    messages=[{"role": msg.role, "content": msg.content} for msg in request.messages],
-                    temperature=request.temperature,
-                    stream=True
-                )
-
-                for chunk in completion:
-                    if hasattr(chunk.choices[0].delta, "content") and chunk.choices[0].delta.content:
-                        # 构建流式响应格式
-                        data = {
-                            "id": chunk.id,
-                            "object": "chat.completion.chunk",
-                            "created": chunk.created,
-                            "model": request.model,
-                            "choices": [{
-                                "index": 0,
-                                "delta": {"content": chunk.choices[0].delta.content},
-                                "finish_reason": chunk.choices[0].finish_reason
-                            }]
-                        }
-                        yield f"data: {json.dumps(data)}\n\n"
+                # 流式请求在整个流期间占用一个上游并发名额；异步迭代不会阻塞其他请求
+                async with admission.slot(priority):
+                    # 只在拿到响应头之前故障转移/对冲，开始输出后不再切换上游
+                    try:
+                        completion, upstream = await router.call(
+                            request.model,
+                            lambda upstream, model: upstream.client.chat.completions.create(
+                                stream=True, **{**params, "model": model}),
+                            discard=lambda stream: stream.close(),
+                        )
+                    except Exception:
+                        # 响应头已发送，错误不会经过下面的异常处理，在这里退还额度
+                        reservation.refund()
+                        raise
+
+                    try:
+                        async with upstream.hold():
+                            async for chunk in completion:
+                                if getattr(chunk, "usage", None) is not None:
+                                    usage.report(chunk.usage.total_tokens)
+                                if not chunk.choices:
+                                    continue
+                                delta = {}
+                                for name in ("content", "reasoning_content"):
+                                    value = getattr(chunk.choices[0].delta, name, None)
+                                    if value:
+                                        delta[name] = value
+                                        usage.add_text(value)
+                                if delta:
+                                    # 构建流式响应格式
+                                    data = {
+                                        "id": chunk.id,
+                                        "object": "chat.completion.chunk",
+                                        "created": chunk.created,
+                                        "model": request.model,
+                                        "choices": [{
+                                            "index": 0,
+                                            "delta": delta,
+                                            "finish_reason": chunk.choices[0].finish_reason
+                                        }]
+                                    }
+                                    yield f"data: {json.dumps(data)}\n\n"
+                    finally:
+                        reservation.settle(usage.total_tokens)
 
                 # 发送结束标记
                 yield "data: [DONE]\n\n"
@@ -114,39 +323,101 @@ async def chat_completions(request: ChatCompletionRequest):
 
         # 处理非流式响应
         else:
-            completion = client.chat.completions.create(
-                model=request.model,
-                messages=[{"role": msg.role, "content": msg.content} for msg in request.messages],
-                temperature=request.temperature,
-                stream=False
-            )
-
-            return {
-                "id": completion.id,
-                "object": "chat.completion",
-                "created": completion.created,
-                "model": request.model,
-                "choices": [{
-                    "index": 0,
-                    "message": {
-                        "role": "assistant",
-                        "content": completion.choices[0].message.content
-                    },
-                    "finish_reason": completion.choices[0].finish_reason
-                }],
-                "usage": {
-                    "prompt_tokens": completion.usage.prompt_tokens,
-                    "completion_tokens": completion.usage.completion_tokens,
-                    "total_tokens": completion.usage.total_tokens
+            # 缓存命中或合并到其他请求时不会执行 call_upstream，本请求没有消耗上游token
+            upstream_called = False
+
+            async def call_upstream():
+                nonlocal upstream_called
+                upstream_called = True
+                async with admission.slot(priority):
+                    completion, _ = await router.call(
+                        request.model,
+                        lambda upstream, model: upstream.client.chat.completions.create(
+                            stream=False, **{**params, "model": model}),
+                    )
+
+                return {
+                    "id": completion.id,
+                    "object": "chat.completion",
+                    "created": completion.created,
+                    "model": request.model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {
+                            "role": "assistant",
+                            "content": completion.choices[0].message.content
+                        },
+                        "finish_reason": completion.choices[0].finish_reason
+                    }],
+                    "usage": {
+                        "prompt_tokens": completion.usage.prompt_tokens,
+                        "completion_tokens": completion.usage.completion_tokens,
+                        "total_tokens": completion.usage.total_tokens
+                    }
                 }
-            }
 
+            # 确定性请求先查缓存，并发的相同请求只调用一次上游；请求头 Cache-Control: no-cache 跳过缓存
+            use_cache = "no-cache" not in http_request.headers.get("cache-control", "")
+            result = await cached_caller.call(params, call_upstream, use_cache=use_cache)
+            # 用实际token数修正预扣的额度；结果来自缓存或共享调用时只计请求数，不计token
+            reservation.settle(result["usage"]["total_tokens"] if upstream_called else 0)
+            return result
+
+    except RateLimitExceeded as e:
+        reservation.refund()
+        raise too_many_requests(e)
+    except NoUpstreamAvailable as e:
+        reservation.refund()
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
+        reservation.refund()
+        response = upstream_error_response(e)
+        if response is not None:
+            return response
         raise HTTPException(status_code=500, detail=f"调用AI Studio API时出错: {str(e)}")
 
+# 嵌入端点：并发的请求在服务端合并为批量调用，客户端无需改动
+@app.post("/v1/embeddings")
+async def embeddings(request: EmbeddingRequest, http_request: Request):
+    texts = [request.input] if isinstance(request.input, str) else request.input
+    if not texts:
+        raise HTTPException(status_code=400, detail="input 不能为空")
+    if request.encoding_format not in (None, "float", "base64"):
+        raise HTTPException(status_code=400, detail=f"不支持的 encoding_format: {request.encoding_format}")
+    api_key, priority = request_identity(http_request)
+    tokens = sum(count_tokens(text) for text in texts)
+    try:
+        reservation = await rate_limiter.acquire(api_key, request.model, tokens, priority)
+    except RateLimitExceeded as e:
+        raise too_many_requests(e)
+    try:
+        vectors = await embedding_batcher.embed_many(request.model, texts)
+    except Exception as e:
+        reservation.refund()
+        response = upstream_error_response(e)
+        if response is not None:
+            return response
+        raise HTTPException(status_code=500, detail=f"调用嵌入服务时出错: {str(e)}")
+
+    if request.encoding_format == "base64":
+        # 与OpenAI一致：小端float32字节的base64
+        vectors = [base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode("ascii") for vector in vectors]
+    return {
+        "object": "list",
+        "data": [{"object": "embedding", "index": i, "embedding": vector} for i, vector in enumerate(vectors)],
+        "model": request.model,
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
 # 模型列表端点
 @app.get("/v1/models")
 def list_models():
+    if router is not None and router.models():
+        return {
+            "object": "list",
+            "data": [{"id": model, "object": "model", "created": 1698969600, "owned_by": "proxy"}
+                     for model in router.models()],
+        }
     return {
         "object": "list",
         "data": [
@@ -0,0 +1,209 @@
+# 长文本分窗口并行抽取：重叠窗口 + 并发调用 lx.extract + 偏移映射回原文 + 去重 + 按窗口断点续跑
+import dataclasses
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import langextract as lx
+from langextract import data_lib
+
+from extraction_cache import ExtractionCache, cached_extract, extract_config, stable_hash
+
+# 窗口边界优先落在段落、换行或句末标点之后
+BOUNDARY_PATTERN = re.compile(r"\n\s*\n|\n|[。！？；!?]|[.](?=\s)")
+
+
+def _find_boundary(text: str, lo: int, hi: int, prefer_last: bool) -> Optional[int]:
+    """返回 [lo, hi) 内最后（或第一个）边界之后的位置，没有边界时返回None"""
+    positions = [m.end() for m in BOUNDARY_PATTERN.finditer(text, lo, hi)]
+    if not positions:
+        return None
+    return positions[-1] if prefer_last else positions[0]
+
+
+def split_windows(text: str, window_chars: int = 4000, overlap_chars: int = 400) -> List[Tuple[int, str]]:
+    """
+    把文本切成相互重叠的窗口
+
+    窗口结尾尽量落在窗口最后20%范围内的句子边界上，下一个窗口从结尾往前 overlap_chars 处的句子边界开始，
+    保证跨窗口边界的实体完整地出现在至少一个窗口中
+
+    Returns:
+        [(窗口在原文中的起始偏移, 窗口文本)]
+    """
+    if overlap_chars >= window_chars:
+        raise ValueError("overlap_chars 必须小于 window_chars")
+    windows = []
+    start = 0
+    while start < len(text):
+        end = min(start + window_chars, len(text))
+        if end < len(text):
+            end = _find_boundary(text, end - window_chars // 5, end, prefer_last=True) or end
+        windows.append((start, text[start:end]))
+        if end >= len(text):
+            break
+        next_start = _find_boundary(text, end - overlap_chars, end, prefer_last=False) or end - overlap_chars
+        start = max(next_start, start + 1)
+    return windows
+
+
+def _extraction_to_dict(extraction) -> Dict:
+    return dataclasses.asdict(extraction, dict_factory=data_lib.enum_asdict_factory)
+
+
+def _dicts_to_extractions(items: List[Dict]) -> List[Any]:
+    return data_lib.dict_to_annotated_document({"extractions": items}).extractions
+
+
+class ChunkedExtractor:
+    """
+    对长文本分窗口并行执行 lx.extract
+
+    - 文本切成重叠窗口，最多 max_workers 个窗口同时请求模型（Ollama需以 OLLAMA_NUM_PARALLEL 配合）
+    - 每个窗口的抽取结果的 char_interval 加上窗口偏移，映射回原文
+    - 重叠区域中同一类别、位置重叠的抽取只保留较长的一个；未对齐的抽取按 (类别, 文本) 去重
+    - 设置 checkpoint_dir 时每个窗口完成后立即写入检查点，中断后重新运行只请求未完成的窗口
+
+    用法:
+        extractor = ChunkedExtractor(prompt, examples, max_workers=4, checkpoint_dir="extract_ckpt",
+                                     model_url="http://localhost:11434", model_id="gemma3:12b")
+        result = extractor.extract(input_text)
+    """
+
+    def __init__(self, prompt_description: str, examples: List[Any], max_workers: int = 4,
+                 window_chars: int = 4000, overlap_chars: int = 400,
+                 checkpoint_dir: Optional[str] = None, cache: ExtractionCache = None, **extract_kwargs):
+        """
+        Args:
+            prompt_description: 抽取提示词
+            examples: lx.data.ExampleData 示例列表
+            max_workers: 同时抽取的窗口数
+            window_chars: 窗口大小（字符）
+            overlap_chars: 相邻窗口的重叠大小（字符），应大于最长实体的长度
+            checkpoint_dir: 检查点目录，为None时不保存
+            cache: 可选的抽取缓存，按窗口缓存，跨运行复用相同窗口的结果
+            extract_kwargs: 传给 lx.extract 的其他参数，如 model / model_id / model_url / temperature
+        """
+        self.prompt_description = prompt_description
+        self.examples = examples
+        self.max_workers = max(1, max_workers)
+        self.window_chars = window_chars
+        self.overlap_chars = overlap_chars
+        self.checkpoint_dir = checkpoint_dir
+        self.cache = cache
+        self.extract_kwargs = {"show_progress": False, **extract_kwargs}
+        if checkpoint_dir:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+        self.config_hash = stable_hash(extract_config(prompt_description, examples, self.extract_kwargs))
+
+    def _checkpoint_path(self, window_text: str) -> Optional[str]:
+        if not self.checkpoint_dir:
+            return None
+        key = hashlib.sha256((self.config_hash + "\x1f" + window_text).encode("utf-8")).hexdigest()
+        return os.path.join(self.checkpoint_dir, f"{key}.json")
+
+    def _extract_window(self, window_text: str) -> List[Dict]:
+        """抽取一个窗口，返回窗口内偏移的抽取结果字典列表"""
+        path = self._checkpoint_path(window_text)
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+        result = cached_extract(
+            self.cache,
+            text_or_documents=window_text,
+            prompt_description=self.prompt_description,
+            examples=self.examples,
+            **self.extract_kwargs,
+        )
+        items = [_extraction_to_dict(extraction) for extraction in result.extractions or []]
+        if path:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(items, f, ensure_ascii=False)
+            os.replace(path + ".tmp", path)
+        return items
+
+    @staticmethod
+    def merge(window_results: List[Tuple[int, List[Dict]]]) -> List[Dict]:
+        """
+        合并各窗口的抽取结果：偏移映射回原文并去重，按原文位置排序
+
+        Args:
+            window_results: [(窗口起始偏移, 窗口内的抽取结果)]
+        """
+        aligned, unaligned = [], []
+        for window_index, (offset, items) in enumerate(window_results):
+            for item in items:
+                item = dict(item)
+                # token_interval基于窗口的分词结果，映射后不再有效
+                item["token_interval"] = None
+                interval = item.get("char_interval")
+                if interval and interval.get("start_pos") is not None and interval.get("end_pos") is not None:
+                    item["char_interval"] = {"start_pos": interval["start_pos"] + offset,
+                                             "end_pos": interval["end_pos"] + offset}
+                    aligned.append((window_index, item))
+                else:
+                    unaligned.append(item)
+
+        aligned.sort(key=lambda entry: (entry[1]["char_interval"]["start_pos"],
+                                        -entry[1]["char_interval"]["end_pos"]))
+        kept: List[Tuple[int, Dict]] = []
+        # 每个类别中仍可能与后续抽取重叠的已保留项
+        active: Dict[str, List[int]] = {}
+        for window_index, item in aligned:
+            start, end = item["char_interval"]["start_pos"], item["char_interval"]["end_pos"]
+            candidates = active.setdefault(item["extraction_class"], [])
+            candidates[:] = [i for i in candidates if kept[i][1]["char_interval"]["end_pos"] > start]
+            duplicate = None
+            for i in candidates:
+                other_window, other = kept[i]
+                same_span = (other["char_interval"]["start_pos"], other["char_interval"]["end_pos"]) == (start, end)
+                if same_span or other_window != window_index:
+                    duplicate = i
+                    break
+            if duplicate is None:
+                candidates.append(len(kept))
+                kept.append((window_index, item))
+            else:
+                other = kept[duplicate][1]
+                if end - start > other["char_interval"]["end_pos"] - other["char_interval"]["start_pos"]:
+                    kept[duplicate] = (window_index, item)
+
+        seen = set()
+        merged = [item for _, item in kept]
+        for item in unaligned:
+            key = (item["extraction_class"], item["extraction_text"])
+            if key not in seen:
+                seen.add(key)
+                merged.append(item)
+
+        for index, item in enumerate(merged):
+            item["extraction_index"] = index + 1
+            item["group_index"] = index
+        return merged
+
+    def extract(self, text: str, document_id: str = None):
+        """
+        对一篇长文本抽取
+
+        Returns:
+            lx.data.AnnotatedDocument，text为完整原文，char_interval为原文偏移
+        """
+        windows = split_windows(text, self.window_chars, self.overlap_chars)
+        print(f"文本长度 {len(text)}，切分为 {len(windows)} 个窗口，并发数 {self.max_workers}")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(self._extract_window, [window for _, window in windows]))
+        merged = self.merge([(offset, items) for (offset, _), items in zip(windows, results)])
+        return lx.data.AnnotatedDocument(
+            document_id=document_id,
+            text=text,
+            extractions=_dicts_to_extractions(merged),
+        )
+
+    def extract_many(self, documents: Iterable[Tuple[str, str]]) -> Iterator[Any]:
+        """依次对多篇文档抽取，每篇完成后立即产出，适合配合流式写入"""
+        for document_id, text in documents:
+            yield self.extract(text, document_id=document_id)
@@ -0,0 +1,627 @@
+# 列式文档存储：文本存放在一个字节块中按偏移访问，元数据按字段存为类型化numpy列
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1)
+
+# save()/load() 使用的文件名
+TEXT_BLOB_FILE = "documents.bin"
+TEXT_OFFSETS_FILE = "text_offsets.npy"
+COLUMNS_FILE = "columns.npz"
+
+# 字符串字段的不同取值超过该数量时不再做字典编码，改为与文本相同的字节块存储，
+# 避免 source、title 这类高基数字段的字典写入清单文件
+CATEGORY_MAX_CARDINALITY = 1024
+
+
+def datetime_to_micros(value: Any) -> Optional[int]:
+    """
+    ISO格式字符串或datetime转为自1970-01-01起的微秒数（不带时区的时间按原值处理，带时区的先转为UTC）
+
+    无法解析时返回None
+    """
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = value - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def micros_to_iso(micros: int) -> str:
+    return (EPOCH + timedelta(microseconds=int(micros))).isoformat()
+
+
+def _is_datetime(value: Any) -> bool:
+    """ISO格式时间字符串或datetime；无法从微秒还原的字符串（只有日期、带时区等）另存原文"""
+    if isinstance(value, datetime):
+        return True
+    return isinstance(value, str) and datetime_to_micros(value) is not None
+
+
+class GrowableArray:
+    """容量按倍数增长的一维numpy数组"""
+
+    def __init__(self, dtype, values: np.ndarray = None):
+        self.dtype = np.dtype(dtype)
+        if values is None:
+            self.data = np.empty(64, dtype=self.dtype)
+            self.size = 0
+        else:
+            self.data = np.array(values, dtype=self.dtype)
+            self.size = len(self.data)
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.dtype)
+        required = self.size + len(values)
+        if required > len(self.data):
+            data = np.empty(max(required, len(self.data) * 2), dtype=self.dtype)
+            data[:self.size] = self.data[:self.size]
+            self.data = data
+        self.data[self.size:required] = values
+        self.size = required
+
+    def compact(self, keep: np.ndarray):
+        """只保留keep（布尔数组）为True的位置"""
+        kept = self.data[:self.size][keep]
+        self.data[:len(kept)] = kept
+        self.size = len(kept)
+
+    @property
+    def values(self) -> np.ndarray:
+        return self.data[:self.size]
+
+    def __len__(self):
+        return self.size
+
+
+class NumericColumn:
+    """
+    整数/浮点列，valid标记该行是否有这个字段
+
+    浮点列中原本为整数的行记录在 integral 中，读取时还原为int（整数列收到浮点数后扩宽为浮点列）
+    """
+
+    def __init__(self, kind: str, num_rows: int = 0):
+        self.kind = kind
+        dtype = np.int64 if kind == "int" else np.float64
+        self.values = GrowableArray(dtype)
+        self.valid = GrowableArray(bool)
+        self.integral = GrowableArray(bool) if kind == "float" else None
+        self.pad(num_rows)
+
+    @staticmethod
+    def accepts(kind: str, value: Any) -> bool:
+        if isinstance(value, bool):
+            return False
+        if kind == "int":
+            return isinstance(value, int) and -2 ** 63 <= value < 2 ** 63
+        return isinstance(value, (int, float))
+
+    def pad(self, count: int):
+        self.values.extend(np.zeros(count))
+        self.valid.extend(np.zeros(count, dtype=bool))
+        if self.integral is not None:
+            self.integral.extend(np.zeros(count, dtype=bool))
+
+    def append(self, values: List[Any], present: List[bool]):
+        self.values.extend([value if ok else 0 for value, ok in zip(values, present)])
+        self.valid.extend(present)
+        if self.integral is not None:
+            self.integral.extend([ok and isinstance(value, int) for value, ok in zip(values, present)])
+
+    def set(self, row: int, value: Any, ok: bool):
+        self.values.data[row] = value if ok else 0
+        self.valid.data[row] = ok
+        if self.integral is not None:
+            self.integral.data[row] = ok and isinstance(value, int)
+
+    def get(self, row: int):
+        if not self.valid.data[row]:
+            return False, None
+        value = self.values.data[row]
+        if self.kind == "int" or self.integral.data[row]:
+            return True, int(value)
+        return True, float(value)
+
+    def compact(self, keep: np.ndarray):
+        self.values.compact(keep)
+        self.valid.compact(keep)
+        if self.integral is not None:
+            self.integral.compact(keep)
+
+
+class StringColumn:
+    """高基数字符串列：UTF-8拼接在一个字节块中按偏移访问，长度为-1表示没有该字段"""
+
+    kind = "string"
+
+    def __init__(self, num_rows: int = 0):
+        self.blob = bytearray()
+        self.starts = GrowableArray(np.int64)
+        self.lengths = GrowableArray(np.int64)
+        self.pad(num_rows)
+
+    @staticmethod
+    def accepts(kind: str, value: Any) -> bool:
+        return isinstance(value, str)
+
+    def pad(self, count: int):
+        self.starts.extend(np.zeros(count))
+        self.lengths.extend(np.full(count, -1))
+
+    def _encode(self, value: str):
+        encoded = value.encode("utf-8")
+        start = len(self.blob)
+        self.blob.extend(encoded)
+        return start, len(encoded)
+
+    def append(self, values: List[Any], present: List[bool]):
+        starts, lengths = [], []
+        for value, ok in zip(values, present):
+            start, length = self._encode(value) if ok else (0, -1)
+            starts.append(start)
+            lengths.append(length)
+        self.starts.extend(starts)
+        self.lengths.extend(lengths)
+
+    def set(self, row: int, value: Any, ok: bool):
+        """新值追加到字节块末尾，旧内容在compact/save时回收"""
+        self.starts.data[row], self.lengths.data[row] = self._encode(value) if ok else (0, -1)
+
+    def get(self, row: int):
+        length = self.lengths.data[row]
+        if length < 0:
+            return False, None
+        start = self.starts.data[row]
+        return True, bytes(self.blob[start:start + length]).decode("utf-8")
+
+    def compact(self, keep: np.ndarray = None):
+        """只保留keep为True的行（None表示全部保留），并回收字节块中不再使用的内容"""
+        if keep is not None:
+            self.starts.compact(keep)
+            self.lengths.compact(keep)
+        blob = bytearray()
+        starts = np.zeros(len(self.starts), dtype=np.int64)
+        for row, (start, length) in enumerate(zip(self.starts.values, self.lengths.values)):
+            if length > 0:
+                starts[row] = len(blob)
+                blob.extend(self.blob[start:start + length])
+        self.blob = blob
+        self.starts = GrowableArray(np.int64, starts)
+
+    def to_arrays(self, prefix: str) -> Dict[str, np.ndarray]:
+        self.compact()
+        return {f"{prefix}_blob": np.frombuffer(bytes(self.blob), dtype=np.uint8),
+                f"{prefix}_starts": self.starts.values, f"{prefix}_lengths": self.lengths.values}
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix: str) -> "StringColumn":
+        column = cls()
+        column.blob = bytearray(arrays[f"{prefix}_blob"].tobytes())
+        column.starts = GrowableArray(np.int64, arrays[f"{prefix}_starts"])
+        column.lengths = GrowableArray(np.int64, arrays[f"{prefix}_lengths"])
+        return column
+
+
+class DatetimeColumn(NumericColumn):
+    """
+    时间列：存储为int64微秒，读取时还原为ISO字符串
+
+    无法从微秒原样还原的字符串（如只有日期的 "2025-01-01"、带时区偏移或非6位小数）
+    另存原文，读取时返回原字符串，过滤时仍按时间比较
+    """
+
+    def __init__(self, num_rows: int = 0):
+        super().__init__("int", num_rows)
+        self.kind = "datetime"
+        self.originals = StringColumn(num_rows)
+
+    @staticmethod
+    def accepts(kind: str, value: Any) -> bool:
+        return _is_datetime(value)
+
+    @staticmethod
+    def _original(value: Any, micros: int):
+        if isinstance(value, str) and micros_to_iso(micros) != value:
+            return True, value
+        return False, None
+
+    def pad(self, count: int):
+        super().pad(count)
+        if hasattr(self, "originals"):
+            self.originals.pad(count)
+
+    def append(self, values: List[Any], present: List[bool]):
+        micros = [datetime_to_micros(v) if ok else 0 for v, ok in zip(values, present)]
+        super().append(micros, present)
+        originals = [self._original(v, m) if ok else (False, None) for v, m, ok in zip(values, micros, present)]
+        self.originals.append([v for _, v in originals], [ok for ok, _ in originals])
+
+    def set(self, row: int, value: Any, ok: bool):
+        micros = datetime_to_micros(value) if ok else 0
+        super().set(row, micros, ok)
+        has_original, original = self._original(value, micros) if ok else (False, None)
+        self.originals.set(row, original, has_original)
+
+    def get(self, row: int):
+        if not self.valid.data[row]:
+            return False, None
+        has_original, original = self.originals.get(row)
+        return True, original if has_original else micros_to_iso(self.values.data[row])
+
+    def compact(self, keep: np.ndarray):
+        super().compact(keep)
+        self.originals.compact(keep)
+
+
+class CategoryColumn:
+    """字典编码列：每行存int32编码，-1表示没有该字段"""
+
+    kind = "category"
+
+    def __init__(self, num_rows: int = 0, dictionary: List[Any] = None):
+        self.dictionary: List[Any] = list(dictionary or [])
+        self.lookup = {self._key(value): code for code, value in enumerate(self.dictionary)}
+        self.codes = GrowableArray(np.int32)
+        self.pad(num_rows)
+
+    @staticmethod
+    def _key(value: Any):
+        # True == 1 == 1.0 在字典中是同一个键，带上类型区分
+        return (type(value).__name__, value)
+
+    @staticmethod
+    def accepts(kind: str, value: Any) -> bool:
+        return value is None or isinstance(value, (str, int, float, bool))
+
+    def _encode(self, value: Any) -> int:
+        key = self._key(value)
+        code = self.lookup.get(key)
+        if code is None:
+            code = self.lookup[key] = len(self.dictionary)
+            self.dictionary.append(value)
+        return code
+
+    def pad(self, count: int):
+        self.codes.extend(np.full(count, -1))
+
+    def append(self, values: List[Any], present: List[bool]):
+        self.codes.extend([self._encode(v) if ok else -1 for v, ok in zip(values, present)])
+
+    def set(self, row: int, value: Any, ok: bool):
+        self.codes.data[row] = self._encode(value) if ok else -1
+
+    def get(self, row: int):
+        code = self.codes.data[row]
+        if code < 0:
+            return False, None
+        return True, self.dictionary[code]
+
+    def compact(self, keep: np.ndarray):
+        self.codes.compact(keep)
+
+    def should_spill(self) -> bool:
+        """字典过大且全部为字符串时应改为StringColumn"""
+        return (len(self.dictionary) > CATEGORY_MAX_CARDINALITY
+                and all(isinstance(value, str) for value in self.dictionary))
+
+
+class ObjectColumn:
+    """无法类型化的字段（列表、字典等）退化为Python列表"""
+
+    kind = "object"
+    MISSING = object()
+
+    def __init__(self, num_rows: int = 0):
+        self.values: List[Any] = [self.MISSING] * num_rows
+
+    @staticmethod
+    def accepts(kind: str, value: Any) -> bool:
+        return True
+
+    def pad(self, count: int):
+        self.values.extend([self.MISSING] * count)
+
+    def append(self, values: List[Any], present: List[bool]):
+        self.values.extend(v if ok else self.MISSING for v, ok in zip(values, present))
+
+    def set(self, row: int, value: Any, ok: bool):
+        self.values[row] = value if ok else self.MISSING
+
+    def get(self, row: int):
+        value = self.values[row]
+        return (False, None) if value is self.MISSING else (True, value)
+
+    def compact(self, keep: np.ndarray):
+        self.values = [v for v, k in zip(self.values, keep) if k]
+
+
+def _new_column(values: List[Any], num_rows: int):
+    """
+    根据一批取值推断列类型：整数 -> 浮点（整数与浮点混合）-> 时间 -> 字符串/字典编码（标量混合）-> 对象
+
+    只有出现列表、字典等非标量取值时才退化为ObjectColumn
+    """
+    if values and all(NumericColumn.accepts("int", v) for v in values):
+        return NumericColumn("int", num_rows)
+    if values and all(NumericColumn.accepts("float", v) for v in values):
+        return NumericColumn("float", num_rows)
+    if values and all(_is_datetime(v) for v in values):
+        return DatetimeColumn(num_rows)
+    if (values and all(isinstance(v, str) for v in values)
+            and len(set(values)) > CATEGORY_MAX_CARDINALITY):
+        return StringColumn(num_rows)
+    if all(CategoryColumn.accepts("category", v) for v in values):
+        return CategoryColumn(num_rows)
+    return ObjectColumn(num_rows)
+
+
+def _column_accepts(column, value: Any) -> bool:
+    return column.accepts(column.kind, value)
+
+
+class _RowView:
+    """按行号惰性读取的只读序列，支持下标、切片、迭代和赋值"""
+
+    def __init__(self, store: "DocumentStore", getter, setter):
+        self._store = store
+        self._getter = getter
+        self._setter = setter
+
+    def __len__(self):
+        return len(self._store)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self._getter(i) for i in range(*item.indices(len(self)))]
+        item = int(item)
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("行号超出范围")
+        return self._getter(item)
+
+    def __setitem__(self, item, value):
+        item = int(item)
+        if item < 0:
+            item += len(self)
+        self._setter(item, value)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._getter(i)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+
+class DocumentStore:
+    """
+    列式文档存储
+
+    - 文本以UTF-8拼接在一个字节块中，每行记录起始偏移和长度
+    - 元数据每个字段一列：整数/浮点为numpy数组，ISO时间转为int64微秒，字符串等离散值做字典编码
+    - texts / metadata 两个视图按需还原单行，检索时只为返回的结果构造dict
+    """
+
+    def __init__(self):
+        self._blob = bytearray()
+        self._starts = GrowableArray(np.int64)
+        self._lengths = GrowableArray(np.int64)
+        self.columns: Dict[str, Any] = {}
+        self.texts = _RowView(self, self.get_text, self.set_text)
+        self.metadata = _RowView(self, self.get_metadata, self.set_metadata)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def _ensure_writable_blob(self):
+        if not isinstance(self._blob, bytearray):
+            self._blob = bytearray(self._blob)
+
+    def append(self, texts: List[str], metadatas: List[Dict] = None):
+        """追加一批文档及其元数据"""
+        metadatas = metadatas if metadatas is not None else [{}] * len(texts)
+        if len(metadatas) != len(texts):
+            raise ValueError("texts 与 metadatas 的数量必须一致")
+        num_rows = len(self)
+
+        self._ensure_writable_blob()
+        starts, lengths = [], []
+        for text in texts:
+            encoded = text.encode("utf-8")
+            starts.append(len(self._blob))
+            lengths.append(len(encoded))
+            self._blob.extend(encoded)
+        self._starts.extend(starts)
+        self._lengths.extend(lengths)
+
+        fields = {}
+        for meta in metadatas:
+            for field in (meta or {}):
+                fields.setdefault(field, None)
+        for field in fields:
+            present = [bool(meta) and field in meta for meta in metadatas]
+            values = [meta[field] if ok else None for meta, ok in zip(metadatas, present)]
+            present_values = [v for v, ok in zip(values, present) if ok]
+            column = self.columns.get(field)
+            if column is None:
+                column = self.columns[field] = _new_column(present_values, num_rows)
+            elif not all(_column_accepts(column, v) for v in present_values):
+                column = self._promote(field, present_values, num_rows)
+            column.append(values, present)
+            if isinstance(column, CategoryColumn) and column.should_spill():
+                self._promote(field, [], len(self))
+        for field, column in self.columns.items():
+            if field not in fields:
+                column.pad(len(texts))
+
+    def _promote(self, field: str, new_values: List[Any], num_rows: int):
+        """
+        列类型无法容纳新取值时，按已有取值和新取值重新推断列类型并迁移前num_rows行
+
+        整数列收到浮点数扩宽为浮点列，时间/数值列收到其他标量转为字典编码列，保持可过滤
+        """
+        old = self.columns[field]
+        existing = [old.get(row) for row in range(num_rows)]
+        column = _new_column([value for ok, value in existing if ok] + list(new_values), 0)
+        column.append([value for _, value in existing], [ok for ok, _ in existing])
+        self.columns[field] = column
+        return column
+
+    def get_text(self, row: int) -> str:
+        start = self._starts.data[row]
+        return bytes(self._blob[start:start + self._lengths.data[row]]).decode("utf-8")
+
+    def set_text(self, row: int, text: str):
+        """新文本追加到字节块末尾并改写偏移，旧内容在delete/save时回收"""
+        self._ensure_writable_blob()
+        encoded = text.encode("utf-8")
+        self._starts.data[row] = len(self._blob)
+        self._lengths.data[row] = len(encoded)
+        self._blob.extend(encoded)
+
+    def get_metadata(self, row: int) -> Dict:
+        meta = {}
+        for field, column in self.columns.items():
+            ok, value = column.get(row)
+            if ok:
+                meta[field] = value
+        return meta
+
+    def set_metadata(self, row: int, meta: Dict):
+        meta = meta or {}
+        for field in meta:
+            if field not in self.columns:
+                self.columns[field] = _new_column([meta[field]], len(self))
+            elif not _column_accepts(self.columns[field], meta[field]):
+                self._promote(field, [meta[field]], len(self))
+        for field, column in self.columns.items():
+            column.set(row, meta.get(field), field in meta)
+
+    def delete(self, rows: Iterable[int]):
+        """删除指定行，并回收字节块中不再使用的文本"""
+        keep = np.ones(len(self), dtype=bool)
+        keep[list(rows)] = False
+        self._starts.compact(keep)
+        self._lengths.compact(keep)
+        for column in self.columns.values():
+            column.compact(keep)
+        self._compact_blob()
+
+    def _compact_blob(self):
+        blob = bytearray()
+        starts = np.empty(len(self), dtype=np.int64)
+        for row in range(len(self)):
+            start = self._starts.data[row]
+            starts[row] = len(blob)
+            blob.extend(self._blob[start:start + self._lengths.data[row]])
+        self._blob = blob
+        self._starts = GrowableArray(np.int64, starts)
+
+    def nbytes(self) -> int:
+        """文本和类型化列占用的字节数（不含ObjectColumn）"""
+        total = len(self._blob) + self._starts.data.nbytes + self._lengths.data.nbytes
+        for column in self.columns.values():
+            if isinstance(column, NumericColumn):
+                total += column.values.data.nbytes + column.valid.data.nbytes
+            elif isinstance(column, CategoryColumn):
+                total += column.codes.data.nbytes
+            elif isinstance(column, StringColumn):
+                total += len(column.blob) + column.starts.data.nbytes + column.lengths.data.nbytes
+        return total
+
+    def save(self, path: str) -> Dict:
+        """
+        写入文本字节块、偏移数组和列数组，返回需要写入清单文件的列结构描述
+
+        每个文件先写临时文件再 os.replace：其他进程已内存映射的旧文件不会被截断，中途失败也不会留下半个文件
+        """
+        self._compact_blob()
+        offsets = np.append(self._starts.values, len(self._blob)).astype(np.int64)
+
+        arrays, schema = {}, []
+        for i, (field, column) in enumerate(self.columns.items()):
+            entry = {"name": field, "kind": column.kind}
+            if isinstance(column, NumericColumn):
+                arrays[f"c{i}_values"] = column.values.values
+                arrays[f"c{i}_valid"] = column.valid.values
+                if column.integral is not None:
+                    arrays[f"c{i}_integral"] = column.integral.values
+                if isinstance(column, DatetimeColumn):
+                    arrays.update(column.originals.to_arrays(f"c{i}_orig"))
+            elif isinstance(column, StringColumn):
+                arrays.update(column.to_arrays(f"c{i}"))
+            elif isinstance(column, CategoryColumn):
+                arrays[f"c{i}_codes"] = column.codes.values
+                entry["dictionary"] = column.dictionary
+            else:
+                present = [v is not ObjectColumn.MISSING for v in column.values]
+                entry["present"] = present
+                entry["values"] = [v if ok else None for v, ok in zip(column.values, present)]
+            schema.append(entry)
+
+        def write(name: str, writer):
+            target = os.path.join(path, name)
+            with open(target + ".tmp", "wb") as f:
+                writer(f)
+            os.replace(target + ".tmp", target)
+
+        write(TEXT_BLOB_FILE, lambda f: f.write(self._blob))
+        write(TEXT_OFFSETS_FILE, lambda f: np.save(f, offsets))
+        write(COLUMNS_FILE, lambda f: np.savez(f, **arrays))
+        return {"num_rows": len(self), "columns": schema}
+
+    @classmethod
+    def load(cls, path: str, schema: Dict, mmap: bool = True) -> "DocumentStore":
+        """加载save()写出的文件；mmap为True时文本字节块以内存映射方式读取"""
+        store = cls()
+        blob_path = os.path.join(path, TEXT_BLOB_FILE)
+        if mmap and os.path.getsize(blob_path) > 0:
+            store._blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        else:
+            with open(blob_path, "rb") as f:
+                store._blob = bytearray(f.read())
+        offsets = np.load(os.path.join(path, TEXT_OFFSETS_FILE))
+        store._starts = GrowableArray(np.int64, offsets[:-1])
+        store._lengths = GrowableArray(np.int64, np.diff(offsets))
+
+        num_rows = schema["num_rows"]
+        with np.load(os.path.join(path, COLUMNS_FILE)) as arrays:
+            for i, entry in enumerate(schema["columns"]):
+                kind = entry["kind"]
+                if kind in ("int", "float", "datetime"):
+                    column = DatetimeColumn() if kind == "datetime" else NumericColumn(kind)
+                    column.values = GrowableArray(column.values.dtype, arrays[f"c{i}_values"])
+                    column.valid = GrowableArray(bool, arrays[f"c{i}_valid"])
+                    if kind == "float":
+                        # 旧版本保存的浮点列没有integral数组
+                        integral = (arrays[f"c{i}_integral"] if f"c{i}_integral" in arrays
+                                    else np.zeros(len(column.valid), dtype=bool))
+                        column.integral = GrowableArray(bool, integral)
+                    if kind == "datetime":
+                        column.originals = (StringColumn.from_arrays(arrays, f"c{i}_orig")
+                                            if f"c{i}_orig_blob" in arrays else StringColumn(len(column.valid)))
+                elif kind == "string":
+                    column = StringColumn.from_arrays(arrays, f"c{i}")
+                elif kind == "category":
+                    column = CategoryColumn(dictionary=entry["dictionary"])
+                    column.codes = GrowableArray(np.int32, arrays[f"c{i}_codes"])
+                else:
+                    column = ObjectColumn(0)
+                    column.values = [v if ok else ObjectColumn.MISSING
+                                     for v, ok in zip(entry["values"], entry["present"])]
+                store.columns[entry["name"]] = column
+        if len(store) != num_rows:
+            raise ValueError(f"文档数量不一致: {len(store)} != {num_rows}")
+        return store
+
@@ -0,0 +1,128 @@
+# 嵌入请求微批处理：把并发到达的单条文本在很短的时间窗口内合并为一次批量调用，再把结果分发回各请求
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+import httpx
+
+# 批量嵌入函数: (model, texts) -> 与texts一一对应的向量列表
+BatchEmbedFn = Callable[[str, List[str]], Awaitable[List[List[float]]]]
+
+
+def ollama_backend(http_client: httpx.AsyncClient, base_url: str = "http://localhost:11434") -> BatchEmbedFn:
+    """Ollama /api/embed，input 传列表时一次返回全部向量"""
+    async def embed(model: str, texts: List[str]) -> List[List[float]]:
+        response = await http_client.post(f"{base_url.rstrip('/')}/api/embed", json={"model": model, "input": texts})
+        response.raise_for_status()
+        return response.json()["embeddings"]
+    return embed
+
+
+def openai_backend(http_client: httpx.AsyncClient, base_url: str, api_key: str = "") -> BatchEmbedFn:
+    """OpenAI兼容的 /embeddings（SiliconFlow、DashScope compatible-mode、Ollama /v1 等）"""
+    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+
+    async def embed(model: str, texts: List[str]) -> List[List[float]]:
+        response = await http_client.post(f"{base_url.rstrip('/')}/embeddings", headers=headers,
+                                          json={"model": model, "input": texts})
+        response.raise_for_status()
+        data = sorted(response.json()["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in data]
+    return embed
+
+
+class EmbeddingBatcher:
+    """
+    嵌入请求的微批处理器
+
+    - 每个模型一个待处理队列，第一条文本到达后最多等待 max_delay 秒，或攒够 max_batch 条立即发送
+    - 一批中相同的文本只嵌入一次
+    - 最多 max_concurrent_batches 个批次同时请求后端，后端的异常传给该批次中的每个请求
+
+    用法:
+        batcher = EmbeddingBatcher(ollama_backend(httpx.AsyncClient()), max_batch=64, max_delay=0.005)
+        vector = await batcher.embed("bge-m3:567m", "你好")
+    """
+
+    def __init__(self, backend: BatchEmbedFn, max_batch: int = 64, max_delay: float = 0.005,
+                 max_concurrent_batches: int = 4):
+        """
+        Args:
+            backend: 批量嵌入函数
+            max_batch: 每批最多的文本数
+            max_delay: 第一条文本到达后最多等待的秒数
+            max_concurrent_batches: 同时请求后端的最大批次数
+        """
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._semaphore = asyncio.Semaphore(max_concurrent_batches)
+        self._pending: Dict[str, List[Tuple[str, asyncio.Future]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._tasks = set()
+
+        self.requests = 0
+        self.batches = 0
+        self.batched_texts = 0
+
+    async def embed(self, model: str, text: str) -> List[float]:
+        """提交一条文本，等待所在批次完成后返回其向量"""
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(model, [])
+        pending.append((text, future))
+        self.requests += 1
+        if len(pending) >= self.max_batch:
+            self._flush(model)
+        elif model not in self._timers:
+            self._timers[model] = asyncio.get_running_loop().call_later(self.max_delay, self._flush, model)
+        return await future
+
+    async def embed_many(self, model: str, texts: List[str]) -> List[List[float]]:
+        """一个请求中的多条文本分别进入批处理队列，可以和其他请求的文本合并"""
+        return list(await asyncio.gather(*(self.embed(model, text) for text in texts)))
+
+    def _flush(self, model: str):
+        timer = self._timers.pop(model, None)
+        if timer is not None:
+            timer.cancel()
+        items = self._pending.pop(model, [])
+        # 已取消的请求（客户端断开）不再嵌入
+        items = [(text, future) for text, future in items if not future.done()]
+        if not items:
+            return
+        task = asyncio.ensure_future(self._run(model, items))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, model: str, items: List[Tuple[str, asyncio.Future]]):
+        unique = list(dict.fromkeys(text for text, _ in items))
+        try:
+            async with self._semaphore:
+                vectors = await self.backend(model, unique)
+            if len(vectors) != len(unique):
+                raise ValueError(f"后端返回 {len(vectors)} 个向量，请求了 {len(unique)} 条文本")
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.batched_texts += len(unique)
+        by_text = dict(zip(unique, vectors))
+        for text, future in items:
+            if not future.done():
+                future.set_result(by_text[text])
+
+    async def close(self):
+        """发送仍在等待的批次并等待全部批次完成"""
+        for model in list(self._pending):
+            self._flush(model)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": self.batched_texts / self.batches if self.batches else 0.0,
+            "pending": sum(len(items) for items in self._pending.values()),
+        }
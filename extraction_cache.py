@@ -0,0 +1,195 @@
+# 抽取结果缓存：按 (prompt, 示例, 模型及参数, 输入文本) 的稳定哈希缓存 lx.extract 的结果，SQLite持久化
+import dataclasses
+import enum
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import langextract as lx
+from langextract import data_lib
+
+# 不参与缓存键的参数：密钥、进度条、并发数等不影响结果的参数
+IGNORED_KWARGS = {"api_key", "show_progress", "max_workers", "debug", "batch_length"}
+# 设置该环境变量为1时全局关闭缓存
+DISABLE_ENV = "LANGEXTRACT_CACHE_DISABLE"
+
+
+def stable_hash(value: Any) -> str:
+    """对prompt、示例、参数等计算稳定哈希，dataclass按字段展开"""
+    def default(obj):
+        if dataclasses.is_dataclass(obj):
+            return dataclasses.asdict(obj, dict_factory=data_lib.enum_asdict_factory)
+        if isinstance(obj, enum.Enum):
+            return obj.value
+        return repr(obj)
+    raw = json.dumps(value, ensure_ascii=False, sort_keys=True, default=default)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def model_fingerprint(model: Any) -> Dict:
+    """
+    模型对象的指纹：类名 + 公开的简单属性（model_id、base_url、temperature等），不含api_key
+
+    用于 factory.create_model 创建的模型，保证修改 temperature 等参数后不会命中旧结果
+    """
+    fingerprint = {"type": type(model).__name__}
+    for name, value in vars(model).items():
+        if name.startswith("_") or name in IGNORED_KWARGS:
+            continue
+        if isinstance(value, enum.Enum):
+            value = value.value
+        if value is None or isinstance(value, (str, int, float, bool)):
+            fingerprint[name] = value
+    extra = getattr(model, "_extra_kwargs", None)
+    if extra:
+        fingerprint["extra_kwargs"] = {k: v for k, v in extra.items() if k not in IGNORED_KWARGS}
+    return fingerprint
+
+
+def extract_config(prompt_description: str, examples: Any, extract_kwargs: Dict) -> Dict:
+    """lx.extract 中影响结果的全部配置，模型对象和ModelConfig转为可哈希的形式"""
+    config = {}
+    for key, value in extract_kwargs.items():
+        if key in IGNORED_KWARGS:
+            continue
+        if key == "model" and value is not None:
+            value = model_fingerprint(value)
+        elif key == "config" and value is not None:
+            value = {"model_id": value.model_id, "provider": value.provider,
+                     "provider_kwargs": {k: v for k, v in (value.provider_kwargs or {}).items()
+                                         if k not in IGNORED_KWARGS}}
+        config[key] = value
+    return {"prompt_description": prompt_description, "examples": examples, "kwargs": config}
+
+
+class ExtractionCache:
+    """
+    lx.extract 结果的持久化缓存
+
+    - 缓存键为 prompt、示例、model_id / 模型参数（如temperature）和输入文本的sha256
+    - ttl_seconds 设置后超过有效期的结果视为未命中并重新抽取
+    - enabled=False 或环境变量 LANGEXTRACT_CACHE_DISABLE=1 时完全不读写缓存
+    """
+
+    def __init__(self, db_path: str = "extraction_cache.sqlite", ttl_seconds: Optional[float] = None,
+                 enabled: bool = True):
+        """
+        Args:
+            db_path: SQLite数据库路径
+            ttl_seconds: 缓存有效期（秒），None表示永不过期
+            enabled: 是否启用缓存
+        """
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled and os.environ.get(DISABLE_ENV) != "1"
+        self._lock = threading.Lock()
+        self._conn = None
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+        if self.enabled:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS extractions ("
+                "key TEXT PRIMARY KEY, result TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(text: str, prompt_description: str, examples: Any, **extract_kwargs) -> str:
+        """生成缓存键，extract_kwargs 与传给 lx.extract 的参数相同"""
+        config_hash = stable_hash(extract_config(prompt_description, examples, extract_kwargs))
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{config_hash}\x1f{text_hash}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """返回缓存的 AnnotatedDocument 字典，未命中或已过期返回None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT result, created_at FROM extractions WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_seconds is not None and time.time() - row[1] > self.ttl_seconds:
+                self.expired += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, doc_dict: Dict):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extractions VALUES (?, ?, ?)",
+                (key, json.dumps(doc_dict, ensure_ascii=False), time.time()),
+            )
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        """删除已过期的条目，返回删除数量"""
+        if not self.enabled or self.ttl_seconds is None:
+            return 0
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM extractions WHERE created_at < ?",
+                                        (time.time() - self.ttl_seconds,))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM extractions")
+            self._conn.commit()
+
+    def close(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+
+
+def cached_extract(cache: Optional[ExtractionCache], text_or_documents: str, prompt_description: str,
+                   examples: Any, refresh: bool = False, **extract_kwargs):
+    """
+    带缓存的 lx.extract，参数与 lx.extract 相同
+
+    Args:
+        cache: 抽取缓存，为None时直接调用 lx.extract
+        refresh: 为True时跳过读取缓存，重新抽取并覆盖缓存
+
+    只缓存单个文本输入；传入文档列表时直接调用 lx.extract
+    """
+    if cache is None or not cache.enabled or not isinstance(text_or_documents, str):
+        return lx.extract(text_or_documents=text_or_documents, prompt_description=prompt_description,
+                          examples=examples, **extract_kwargs)
+
+    key = cache.make_key(text_or_documents, prompt_description, examples, **extract_kwargs)
+    if not refresh:
+        cached = cache.get(key)
+        if cached is not None:
+            return data_lib.dict_to_annotated_document(cached)
+
+    result = lx.extract(text_or_documents=text_or_documents, prompt_description=prompt_description,
+                        examples=examples, **extract_kwargs)
+    cache.put(key, data_lib.annotated_document_to_dict(result))
+    return result
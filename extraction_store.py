@@ -0,0 +1,249 @@
+# 抽取结果存储：只追加的JSONL流式写入 + 文档号到字节偏移的旁路索引 + 写入时累计的类别统计
+import json
+import os
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional
+
+from langextract import data_lib
+
+INDEX_SUFFIX = ".idx"
+SUMMARY_SUFFIX = ".summary.json"
+
+
+def _index_entry(document_id: str, offset: int, length: int, doc_dict: Dict) -> Dict:
+    classes = Counter(item.get("extraction_class") for item in doc_dict.get("extractions") or [])
+    return {
+        "id": document_id,
+        "offset": offset,
+        "length": length,
+        "extractions": sum(classes.values()),
+        "classes": dict(classes),
+    }
+
+
+def _scan_entries(f, start: int) -> Iterator[Dict]:
+    """从start开始逐行解析JSONL，生成索引项；末尾不完整的行（写入中断）被忽略"""
+    f.seek(start)
+    offset = start
+    for line in f:
+        if not line.endswith(b"\n"):
+            break
+        try:
+            doc_dict = json.loads(line)
+        except ValueError:
+            offset += len(line)
+            continue
+        yield _index_entry(doc_dict.get("document_id"), offset, len(line), doc_dict)
+        offset += len(line)
+
+
+class _Summary:
+    """写入时累计的全局统计；同一文档号重复写入时替换旧的计数，与 ExtractionReader 以最后一次为准一致"""
+
+    def __init__(self):
+        self.extractions = 0
+        self.class_counts: Counter = Counter()
+        self._counts: Dict[str, Dict] = {}
+
+    @property
+    def documents(self) -> int:
+        return len(self._counts)
+
+    def add(self, entry: Dict):
+        old = self._counts.pop(entry["id"], None)
+        if old is not None:
+            self.extractions -= old["extractions"]
+            self.class_counts -= Counter(old["classes"])
+        self._counts[entry["id"]] = {"extractions": entry["extractions"], "classes": entry["classes"]}
+        self.extractions += entry["extractions"]
+        self.class_counts.update(entry["classes"])
+
+    def to_dict(self) -> Dict:
+        return {
+            "documents": self.documents,
+            "extractions": self.extractions,
+            "class_counts": dict(self.class_counts.most_common()),
+        }
+
+
+class ExtractionWriter:
+    """
+    流式写入抽取结果
+
+    每写入一个 AnnotatedDocument 立即追加到JSONL并flush，同时向旁路索引(.idx)追加一行
+    {"id", "offset", "length", "extractions", "classes"}，类别统计写入 .summary.json。
+    打开已有文件时继续追加；若上次在写入数据后、写入索引前中断，会从索引末尾重新扫描补齐。
+    JSONL格式与 lx.io.save_annotated_documents 相同，仍可用 lx.io 读取。
+
+    用法:
+        with ExtractionWriter("extraction_results.jsonl") as writer:
+            for result in extractor.extract_many(documents):
+                writer.write(result)
+    """
+
+    def __init__(self, path: str, summary_every: int = 100):
+        """
+        Args:
+            path: JSONL文件路径
+            summary_every: 每写入多少篇文档刷新一次 .summary.json，关闭时总会刷新
+        """
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.summary_path = path + SUMMARY_SUFFIX
+        self.summary_every = max(1, summary_every)
+        self.summary = _Summary()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        indexed_end = 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break
+                    entry = json.loads(line)
+                    self.summary.add(entry)
+                    indexed_end = entry["offset"] + entry["length"]
+
+        self._file = open(path, "a+b")
+        self._index = open(self.index_path, "a", encoding="utf-8")
+        self._file.seek(0, os.SEEK_END)
+        data_end = self._file.tell()
+        if data_end > indexed_end:
+            recovered = list(_scan_entries(self._file, indexed_end))
+            for entry in recovered:
+                self._append_index(entry)
+            if recovered:
+                print(f"索引补齐 {len(recovered)} 篇文档: {self.index_path}")
+            # 截掉中断时写了一半的行
+            valid_end = recovered[-1]["offset"] + recovered[-1]["length"] if recovered else indexed_end
+            if valid_end < data_end:
+                self._file.truncate(valid_end)
+        self._file.seek(0, os.SEEK_END)
+        self._since_summary = 0
+
+    def _append_index(self, entry: Dict):
+        self._index.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.summary.add(entry)
+
+    def write(self, annotated_document) -> Dict:
+        """追加一篇文档，返回其索引项"""
+        doc_dict = data_lib.annotated_document_to_dict(annotated_document)
+        line = (json.dumps(doc_dict, ensure_ascii=False) + "\n").encode("utf-8")
+        offset = self._file.tell()
+        self._file.write(line)
+        self._file.flush()
+        entry = _index_entry(doc_dict["document_id"], offset, len(line), doc_dict)
+        self._append_index(entry)
+        self._index.flush()
+
+        self._since_summary += 1
+        if self._since_summary >= self.summary_every:
+            self.write_summary()
+        return entry
+
+    def write_summary(self):
+        with open(self.summary_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.summary.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(self.summary_path + ".tmp", self.summary_path)
+        self._since_summary = 0
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.write_summary()
+        self._file.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ExtractionReader:
+    """
+    按文档号随机读取抽取结果
+
+    只加载旁路索引（每篇文档一行），读取某篇文档时seek到对应偏移解析一行，不解析整个JSONL。
+    索引不存在时扫描一次JSONL生成。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.summary_path = path + SUMMARY_SUFFIX
+        if not os.path.exists(self.index_path):
+            # 通过writer扫描生成索引和统计
+            ExtractionWriter(path).close()
+
+        self.entries: List[Dict] = []
+        self._positions: Dict[str, int] = {}
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                entry = json.loads(line)
+                # 同一文档号重复写入时以最后一次为准
+                if entry["id"] in self._positions:
+                    self.entries[self._positions[entry["id"]]] = entry
+                else:
+                    self._positions[entry["id"]] = len(self.entries)
+                    self.entries.append(entry)
+        self._file = open(path, "rb")
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, document_id: str) -> bool:
+        return document_id in self._positions
+
+    def document_ids(self) -> List[str]:
+        return [entry["id"] for entry in self.entries]
+
+    def entry(self, document_id: str) -> Dict:
+        position = self._positions.get(document_id)
+        if position is None:
+            raise KeyError(f"文档不存在: {document_id}")
+        return self.entries[position]
+
+    def get_dict(self, document_id: str) -> Dict:
+        """读取一篇文档的原始字典"""
+        entry = self.entry(document_id)
+        self._file.seek(entry["offset"])
+        return json.loads(self._file.read(entry["length"]))
+
+    def get(self, document_id: str):
+        """读取一篇文档，返回 lx.data.AnnotatedDocument"""
+        return data_lib.dict_to_annotated_document(self.get_dict(document_id))
+
+    def iter_documents(self) -> Iterator[Any]:
+        """按写入顺序逐篇读取"""
+        for entry in self.entries:
+            yield self.get(entry["id"])
+
+    def summary(self) -> Dict:
+        """全局统计：文档数、抽取数、各类别数量"""
+        if os.path.exists(self.summary_path):
+            with open(self.summary_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        summary = _Summary()
+        for entry in self.entries:
+            summary.add(entry)
+        return summary.to_dict()
+
+    def visualize(self, document_id: str, **kwargs) -> str:
+        """只读取一篇文档生成 lx.visualize 的HTML"""
+        import langextract as lx
+
+        html = lx.visualize(self.get(document_id), **kwargs)
+        return html.data if hasattr(html, "data") else html
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
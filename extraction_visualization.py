@@ -0,0 +1,150 @@
+# 抽取结果分页可视化：每篇文档单独一页 + 分页的文档列表 + 按索引项统计的类别汇总
+import hashlib
+import html
+import json
+import os
+import re
+from collections import Counter
+from typing import Dict, List
+
+from extraction_store import ExtractionReader
+
+MANIFEST_FILE = "manifest.json"
+
+PAGE_CSS = """
+<style>
+body { font-family: -apple-system, "PingFang SC", "Microsoft YaHei", sans-serif; margin: 24px; color: #222; }
+table { border-collapse: collapse; margin: 12px 0; }
+th, td { border: 1px solid #ddd; padding: 4px 10px; text-align: left; }
+th { background: #f5f5f5; }
+.pager a, .pager span { margin-right: 8px; }
+.muted { color: #888; }
+</style>
+"""
+
+
+def _page(title: str, body: str) -> str:
+    return (f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{html.escape(title)}</title>"
+            f"{PAGE_CSS}</head><body>{body}</body></html>")
+
+
+def document_filename(document_id: str) -> str:
+    """文档号转为安全的文件名，附加短哈希避免不同文档号替换字符后冲突"""
+    safe = re.sub(r"[^0-9A-Za-z_\-]", "_", str(document_id))[:80]
+    digest = hashlib.sha1(str(document_id).encode("utf-8")).hexdigest()[:8]
+    return f"{safe}_{digest}.html"
+
+
+def _index_filename(page: int) -> str:
+    return "index.html" if page == 1 else f"index_{page}.html"
+
+
+def _pager(page: int, pages: int, window: int = 5) -> str:
+    """页码导航：首页、末页和当前页前后各window页，页数很多时页面大小不变"""
+    numbers = sorted({1, pages} | set(range(max(1, page - window), min(pages, page + window) + 1)))
+    links = []
+    previous = 0
+    for number in numbers:
+        if number - previous > 1:
+            links.append("<span>…</span>")
+        previous = number
+        if number == page:
+            links.append(f"<span><b>{number}</b></span>")
+        else:
+            links.append(f"<a href='{_index_filename(number)}'>{number}</a>")
+    return f"<div class='pager'>{''.join(links)}</div>" if pages > 1 else ""
+
+
+def _render_index_page(entries: List[Dict], summary: Dict, page: int, pages: int, page_size: int) -> str:
+    body = ["<h1>抽取结果汇总</h1>",
+            f"<p>文档数: {summary['documents']}，抽取数: {summary['extractions']}</p>"]
+    if page == 1:
+        rows = "".join(f"<tr><td>{html.escape(str(name))}</td><td>{count}</td></tr>"
+                       for name, count in summary["class_counts"].items())
+        body.append(f"<h2>类别统计</h2><table><tr><th>类别</th><th>数量</th></tr>{rows}</table>")
+
+    body.append(f"<h2>文档列表（第 {page}/{pages} 页）</h2>")
+    body.append(_pager(page, pages))
+    rows = []
+    start = (page - 1) * page_size
+    for number, entry in enumerate(entries[start:start + page_size], start + 1):
+        classes = ", ".join(f"{html.escape(str(name))}: {count}" for name, count in entry["classes"].items())
+        rows.append(
+            f"<tr><td>{number}</td>"
+            f"<td><a href='docs/{document_filename(entry['id'])}'>{html.escape(str(entry['id']))}</a></td>"
+            f"<td>{entry['extractions']}</td><td class='muted'>{classes}</td></tr>"
+        )
+    body.append("<table><tr><th>#</th><th>文档</th><th>抽取数</th><th>类别</th></tr>"
+                + "".join(rows) + "</table>")
+    body.append(_pager(page, pages))
+    return _page("抽取结果汇总", "".join(body))
+
+
+def _summarize(entries: List[Dict]) -> Dict:
+    """按去重后的索引项统计，与列表页展示的文档一致"""
+    class_counts = Counter()
+    for entry in entries:
+        class_counts.update(entry["classes"])
+    return {
+        "documents": len(entries),
+        "extractions": sum(entry["extractions"] for entry in entries),
+        "class_counts": dict(class_counts.most_common()),
+    }
+
+
+def render_site(jsonl_path: str, output_dir: str, page_size: int = 50, force: bool = False) -> Dict:
+    """
+    把抽取结果渲染为多页静态站点
+
+    - docs/ 下每篇文档一个页面（lx.visualize 的输出），只读取该文档所在的一行
+    - index.html / index_N.html 为分页的文档列表，首页包含类别统计（同一文档号重复写入时只计最后一次）
+    - 增量生成：manifest.json 记录每篇文档渲染时的偏移，未变化的文档页面不重新生成
+
+    浏览器每次只加载一页，页面大小与抽取结果总量无关
+
+    Args:
+        jsonl_path: ExtractionWriter 写入的JSONL文件
+        output_dir: 输出目录
+        page_size: 每个列表页的文档数
+        force: 是否忽略manifest重新生成全部页面
+
+    Returns:
+        {"documents", "rendered", "skipped", "index_pages"}
+    """
+    docs_dir = os.path.join(output_dir, "docs")
+    os.makedirs(docs_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    manifest = {}
+    if os.path.exists(manifest_path) and not force:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    rendered, skipped = 0, 0
+    with ExtractionReader(jsonl_path) as reader:
+        for entry in reader.entries:
+            version = f"{entry['offset']}:{entry['length']}"
+            filename = document_filename(entry["id"])
+            if manifest.get(entry["id"]) == version and os.path.exists(os.path.join(docs_dir, filename)):
+                skipped += 1
+                continue
+            document_html = reader.visualize(entry["id"])
+            back = "<p><a href='../index.html'>返回汇总</a></p>"
+            with open(os.path.join(docs_dir, filename), "w", encoding="utf-8") as f:
+                f.write(_page(str(entry["id"]), back + f"<h2>{html.escape(str(entry['id']))}</h2>" + document_html))
+            manifest[entry["id"]] = version
+            rendered += 1
+
+        entries = reader.entries
+        summary = _summarize(entries)
+        pages = max(1, (len(entries) + page_size - 1) // page_size)
+        for page in range(1, pages + 1):
+            with open(os.path.join(output_dir, _index_filename(page)), "w", encoding="utf-8") as f:
+                f.write(_render_index_page(entries, summary, page, pages, page_size))
+
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    stats = {"documents": len(entries), "rendered": rendered, "skipped": skipped, "index_pages": pages}
+    print(f"可视化已生成到 {output_dir}: {stats}")
+    return stats
@@ -0,0 +1,318 @@
+# 流式文档导入：加载 -> 分块 -> 批量嵌入 -> 追加到索引，各阶段之间用有界队列连接
+import os
+import queue
+import re
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+from sparse_index import TOKEN_PATTERN
+
+# 句子边界：中文句末标点/换行之后（连续标点和右引号不拆开），或英文句号后跟空白
+SENTENCE_BOUNDARY = re.compile(
+    r"(?<=[。！？；!?\n])(?![。！？；!?”’」』）)])|(?<=[。！？!?][”’」』）)])|(?<=\.)(?=\s)")
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+# 各阶段之间的队列中最多积压的批次数
+DEFAULT_QUEUE_SIZE = 4
+
+
+def char_length(text: str) -> int:
+    return len(text)
+
+
+def token_length(text: str) -> int:
+    """近似token数：英文按词、中文按字计数"""
+    return len(TOKEN_PATTERN.findall(text.lower()))
+
+
+def split_sentences(text: str) -> List[str]:
+    """按中英文句末标点切分句子，保留标点，丢弃空白句"""
+    return [sentence for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+
+class TextChunker:
+    """
+    按句子切分并合并为不超过 chunk_size 的文本块，相邻块之间保留 chunk_overlap 的重叠
+
+    单个句子超过 chunk_size 时按长度硬切分
+    """
+
+    def __init__(self, chunk_size: int = 512, chunk_overlap: int = 64, unit: str = "char"):
+        """
+        Args:
+            chunk_size: 每块的最大长度
+            chunk_overlap: 相邻块重叠的最大长度，按整句保留
+            unit: 长度单位，"char"（字符数）或 "token"（近似token数）
+        """
+        if unit not in ("char", "token"):
+            raise ValueError(f"不支持的长度单位: {unit}")
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap 必须小于 chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.unit = unit
+        self.length: Callable[[str], int] = char_length if unit == "char" else token_length
+
+    def _hard_split(self, sentence: str) -> List[str]:
+        """把超长句子切成不超过 chunk_size 的片段"""
+        if self.unit == "char":
+            return [sentence[i:i + self.chunk_size] for i in range(0, len(sentence), self.chunk_size)]
+        pieces, start, count = [], 0, 0
+        for match in TOKEN_PATTERN.finditer(sentence.lower()):
+            if count == self.chunk_size:
+                pieces.append(sentence[start:match.start()])
+                start, count = match.start(), 0
+            count += 1
+        pieces.append(sentence[start:])
+        return pieces
+
+    def chunk_stream(self, segments: Iterable[str]) -> Iterator[str]:
+        """
+        对一个文档的文本片段流分块，片段通常是段落；只在内存中保留当前块
+
+        Args:
+            segments: 依次读取的文本片段
+
+        Yields:
+            文本块
+        """
+        current: List[Tuple[str, int]] = []
+        current_len = 0
+        for segment in segments:
+            for sentence in split_sentences(segment):
+                length = self.length(sentence)
+                parts = [(sentence, length)] if length <= self.chunk_size else \
+                    [(part, self.length(part)) for part in self._hard_split(sentence)]
+                for part, part_len in parts:
+                    if current and current_len + part_len > self.chunk_size:
+                        yield "".join(text for text, _ in current).strip()
+                        # 从末尾保留不超过 chunk_overlap 的整句作为下一块的开头
+                        overlap, overlap_len = [], 0
+                        for text, text_len in reversed(current):
+                            if overlap_len + text_len > self.chunk_overlap or \
+                                    overlap_len + text_len + part_len > self.chunk_size:
+                                break
+                            overlap.insert(0, (text, text_len))
+                            overlap_len += text_len
+                        current, current_len = overlap, overlap_len
+                    current.append((part, part_len))
+                    current_len += part_len
+        if current:
+            chunk = "".join(text for text, _ in current).strip()
+            if chunk:
+                yield chunk
+
+    def chunk(self, text: str) -> List[str]:
+        """对整段文本分块"""
+        return list(self.chunk_stream(PARAGRAPH_BREAK.split(text)))
+
+
+def iter_text_file(path: str, block_size: int = 1 << 16) -> Iterator[str]:
+    """
+    按段落流式读取文本文件，不把整个文件读入内存
+
+    没有空行的超长内容在缓冲区超过 4*block_size 时直接输出
+    """
+    buffer = ""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            buffer += block
+            paragraphs = PARAGRAPH_BREAK.split(buffer)
+            buffer = paragraphs.pop()
+            for paragraph in paragraphs:
+                yield paragraph + "\n"
+            if len(buffer) > 4 * block_size:
+                yield buffer
+                buffer = ""
+    if buffer:
+        yield buffer
+
+
+def expand_source(source: Any) -> Iterator[Any]:
+    """表格文件展开为按行生成的多个文档，其他数据源原样返回"""
+    if isinstance(source, (str, os.PathLike)):
+        from spreadsheet_reader import SPREADSHEET_EXTENSIONS, iter_row_documents
+        path = os.fspath(source)
+        if os.path.splitext(path)[1].lower() in SPREADSHEET_EXTENSIONS:
+            yield from iter_row_documents(path)
+            return
+    yield source
+
+
+def load_source(source: Any) -> Tuple[Iterable[str], Dict]:
+    """
+    将一个数据源转换为 (文本片段流, 元数据)
+
+    支持的数据源：
+        - 文件路径（str / os.PathLike），按段落流式读取；表格文件经 expand_source 按行展开
+        - 带 page_content 和 metadata 属性的对象（如 langchain 的 Document）
+        - {"text": ..., "metadata": {...}} 字典
+        - (text, metadata) 元组
+    """
+    if isinstance(source, (str, os.PathLike)):
+        path = os.fspath(source)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"数据源文件不存在: {path}")
+        return iter_text_file(path), {"source": path}
+    if hasattr(source, "page_content"):
+        text, metadata = source.page_content, dict(getattr(source, "metadata", None) or {})
+    elif isinstance(source, dict):
+        text, metadata = source["text"], dict(source.get("metadata") or {})
+    elif isinstance(source, tuple) and len(source) == 2:
+        text, metadata = source[0], dict(source[1] or {})
+    else:
+        raise TypeError(f"不支持的数据源类型: {type(source).__name__}")
+    return PARAGRAPH_BREAK.split(text), metadata
+
+
+class PipelineStage(threading.Thread):
+    """流水线中的一个后台阶段，异常通过输出队列传给下游"""
+
+    def __init__(self, name: str, target: Callable[[], None], output: queue.Queue, stop: threading.Event):
+        super().__init__(name=name, daemon=True)
+        self._target_fn = target
+        self.output = output
+        self.stop = stop
+
+    def run(self):
+        try:
+            self._target_fn()
+        except BaseException as e:
+            queue_put(self.output, _Failure(e), self.stop)
+        else:
+            queue_put(self.output, _END, self.stop)
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_END = object()
+
+
+def queue_put(q: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    """阻塞写入队列（背压），下游已停止时放弃并返回False"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def queue_drain(q: queue.Queue, stop: threading.Event) -> Iterator[Any]:
+    """读取上游阶段的输出直到结束，上游异常在此重新抛出"""
+    while not stop.is_set():
+        try:
+            item = q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _END:
+            return
+        if isinstance(item, _Failure):
+            raise item.error
+        yield item
+
+
+def ingest(system, sources: Iterable[Any], chunker: TextChunker = None,
+           batch_size: int = 64, queue_size: int = DEFAULT_QUEUE_SIZE,
+           replace_existing: bool = False,
+           on_added: Callable[[List[Dict]], None] = None) -> Iterator[Dict]:
+    """
+    流式导入数据源到检索系统
+
+    三个阶段并行运行：加载+分块 -> 嵌入 -> 追加到索引。阶段之间的队列最多积压
+    queue_size 个批次，下游变慢时上游阻塞，内存占用与语料总大小无关。
+    追加在调用方线程中进行，检索系统本身不需要加锁。
+
+    Args:
+        system: AdvancedRetrievalSystem 实例
+        sources: 数据源的可迭代对象，可以是生成器，见 load_source
+        chunker: 文本分块器，默认 TextChunker()
+        batch_size: 每次嵌入请求的文本块数量
+        queue_size: 阶段之间每个队列的最大批次数
+        replace_existing: 为True时，导入正常结束后一次性删除本次出现过的source在导入前已有的旧文本块，
+                          用于重新导入已变化的文件或网页；出错或提前关闭时不删除
+        on_added: 每批文本块追加到检索系统后以该批的元数据调用，可用于记录已完成的数据源
+
+    Yields:
+        每追加一批后的进度 {"batch_chunks", "total_chunks", "total_sources"}
+    """
+    chunker = chunker or TextChunker()
+    stop = threading.Event()
+    chunk_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    embedded_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    progress = {"sources": 0}
+
+    def load_and_chunk():
+        texts, metadatas = [], []
+        for source in sources:
+            if stop.is_set():
+                return
+            for item in expand_source(source):
+                segments, source_metadata = load_source(item)
+                added_at = datetime.now().isoformat()
+                for chunk_index, text in enumerate(chunker.chunk_stream(segments)):
+                    texts.append(text)
+                    metadatas.append({**source_metadata, "chunk_index": chunk_index, "added_at": added_at})
+                    if len(texts) == batch_size:
+                        if not queue_put(chunk_queue, (texts, metadatas), stop):
+                            return
+                        texts, metadatas = [], []
+            progress["sources"] += 1
+        if texts:
+            queue_put(chunk_queue, (texts, metadatas), stop)
+
+    def embed():
+        for texts, metadatas in queue_drain(chunk_queue, stop):
+            embeddings = system.model.encode(texts)["dense_vecs"]
+            if not queue_put(embedded_queue, (texts, embeddings, metadatas), stop):
+                return
+
+    stages = [
+        PipelineStage("ingest-load", load_and_chunk, chunk_queue, stop),
+        PipelineStage("ingest-embed", embed, embedded_queue, stop),
+    ]
+    for stage in stages:
+        stage.start()
+
+    total_chunks = 0
+    seen_sources = set()
+    # 导入前已有的文档数：新文本块都追加在其后，旧文本块只可能出现在这之前
+    num_existing = len(system.documents)
+    try:
+        for texts, embeddings, metadatas in queue_drain(embedded_queue, stop):
+            if replace_existing:
+                seen_sources.update(m["source"] for m in metadatas if "source" in m)
+            system.add_embedded_documents(texts, embeddings, metadatas)
+            if on_added is not None:
+                on_added(metadatas)
+            total_chunks += len(texts)
+            yield {
+                "batch_chunks": len(texts),
+                "total_chunks": total_chunks,
+                "total_sources": progress["sources"],
+            }
+    finally:
+        # 正常结束、异常或调用方提前关闭生成器时，通知上游阶段退出
+        stop.set()
+        for stage in stages:
+            stage.join(timeout=1)
+
+    # 只有流水线正常结束（每个source的新文本块都已追加）后才删除旧文本块；异常或提前关闭时
+    # 保留旧文本块，避免只导入了一部分的source丢失数据（重复的部分在下次重新导入时替换）
+    if replace_existing and seen_sources and num_existing:
+        # 一次性删除：只求值一次过滤条件、只搬移一次向量和文本，
+        # 避免每批删除都重建元数据索引并压缩整个文本区
+        mask = system.filter_mask({"source": {"$in": sorted(seen_sources)}})
+        stale = np.flatnonzero(mask[:num_existing])
+        if len(stale):
+            system.remove_documents(stale)
@@ -1,7 +1,14 @@
 # 交互式文档检索系统
-from advanced_retrieval_system import AdvancedRetrievalSystem, create_comprehensive_knowledge_base
+from advanced_retrieval_system import AdvancedRetrievalSystem, create_comprehensive_knowledge_base, METADATA_FILE
+from embedding_cache import EmbeddingCache
+import os
 import sys
 
+# 持久化索引目录，存在时直接加载，避免每次启动重新生成嵌入向量
+INDEX_DIR = "retrieval_index"
+# 嵌入向量缓存，重复的查询直接命中，不再请求ollama
+CACHE_DB = "embedding_cache.sqlite"
+
 def display_welcome():
     """显示欢迎信息"""
     print("🎯" + "="*70 + "🎯")
@@ -69,6 +76,10 @@ def display_stats(retrieval_system):
     print(f"🧮 嵌入维度:     {stats['embedding_dim']}")
     print(f"📝 平均文档长度: {stats['avg_doc_length']:.1f} 词")
     print(f"🤖 使用模型:     {stats['model']}")
+    if "cache" in stats:
+        cache_stats = stats["cache"]
+        print(f"💾 缓存命中:     {cache_stats['hits']} / {cache_stats['hits'] + cache_stats['misses']} "
+              f"({cache_stats['hit_rate']*100:.1f}%)")
     print("="*50)
 
 def format_results(results, query):
@@ -104,11 +115,16 @@ def main():
     
     # 初始化检索系统
     print("🔄 正在初始化检索系统...")
-    retrieval_system = AdvancedRetrievalSystem()
-    
-    # 加载知识库
-    docs, metadata = create_comprehensive_knowledge_base()
-    retrieval_system.add_documents(docs, metadata)
+    cache = EmbeddingCache(max_entries=10000, db_path=CACHE_DB)
+    if os.path.exists(os.path.join(INDEX_DIR, METADATA_FILE)):
+        retrieval_system = AdvancedRetrievalSystem.load(INDEX_DIR, mmap=True, cache=cache)
+    else:
+        retrieval_system = AdvancedRetrievalSystem(cache=cache)
+        
+        # 加载知识库并保存索引
+        docs, metadata = create_comprehensive_knowledge_base()
+        retrieval_system.add_documents(docs, metadata)
+        retrieval_system.save(INDEX_DIR)
     
     print("✅ 系统初始化完成！")
     print("\n" + "="*70)
@@ -3,6 +3,7 @@ from langchain_community.document_loaders import WebBaseLoader
 
 
 import asyncio
+import os
 
 page_url = "https://docs.naiveadmin.com/guide/"
 
@@ -36,6 +37,28 @@ async def test2():
     doc = docs[0]
     print(f"{doc.metadata}\n")
     print(doc.page_content[:5000].strip())
+
+
+def ingest_site(urls, index_dir="web_index"):
+    """批量抓取文档站点并导入检索系统；索引保存在index_dir，再次运行时加载索引并跳过未变化的页面"""
+    from advanced_retrieval_system import AdvancedRetrievalSystem
+    from web_ingestion import WebCrawler, ingest_urls
+
+    if os.path.exists(os.path.join(index_dir, "metadata.json")):
+        system = AdvancedRetrievalSystem.load(index_dir)
+    else:
+        system = AdvancedRetrievalSystem()
+    crawler = WebCrawler(
+        per_host_concurrency=4,
+        parse_only={"class_": "language-bash"},
+        get_text_kwargs={"separator": " | ", "strip": True},
+    )
+    try:
+        print(ingest_urls(system, urls, crawler=crawler, index_dir=index_dir))
+    finally:
+        crawler.close()
+    return system
+
     
 if __name__ == "__main__":
     asyncio.run(test2())
\ No newline at end of file
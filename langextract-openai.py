@@ -37,6 +37,7 @@ examples = [
 input_text = "朱丽叶夫人渴望地凝视着星星，她的心为罗密欧而痛心。"
 
 from langextract import factory
+from extraction_cache import ExtractionCache, cached_extract
 
 config = factory.ModelConfig(
     provider="OpenAILanguageModel",
@@ -51,12 +52,16 @@ config = factory.ModelConfig(
 model = factory.create_model(config)
 
 # Run the extraction
-result = lx.extract(
+# 相同的prompt、示例、模型参数和输入直接命中缓存，不再调用LLM；ttl_seconds控制有效期
+cache = ExtractionCache("extraction_cache.sqlite", ttl_seconds=7 * 24 * 3600)
+result = cached_extract(
+    cache,
     text_or_documents=input_text,
     prompt_description=prompt,
     examples=examples,
     model=model,
 )
+print(f"抽取缓存: {cache.stats()}")
 
 for extraction in result.extractions:
     print(extraction.extraction_index, extraction.extraction_class, extraction.extraction_text, extraction.attributes)
@@ -1,6 +1,11 @@
 import langextract as lx
 import textwrap
 
+from chunked_extraction import ChunkedExtractor
+from extraction_cache import ExtractionCache
+from extraction_store import ExtractionWriter, ExtractionReader
+from extraction_visualization import render_site
+
 # 1. Define the prompt and extraction rules
 prompt = textwrap.dedent("""\
     Extract characters, emotions, and relationships in order of appearance.
@@ -41,24 +46,32 @@ with open('检索系统演示总结.md', 'r', encoding='utf-8') as file:
  
 
 # Run the extraction
-result = lx.extract(
-    text_or_documents=input_text,
+# 长文本切成重叠窗口并发抽取，中断后重新运行会从检查点继续
+extractor = ChunkedExtractor(
     prompt_description=prompt,
     examples=examples,
+    max_workers=4,
+    checkpoint_dir="extraction_checkpoints",
+    cache=ExtractionCache("extraction_cache.sqlite"),
     model_url="http://localhost:11434",
     model_id="gemma3:12b",  # Use llama3
 )
+# 固定文档号：重复运行时覆盖同一篇文档的结果，而不是每次追加一个随机编号的新文档
+result = extractor.extract(input_text, document_id="检索系统演示总结")
 
 print(result)
 
 
 # Save the results to a JSONL file
-lx.io.save_annotated_documents([result], output_name="extraction_results.jsonl", output_dir=".")
+# 追加写入并维护偏移索引，可视化时只读取这一篇文档
+with ExtractionWriter("extraction_results.jsonl") as writer:
+    writer.write(result)
 
 # Generate the visualization from the file
-html_content = lx.visualize("extraction_results.jsonl")
+with ExtractionReader("extraction_results.jsonl") as reader:
+    html_content = reader.visualize(result.document_id)
 with open("visualization.html", "w") as f:
-    if hasattr(html_content, 'data'):
-        f.write(html_content.data)  # For Jupyter/Colab
-    else:
-        f.write(html_content)
\ No newline at end of file
+    f.write(html_content)
+
+# 结果较多时按文档分页生成静态页面，首页为类别统计
+render_site("extraction_results.jsonl", "visualization")
@@ -0,0 +1,252 @@
+# MarkItDown批量转换：进程池并行转换 + 按文件内容哈希缓存结果 + 有界并发的图片LLM描述
+import asyncio
+import base64
+import hashlib
+import inspect
+import mimetypes
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+DEFAULT_EXTENSIONS = {".xls", ".xlsx", ".csv", ".pdf", ".docx", ".pptx", ".html", ".htm",
+                      ".txt", ".md", ".json", ".xml", ".epub"} | IMAGE_EXTENSIONS
+DEFAULT_CAPTION_PROMPT = "Write a detailed caption for this image."
+
+# 进程池中每个worker复用一个MarkItDown实例
+_worker_markitdown = None
+
+
+def _init_worker(enable_plugins: bool):
+    global _worker_markitdown
+    from markitdown import MarkItDown
+    _worker_markitdown = MarkItDown(enable_plugins=enable_plugins)
+
+
+def _convert_in_worker(path: str) -> str:
+    """在进程池中转换单个文件；图片在这里只提取EXIF元数据，LLM描述由主进程异步补充"""
+    return _worker_markitdown.convert(path).text_content
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """分块计算文件内容的sha256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class MarkdownCache:
+    """按 (文件内容哈希, 转换配置) 缓存转换结果的SQLite缓存"""
+
+    def __init__(self, db_path: str = "markitdown_cache.sqlite"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversions ("
+            "key TEXT PRIMARY KEY, markdown TEXT NOT NULL, source TEXT, created_at TEXT)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT markdown FROM conversions WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, markdown: str, source: str = None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO conversions VALUES (?, ?, ?, ?)",
+                (key, markdown, source, datetime.now().isoformat()),
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class BatchConverter:
+    """
+    批量把文件转换为Markdown
+
+    - 文件转换在进程池中并行执行，每个进程复用一个MarkItDown实例
+    - 转换结果按文件内容的sha256缓存，文件未变化时直接返回缓存，不再转换
+    - 图片的LLM描述在主进程中异步请求，最多 llm_concurrency 个同时在途；
+      llm_client 可以是 OpenAI 或 AsyncOpenAI，同步客户端在线程中调用
+    - 输出格式与 MarkItDown(llm_client=..., llm_prompt=...) 的单文件转换一致
+
+    用法:
+        converter = BatchConverter(llm_client=client, llm_model="gemma3:27b", llm_prompt=prompt)
+        stats = converter.convert_directory("invoices/", output_dir="invoices_md/")
+    """
+
+    def __init__(self, workers: int = None, cache_db: Optional[str] = "markitdown_cache.sqlite",
+                 llm_client=None, llm_model: str = None, llm_prompt: str = None,
+                 llm_concurrency: int = 4, extensions: Iterable[str] = None,
+                 enable_plugins: bool = False):
+        """
+        Args:
+            workers: 转换进程数，默认为CPU核数
+            cache_db: 缓存数据库路径，为None时不缓存
+            llm_client: 用于图片描述的OpenAI兼容客户端，为None时图片只提取元数据
+            llm_model: 图片描述使用的模型
+            llm_prompt: 图片描述的提示词
+            llm_concurrency: 同时在途的最大LLM请求数
+            extensions: convert_directory 处理的文件扩展名
+            enable_plugins: 是否启用MarkItDown插件
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = MarkdownCache(cache_db) if cache_db else None
+        self.llm_client = llm_client
+        self.llm_model = llm_model
+        self.llm_prompt = llm_prompt or DEFAULT_CAPTION_PROMPT
+        self.llm_concurrency = max(1, llm_concurrency)
+        self.extensions = {ext.lower() for ext in (extensions or DEFAULT_EXTENSIONS)}
+        self.enable_plugins = enable_plugins
+        # 最近一次批量转换的统计，每次 aconvert_files 开始时清零
+        self.stats = self._empty_stats()
+
+    @staticmethod
+    def _empty_stats() -> Dict[str, int]:
+        return {"converted": 0, "cached": 0, "captioned": 0, "failed": 0}
+
+    def _use_llm(self, path: str) -> bool:
+        return self.llm_client is not None and self.llm_model is not None and \
+            os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+    def _cache_key(self, content_hash: str, path: str) -> str:
+        """相同内容在不同配置下（是否调用LLM、模型、提示词）的结果分开缓存"""
+        parts = [content_hash, "plugins" if self.enable_plugins else ""]
+        if self._use_llm(path):
+            parts += [self.llm_model, self.llm_prompt]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    async def _caption(self, path: str, semaphore: asyncio.Semaphore) -> Optional[str]:
+        """请求LLM生成图片描述，失败返回None"""
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        with open(path, "rb") as f:
+            data_uri = f"data:{content_type};base64,{base64.b64encode(f.read()).decode('utf-8')}"
+        messages = [{
+            "role": "user",
+            "content": [
+                {"type": "text", "text": self.llm_prompt},
+                {"type": "image_url", "image_url": {"url": data_uri}},
+            ],
+        }]
+        async with semaphore:
+            try:
+                create = self.llm_client.chat.completions.create
+                # openai的create带装饰器，需要解包后才能判断是否为异步方法
+                if inspect.iscoroutinefunction(inspect.unwrap(create)):
+                    response = await create(model=self.llm_model, messages=messages)
+                else:
+                    response = await asyncio.to_thread(create, model=self.llm_model, messages=messages)
+            except Exception as e:
+                print(f"图片描述失败 {path}: {e!r}")
+                return None
+        return response.choices[0].message.content
+
+    async def _convert_one(self, path: str, pool: ProcessPoolExecutor, llm_semaphore: asyncio.Semaphore) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        try:
+            # 读取失败（文件不存在、无权限等）只计入该文件的失败，不中断整批转换
+            key = self._cache_key(await asyncio.to_thread(file_sha256, path), path)
+            if self.cache is not None:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    self.stats["cached"] += 1
+                    return cached
+
+            if self._use_llm(path):
+                # 元数据提取和LLM描述同时进行
+                markdown, caption = await asyncio.gather(
+                    loop.run_in_executor(pool, _convert_in_worker, path),
+                    self._caption(path, llm_semaphore),
+                )
+                if caption is None:
+                    # 描述失败时不缓存，下次重试
+                    self.stats["failed"] += 1
+                    return markdown
+                markdown += "\n# Description:\n" + caption.strip() + "\n"
+                self.stats["captioned"] += 1
+            else:
+                markdown = await loop.run_in_executor(pool, _convert_in_worker, path)
+        except Exception as e:
+            print(f"转换失败 {path}: {e!r}")
+            self.stats["failed"] += 1
+            return None
+
+        self.stats["converted"] += 1
+        if self.cache is not None:
+            self.cache.put(key, markdown, path)
+        return markdown
+
+    async def aconvert_files(self, paths: List[str], output_paths: List[str] = None) -> Dict[str, Optional[str]]:
+        """
+        异步批量转换
+
+        Args:
+            paths: 文件路径列表
+            output_paths: 与paths对应的输出.md路径；提供时结果写入文件而不在返回值中保留
+
+        Returns:
+            {文件路径: Markdown}，转换失败为None；写入文件时值为输出路径。本次的统计见 self.stats
+        """
+        self.stats = self._empty_stats()
+        llm_semaphore = asyncio.Semaphore(self.llm_concurrency)
+        # 同时处理的文件数有上限，避免为数千个文件一次性创建任务和读入图片
+        file_semaphore = asyncio.Semaphore(self.workers * 2 + self.llm_concurrency)
+        results: Dict[str, Optional[str]] = {}
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.enable_plugins,)) as pool:
+            async def run(i: int, path: str):
+                async with file_semaphore:
+                    markdown = await self._convert_one(path, pool, llm_semaphore)
+                if output_paths is None or markdown is None:
+                    results[path] = markdown
+                    return
+                os.makedirs(os.path.dirname(output_paths[i]) or ".", exist_ok=True)
+                with open(output_paths[i], "w", encoding="utf-8") as f:
+                    f.write(markdown)
+                results[path] = output_paths[i]
+
+            await asyncio.gather(*(run(i, path) for i, path in enumerate(paths)))
+        return results
+
+    def convert_files(self, paths: List[str]) -> Dict[str, Optional[str]]:
+        """同步批量转换，返回 {文件路径: Markdown}"""
+        return asyncio.run(self.aconvert_files(list(paths)))
+
+    def convert_directory(self, root: str, output_dir: str, recursive: bool = True) -> Dict:
+        """
+        转换目录下所有支持的文件，输出到output_dir下的同名.md文件（保持子目录结构）
+
+        Returns:
+            统计信息 {"files", "converted", "cached", "captioned", "failed"}
+        """
+        paths = []
+        for directory, _, files in os.walk(root):
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in self.extensions:
+                    paths.append(os.path.join(directory, name))
+            if not recursive:
+                break
+        output_paths = [os.path.join(output_dir, os.path.relpath(path, root)) + ".md" for path in paths]
+
+        print(f"正在转换 {len(paths)} 个文件，进程数: {self.workers}...")
+        asyncio.run(self.aconvert_files(paths, output_paths))
+        stats = {"files": len(paths), **self.stats}
+        print(f"转换完成: {stats}")
+        return stats
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
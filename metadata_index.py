@@ -0,0 +1,218 @@
+# 元数据过滤：按字段预先构建位图/有序数组索引，过滤表达式直接在索引上求值
+from typing import Any, Dict, List
+
+import numpy as np
+
+from columnar_store import DocumentStore, CategoryColumn, NumericColumn, StringColumn, datetime_to_micros
+
+# 不同取值不超过该数量的字段为每个取值保存一个位图，否则保存行号数组
+BITMAP_MAX_CARDINALITY = 256
+
+COMPARISON_OPS = ("$gt", "$gte", "$lt", "$lte")
+
+
+class CategoricalField:
+    """离散字段：取值 -> 位图（低基数）或 行号数组（高基数）"""
+
+    kind = "categorical"
+
+    def __init__(self, rows_by_value: Dict[Any, np.ndarray], num_rows: int):
+        self.num_rows = num_rows
+        self.use_bitmap = len(rows_by_value) <= BITMAP_MAX_CARDINALITY
+        self.entries = {}
+        for value, rows in rows_by_value.items():
+            if self.use_bitmap:
+                mask = np.zeros(num_rows, dtype=bool)
+                mask[rows] = True
+                self.entries[self._key(value)] = np.packbits(mask)
+            else:
+                self.entries[self._key(value)] = rows
+
+    @classmethod
+    def from_column(cls, column: CategoryColumn, num_rows: int) -> "CategoricalField":
+        """按字典编码分组：一次稳定排序得到每个编码的行号"""
+        codes = column.codes.values
+        order = np.argsort(codes, kind="stable")
+        sorted_codes = codes[order]
+        boundaries = np.flatnonzero(np.diff(sorted_codes)) + 1
+        rows_by_value = {}
+        for rows in np.split(order, boundaries):
+            code = codes[rows[0]] if len(rows) else -1
+            if code >= 0:
+                rows_by_value[column.dictionary[code]] = rows
+        return cls(rows_by_value, num_rows)
+
+    @classmethod
+    def from_strings(cls, column: StringColumn, num_rows: int) -> "CategoricalField":
+        """高基数字符串列逐行分组"""
+        rows_by_value = {}
+        for row in range(num_rows):
+            ok, value = column.get(row)
+            if ok:
+                rows_by_value.setdefault(value, []).append(row)
+        return cls({value: np.array(rows, dtype=np.int64) for value, rows in rows_by_value.items()}, num_rows)
+
+    @staticmethod
+    def _key(value: Any):
+        return (type(value).__name__, value)
+
+    def match_any(self, values: List[Any]) -> np.ndarray:
+        """返回取值属于values的压缩位图"""
+        if self.use_bitmap:
+            bitmap = np.zeros((self.num_rows + 7) // 8, dtype=np.uint8)
+            for value in values:
+                entry = self.entries.get(self._key(value))
+                if entry is not None:
+                    bitmap |= entry
+            return bitmap
+        mask = np.zeros(self.num_rows, dtype=bool)
+        for value in values:
+            rows = self.entries.get(self._key(value))
+            if rows is not None:
+                mask[rows] = True
+        return np.packbits(mask)
+
+    def match_range(self, op: str, value: Any) -> np.ndarray:
+        raise ValueError(f"离散字段不支持范围查询: {op}")
+
+
+class SortedField:
+    """数值/时间字段：按取值排序的 (取值, 行号) 数组，范围查询用二分查找"""
+
+    def __init__(self, column: NumericColumn, num_rows: int):
+        self.kind = column.kind
+        self.num_rows = num_rows
+        rows = np.flatnonzero(column.valid.values)
+        values = column.values.values[rows]
+        order = np.argsort(values, kind="stable")
+        self.sorted_values = values[order]
+        self.sorted_rows = rows[order]
+
+    def _convert(self, value: Any):
+        """将过滤条件中的取值转换为列的存储类型，时间列为微秒"""
+        if self.kind == "datetime":
+            micros = datetime_to_micros(value)
+            if micros is None:
+                raise ValueError(f"无法解析的时间: {value!r}")
+            return micros
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"数值字段的过滤条件必须为数字: {value!r}")
+        return value
+
+    def _rows_to_bitmap(self, rows: np.ndarray) -> np.ndarray:
+        mask = np.zeros(self.num_rows, dtype=bool)
+        mask[rows] = True
+        return np.packbits(mask)
+
+    def match_any(self, values: List[Any]) -> np.ndarray:
+        mask = np.zeros(self.num_rows, dtype=bool)
+        for value in values:
+            try:
+                key = self._convert(value)
+            except ValueError:
+                continue
+            lo = np.searchsorted(self.sorted_values, key, side="left")
+            hi = np.searchsorted(self.sorted_values, key, side="right")
+            mask[self.sorted_rows[lo:hi]] = True
+        return np.packbits(mask)
+
+    def match_range(self, op: str, value: Any) -> np.ndarray:
+        key = self._convert(value)
+        if op == "$gt":
+            rows = self.sorted_rows[np.searchsorted(self.sorted_values, key, side="right"):]
+        elif op == "$gte":
+            rows = self.sorted_rows[np.searchsorted(self.sorted_values, key, side="left"):]
+        elif op == "$lt":
+            rows = self.sorted_rows[:np.searchsorted(self.sorted_values, key, side="left")]
+        else:
+            rows = self.sorted_rows[:np.searchsorted(self.sorted_values, key, side="right")]
+        return self._rows_to_bitmap(rows)
+
+
+class MetadataIndex:
+    """
+    文档元数据的字段索引
+
+    过滤表达式（类MongoDB语法），多个字段之间为AND：
+        {"category": "NLP"}
+        {"category": {"$in": ["NLP", "AI/ML"]}, "id": {"$ne": 3}}
+        {"added_at": {"$gte": "2025-01-01", "$lt": "2025-02-01"}}
+        {"$or": [{"category": "Data"}, {"word_count": {"$gt": 20}}]}
+    支持 $eq/$ne/$in/$nin/$gt/$gte/$lt/$lte/$and/$or；缺少该字段的文档不满足 $eq/$in/范围条件。
+    无法建索引的字段（列表、字典等）上的 $eq/$in/范围条件不匹配任何文档
+    """
+
+    def __init__(self):
+        self.num_rows = 0
+        self.fields: Dict[str, Any] = {}
+
+    def build(self, metadata: List[Dict]):
+        """根据元数据列表构建索引"""
+        store = DocumentStore()
+        store.append([""] * len(metadata), metadata)
+        self.build_from_store(store)
+
+    def build_from_store(self, store: DocumentStore):
+        """直接基于列式存储的类型化列构建索引；ObjectColumn字段不建索引"""
+        self.num_rows = len(store)
+        self.fields = {}
+        for field, column in store.columns.items():
+            if isinstance(column, CategoryColumn):
+                self.fields[field] = CategoricalField.from_column(column, self.num_rows)
+            elif isinstance(column, StringColumn):
+                self.fields[field] = CategoricalField.from_strings(column, self.num_rows)
+            elif isinstance(column, NumericColumn):
+                self.fields[field] = SortedField(column, self.num_rows)
+
+    def evaluate(self, filters: Dict) -> np.ndarray:
+        """对过滤表达式求值，返回长度为文档数的布尔数组"""
+        return np.unpackbits(self._evaluate(filters), count=self.num_rows).astype(bool)
+
+    def _all(self) -> np.ndarray:
+        return np.packbits(np.ones(self.num_rows, dtype=bool))
+
+    def _none(self) -> np.ndarray:
+        return np.zeros((self.num_rows + 7) // 8, dtype=np.uint8)
+
+    def _evaluate(self, filters: Dict) -> np.ndarray:
+        bitmap = self._all()
+        for key, condition in filters.items():
+            if key == "$and":
+                for sub in condition:
+                    bitmap &= self._evaluate(sub)
+            elif key == "$or":
+                any_bitmap = self._none()
+                for sub in condition:
+                    any_bitmap |= self._evaluate(sub)
+                bitmap &= any_bitmap
+            elif key.startswith("$"):
+                raise ValueError(f"未知的过滤操作符: {key}")
+            else:
+                bitmap &= self._evaluate_field(key, condition)
+        return bitmap
+
+    def _evaluate_field(self, field: str, condition: Any) -> np.ndarray:
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        index = self.fields.get(field)
+
+        bitmap = self._all()
+        for op, value in condition.items():
+            if op in ("$eq", "$in"):
+                values = value if op == "$in" else [value]
+                bitmap &= index.match_any(values) if index is not None else self._none()
+            elif op in ("$ne", "$nin"):
+                values = value if op == "$nin" else [value]
+                if index is not None:
+                    bitmap &= ~index.match_any(values)
+            elif op in COMPARISON_OPS:
+                bitmap &= index.match_range(op, value) if index is not None else self._none()
+            else:
+                raise ValueError(f"未知的过滤操作符: {op}")
+        # 取反后末尾的填充位可能为1，清零
+        if self.num_rows % 8:
+            bitmap[-1] &= np.uint8((0xFF << (8 - self.num_rows % 8)) & 0xFF)
+        return bitmap
+
+    def get_statistics(self) -> Dict:
+        return {field: index.kind for field, index in self.fields.items()}
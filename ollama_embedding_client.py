@@ -0,0 +1,125 @@
+# Ollama嵌入向量客户端：连接池复用 + 批次并发分发
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+
+class EmbeddingError(Exception):
+    """文本无法获取嵌入向量；不返回零向量，避免失败的文本被当作真实向量写入索引"""
+
+    def __init__(self, message: str, texts: List[str]):
+        super().__init__(message)
+        self.texts = texts
+
+
+class OllamaEmbeddingClient:
+    """
+    调用ollama /api/embed 的共享客户端
+
+    - 使用一个 requests.Session 保持长连接，避免每条文本新建TCP连接
+    - 将文本按批次切分，通过有界线程池并发发送，结果保持输入顺序
+    - 批次失败时对半拆分重试，定位到无法嵌入的单条文本后抛出 EmbeddingError；
+      连接失败（服务不可用）时不拆分，直接抛出
+
+    ollama 以 OLLAMA_NUM_PARALLEL>1 启动时，将 max_concurrency 设置为相同的值即可充分利用吞吐
+    """
+
+    def __init__(self, model_name: str = "bge-m3:567m",
+                 base_url: str = "http://localhost:11434",
+                 max_concurrency: int = 4,
+                 timeout: float = 30,
+                 embedding_dim: int = 1024):
+        """
+        Args:
+            model_name: ollama模型名称
+            base_url: ollama服务地址
+            max_concurrency: 同时在途的最大请求数
+            timeout: 单条文本的基础超时时间（秒），批次越大超时越长
+            embedding_dim: 默认向量维度，成功请求后按实际返回更新
+        """
+        self.model_name = model_name
+        self.base_url = base_url
+        self.api_url = f"{base_url}/api/embed"
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.embedding_dim = embedding_dim
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = None
+
+    def embed(self, texts: List[str], batch_size: int = 12) -> List[List[float]]:
+        """
+        获取一组文本的嵌入向量
+
+        Args:
+            texts: 文本列表
+            batch_size: 每个请求包含的文本数量
+
+        Returns:
+            与输入顺序一致的嵌入向量列表
+
+        Raises:
+            EmbeddingError: ollama不可用，或某条文本拆分重试后仍然失败
+        """
+        batch_size = max(1, batch_size)
+        batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+        if len(batches) <= 1 or self.max_concurrency == 1:
+            results = [self._embed_batch(batch) for batch in batches]
+        else:
+            # executor.map 按提交顺序返回结果，保证输出顺序
+            results = list(self._get_executor().map(self._embed_batch, batches))
+
+        embeddings = []
+        for batch_embeddings in results:
+            embeddings.extend(batch_embeddings)
+        return embeddings
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                thread_name_prefix="ollama-embed")
+        return self._executor
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        """
+        对一批文本发送一次/api/embed请求
+
+        请求失败时将批次对半拆分后分别重试，单条文本仍然失败时抛出 EmbeddingError
+        """
+        try:
+            response = self.session.post(
+                self.api_url,
+                json={"model": self.model_name, "input": batch},
+                timeout=self.timeout + 2 * len(batch)
+            )
+            response.raise_for_status()
+            embeddings = response.json()["embeddings"]
+            if len(embeddings) != len(batch):
+                raise ValueError(f"返回的嵌入向量数量({len(embeddings)})与输入数量({len(batch)})不一致")
+            self.embedding_dim = len(embeddings[0])
+            return embeddings
+        except requests.ConnectionError as e:
+            # 服务不可用时拆分重试只会成倍增加请求
+            raise EmbeddingError(f"无法连接ollama({self.api_url}): {e}", batch) from e
+        except Exception as e:
+            if len(batch) == 1:
+                raise EmbeddingError(f"获取嵌入向量时出错: {e}", batch) from e
+            mid = len(batch) // 2
+            return self._embed_batch(batch[:mid]) + self._embed_batch(batch[mid:])
+
+    def close(self):
+        """关闭线程池和HTTP连接"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,188 @@
+# 代理响应缓存：规范化请求哈希 + LRU/TTL/容量上限 + 相同请求合并为一次上游调用(single-flight)
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# 参与缓存键的采样参数；user 等不影响输出的字段不参与
+SAMPLING_PARAMS = ("temperature", "top_p", "n", "max_tokens", "presence_penalty", "frequency_penalty",
+                   "stop", "seed", "response_format", "tools", "tool_choice")
+
+
+def canonical_key(params: Dict[str, Any]) -> str:
+    """对 model、messages 和采样参数计算规范化哈希，字段顺序和未设置的参数不影响结果"""
+    canonical = {"model": params.get("model"), "messages": params.get("messages")}
+    for name in SAMPLING_PARAMS:
+        if params.get(name) is not None:
+            canonical[name] = params[name]
+    raw = json.dumps(canonical, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def is_deterministic(params: Dict[str, Any]) -> bool:
+    """temperature为0（或设置了seed）的请求输出可复用"""
+    return params.get("temperature") == 0 or params.get("seed") is not None
+
+
+class ResponseCache:
+    """
+    非流式响应的进程内缓存
+
+    LRU淘汰，同时受条目数和总字节数限制；超过TTL的条目读取时视为未命中
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            max_entries: 最多缓存的响应数
+            ttl_seconds: 缓存有效期（秒）
+            max_bytes: 缓存响应的总大小上限（按JSON序列化后的字节数估算）
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, size, value = entry
+        if time.monotonic() > expires_at:
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any):
+        size = len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, size, value)
+        self.total_bytes += size
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class _Flight:
+    """一次正在执行的共享调用及其等待方数量"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+        self.abandoned = False
+
+
+class SingleFlight:
+    """
+    同一个键同时只有一个调用在执行，其余调用等待并共享其结果（或异常）
+
+    调用在独立的任务中执行，所有调用方（包括发起方）都通过 shield 等待：
+    任一调用方被取消（客户端断开）都不会取消共享的调用，其他调用方照常拿到结果；
+    最后一个调用方也被取消时才取消共享的调用，避免无人等待的上游请求继续占用资源
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, _Flight] = {}
+        self.coalesced = 0
+
+    def _finish(self, key: str, flight: _Flight):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        # 没有等待方时避免 "Task exception was never retrieved" 警告
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._inflight.get(key)
+        if flight is not None and not flight.abandoned:
+            self.coalesced += 1
+        else:
+            flight = self._inflight[key] = _Flight(asyncio.ensure_future(fn()))
+            flight.task.add_done_callback(lambda task: self._finish(key, flight))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                # 最后一个等待方离开：取消共享调用，之后到达的相同请求重新发起
+                flight.abandoned = True
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+
+class CachedCaller:
+    """
+    组合响应缓存和single-flight
+
+    可缓存的请求先查缓存，未命中时相同请求合并为一次上游调用，结果写入缓存；
+    不可缓存的请求直接调用
+    """
+
+    def __init__(self, cache: Optional[ResponseCache], cache_all: bool = False):
+        """
+        Args:
+            cache: 响应缓存，为None时只做请求合并
+            cache_all: 为False时只缓存和合并确定性请求（temperature=0 或设置了seed）
+        """
+        self.cache = cache
+        self.cache_all = cache_all
+        self.flight = SingleFlight()
+
+    def cacheable(self, params: Dict[str, Any]) -> bool:
+        return self.cache_all or is_deterministic(params)
+
+    async def call(self, params: Dict[str, Any], fn: Callable[[], Awaitable[Any]],
+                   use_cache: bool = True) -> Any:
+        if not use_cache or not self.cacheable(params):
+            return await fn()
+        key = canonical_key(params)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        async def fetch():
+            result = await fn()
+            if self.cache is not None:
+                self.cache.put(key, result)
+            return result
+
+        return await self.flight.do(key, fetch)
+
+    def stats(self) -> Dict:
+        stats = self.cache.stats() if self.cache is not None else {}
+        stats["coalesced"] = self.flight.coalesced
+        return stats
@@ -0,0 +1,415 @@
+# 代理限流与准入：按API Key和模型的令牌桶（请求数/token数）+ 区分优先级（交互/批量）的准入队列 + 指标
+import asyncio
+import heapq
+import itertools
+import json
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+# 中文按字、英文/数字按词、其他符号按个估算token数
+TOKEN_ESTIMATE_PATTERN = re.compile(r"[\u4e00-\u9fff]|[0-9A-Za-z]+|[^\s0-9A-Za-z\u4e00-\u9fff]")
+# 未设置 max_tokens 时按该输出长度预估
+DEFAULT_COMPLETION_TOKENS = 512
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+# 等待时间直方图的桶上界（秒）
+WAIT_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60)
+
+
+def count_tokens(text: str) -> int:
+    """近似token数"""
+    return len(TOKEN_ESTIMATE_PATTERN.findall(text))
+
+
+def estimate_prompt_tokens(messages: List[Dict]) -> int:
+    """输入消息的近似token数"""
+    return sum(count_tokens(str(message.get("content") or "")) for message in messages)
+
+
+def estimate_tokens(messages: List[Dict], max_tokens: Optional[int] = None) -> int:
+    """预估一次请求消耗的token数：输入按字/词估算，输出按 max_tokens（未设置时按默认值）"""
+    return estimate_prompt_tokens(messages) + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+class StreamUsage:
+    """
+    统计流式响应实际消耗的token数，用于修正预扣的额度
+
+    上游在流中返回 usage 时以其为准，否则为输入估算值加上已输出内容的估算值。
+    feed() 接收原样转发的SSE字节，按行解析 data 事件；add_text() 用于已解析的增量内容
+    """
+
+    def __init__(self, prompt_tokens: int):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = 0
+        self.reported_total: Optional[int] = None
+        self._buffer = b""
+
+    def add_text(self, text: Optional[str]):
+        if text:
+            self.completion_tokens += count_tokens(text)
+
+    def report(self, total_tokens: Optional[int]):
+        if total_tokens is not None:
+            self.reported_total = total_tokens
+
+    def feed(self, chunk: bytes):
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for line in lines:
+            line = line.strip()
+            if not line.startswith(b"data:"):
+                continue
+            try:
+                event = json.loads(line[5:])
+            except ValueError:
+                # [DONE] 或不完整的事件
+                continue
+            if not isinstance(event, dict):
+                continue
+            self.report((event.get("usage") or {}).get("total_tokens"))
+            for choice in event.get("choices") or []:
+                delta = choice.get("delta") or {}
+                self.add_text(delta.get("content"))
+                self.add_text(delta.get("reasoning_content"))
+
+    @property
+    def total_tokens(self) -> int:
+        if self.reported_total is not None:
+            return self.reported_total
+        return self.prompt_tokens + self.completion_tokens
+
+
+class RateLimitExceeded(Exception):
+    """请求需要等待的时间超过上限，或准入队列已满"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    令牌桶：容量 capacity，每秒补充 rate 个令牌
+
+    采用预约方式：acquire 立即扣除令牌（余额可以为负），返回需要等待的秒数，
+    等待期间不需要轮询，并发请求按到达顺序排队
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """扣除 amount 个令牌需要等待的秒数（不实际扣除）"""
+        self._refill()
+        # 单次请求超过桶容量时按整桶计算，避免永远无法满足
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def acquire(self, amount: float) -> float:
+        """扣除令牌，返回实际扣除的数量（超过桶容量时只扣整桶）"""
+        self._refill()
+        charged = min(amount, self.capacity)
+        self.tokens -= charged
+        return charged
+
+    def adjust(self, delta: float):
+        """按实际用量修正：delta为正时补扣，为负时退还"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class Limit:
+    """一个限流对象（某个API Key或某个模型）的请求数和token数两个令牌桶"""
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 burst_seconds: float = 10):
+        """
+        Args:
+            requests_per_minute: 每分钟请求数，None表示不限制
+            tokens_per_minute: 每分钟token数，None表示不限制
+            burst_seconds: 桶容量对应的时长，允许空闲后短时间突发
+        """
+        self.requests = (TokenBucket(requests_per_minute / 60, max(1.0, requests_per_minute / 60 * burst_seconds))
+                         if requests_per_minute else None)
+        self.tokens = (TokenBucket(tokens_per_minute / 60, max(1.0, tokens_per_minute / 60 * burst_seconds))
+                       if tokens_per_minute else None)
+
+    def wait_time(self, tokens: int) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    def acquire(self, tokens: int) -> float:
+        """扣除一个请求和tokens个token，返回token桶实际扣除的数量"""
+        if self.requests is not None:
+            self.requests.acquire(1)
+        return self.tokens.acquire(tokens) if self.tokens is not None else 0.0
+
+
+class Reservation:
+    """
+    一次请求预扣的令牌，请求结束后用实际token数修正；可以多次修正，以最后一次为准
+
+    charged 记录每个限额的token桶实际扣除的数量（预估超过桶容量时只扣了整桶），修正按它计算差额
+    """
+
+    def __init__(self, limits: List[Limit], charged: List[float], priority: str):
+        self.limits = limits
+        self.charged = charged
+        self.priority = priority
+        self.refunded = False
+
+    def settle(self, actual_tokens: Optional[int]):
+        if actual_tokens is None or self.refunded:
+            return
+        for i, limit in enumerate(self.limits):
+            if limit.tokens is not None:
+                limit.tokens.adjust(actual_tokens - self.charged[i])
+                self.charged[i] = actual_tokens
+
+    def refund(self):
+        """请求失败（上游错误、无可用上游、准入队列已满）时退还预扣的请求数和token数"""
+        if self.refunded:
+            return
+        self.settle(0)
+        for limit in self.limits:
+            if limit.requests is not None:
+                limit.requests.adjust(-1)
+        self.refunded = True
+
+
+class RateLimiter:
+    """
+    按API Key和模型的令牌桶限流
+
+    一个请求同时受其API Key和所请求模型的限额约束，需要等待时间超过 max_wait 的请求直接拒绝（429）；
+    未配置的API Key共用一个 default_key 限额（按未知Key分别建桶会无限增长，轮换Key也能绕过限流），
+    未配置的模型不限制
+    """
+
+    def __init__(self, keys: Dict[str, Dict] = None, models: Dict[str, Dict] = None,
+                 default_key: Dict = None, max_wait: float = 30):
+        """
+        Args:
+            keys: {api_key: {"rpm", "tpm", "priority"}}，priority为该Key的默认优先级
+            models: {model: {"rpm", "tpm"}}
+            default_key: 未配置的API Key共用的限额
+            max_wait: 限流时最多等待的秒数
+        """
+        self.key_config = keys or {}
+        self.model_config = models or {}
+        self.default_key = default_key or {}
+        self.max_wait = max_wait
+        self._key_limits: Dict[str, Limit] = {name: self._make_limit(config)
+                                              for name, config in self.key_config.items()}
+        self._default_limit = self._make_limit(self.default_key) if self.default_key else None
+        self._model_limits: Dict[str, Limit] = {}
+        self.rejected = 0
+
+    @classmethod
+    def from_file(cls, path: str) -> "RateLimiter":
+        """
+        配置文件格式:
+            {"default_key": {"rpm": 60, "tpm": 100000},
+             "keys": {"sk-batch": {"rpm": 600, "tpm": 2000000, "priority": "batch"}},
+             "models": {"gemma3:27b": {"rpm": 300, "tpm": 1000000}},
+             "max_wait": 30}
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(config.get("keys"), config.get("models"), config.get("default_key"), config.get("max_wait", 30))
+
+    @staticmethod
+    def _make_limit(config: Dict) -> Limit:
+        return Limit(config.get("rpm"), config.get("tpm"), config.get("burst_seconds", 10))
+
+    def _limits(self, api_key: str, model: str) -> List[Limit]:
+        limits = []
+        key_limit = self._key_limits.get(api_key, self._default_limit)
+        if key_limit is not None:
+            limits.append(key_limit)
+        if model in self.model_config:
+            if model not in self._model_limits:
+                self._model_limits[model] = self._make_limit(self.model_config[model])
+            limits.append(self._model_limits[model])
+        return limits
+
+    def default_priority(self, api_key: str) -> str:
+        return self.key_config.get(api_key, {}).get("priority", "interactive")
+
+    async def acquire(self, api_key: str, model: str, tokens: int, priority: str) -> Reservation:
+        """
+        预扣令牌，需要时等待；等待时间超过 max_wait 时抛出 RateLimitExceeded
+
+        先检查全部限额再统一扣除，被拒绝的请求不消耗任何限额
+        """
+        limits = self._limits(api_key, model)
+        wait = max((limit.wait_time(tokens) for limit in limits), default=0.0)
+        if wait > self.max_wait:
+            self.rejected += 1
+            raise RateLimitExceeded(f"超过限流额度，请在 {wait:.1f} 秒后重试", wait)
+        reservation = Reservation(limits, [limit.acquire(tokens) for limit in limits], priority)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # 客户端在等待期间断开，退还已预扣的额度
+                reservation.refund()
+                raise
+        return reservation
+
+
+class AdmissionQueue:
+    """
+    按优先级分配上游并发名额
+
+    名额空闲时直接进入；否则按 (优先级, 到达顺序) 排队，交互请求总是先于批量请求获得名额。
+    batch_limit 限制批量请求最多同时占用的名额，为交互请求保留余量
+    """
+
+    def __init__(self, concurrency: int, batch_limit: Optional[int] = None, max_queue: int = 1000):
+        """
+        Args:
+            concurrency: 同时发往上游的最大请求数
+            batch_limit: 批量请求最多占用的名额，None表示不单独限制
+            max_queue: 排队请求数上限，超过时拒绝
+        """
+        self.concurrency = concurrency
+        self.batch_limit = batch_limit if batch_limit is not None else concurrency
+        self.max_queue = max_queue
+        self.active = {name: 0 for name in PRIORITIES}
+        self._waiters: List[Tuple[int, int, str, asyncio.Future]] = []
+        # 仍在等待的请求数；_waiters 中可能残留已取消的项，不能用它的长度判断队列是否已满
+        self._queued = 0
+        self._counter = itertools.count()
+
+        self.admitted = {name: 0 for name in PRIORITIES}
+        self.rejected = 0
+        self.wait_sum = {name: 0.0 for name in PRIORITIES}
+        self.wait_buckets = {name: [0] * (len(WAIT_BUCKETS) + 1) for name in PRIORITIES}
+
+    def _can_admit(self, priority: str) -> bool:
+        if sum(self.active.values()) >= self.concurrency:
+            return False
+        return priority != "batch" or self.active["batch"] < self.batch_limit
+
+    def depth(self) -> Dict[str, int]:
+        depth = {name: 0 for name in PRIORITIES}
+        for _, _, priority, future in self._waiters:
+            if not future.done():
+                depth[priority] += 1
+        return depth
+
+    def _wake(self):
+        """把空出的名额按优先级分给排队的请求；批量请求受 batch_limit 限制时跳过，不阻塞其后的交互请求"""
+        skipped = []
+        while self._waiters and sum(self.active.values()) < self.concurrency:
+            entry = heapq.heappop(self._waiters)
+            _, _, priority, future = entry
+            if future.done():
+                continue
+            if not self._can_admit(priority):
+                skipped.append(entry)
+                continue
+            self.active[priority] += 1
+            future.set_result(None)
+        for entry in skipped:
+            heapq.heappush(self._waiters, entry)
+
+    def _record_wait(self, priority: str, seconds: float):
+        self.admitted[priority] += 1
+        self.wait_sum[priority] += seconds
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if seconds <= bound:
+                self.wait_buckets[priority][i] += 1
+                return
+        self.wait_buckets[priority][-1] += 1
+
+    async def acquire(self, priority: str = "interactive"):
+        if priority not in PRIORITIES:
+            raise ValueError(f"未知的优先级: {priority}")
+        start = time.monotonic()
+        if self._queued >= self.max_queue:
+            self.rejected += 1
+            raise RateLimitExceeded("准入队列已满", 1.0)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (PRIORITIES[priority], next(self._counter), priority, future))
+        self._queued += 1
+        # 有空闲名额时立即分配（仍按优先级顺序）
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 名额已分配但等待方被取消，归还名额
+                self.release(priority)
+            raise
+        finally:
+            self._queued -= 1
+        self._record_wait(priority, time.monotonic() - start)
+
+    def release(self, priority: str):
+        self.active[priority] -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive"):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def stats(self) -> Dict:
+        return {
+            "concurrency": self.concurrency,
+            "active": dict(self.active),
+            "queue_depth": self.depth(),
+            "admitted": dict(self.admitted),
+            "rejected": self.rejected,
+            "avg_wait_seconds": {name: self.wait_sum[name] / self.admitted[name] if self.admitted[name] else 0.0
+                                 for name in PRIORITIES},
+        }
+
+
+def render_metrics(admission: AdmissionQueue, limiter: RateLimiter) -> str:
+    """Prometheus文本格式的准入队列和限流指标"""
+    lines = [
+        "# HELP proxy_queue_depth Requests waiting for an upstream slot.",
+        "# TYPE proxy_queue_depth gauge",
+    ]
+    depth = admission.depth()
+    lines += [f'proxy_queue_depth{{priority="{name}"}} {depth[name]}' for name in PRIORITIES]
+    lines += ["# HELP proxy_active_requests Requests holding an upstream slot.",
+              "# TYPE proxy_active_requests gauge"]
+    lines += [f'proxy_active_requests{{priority="{name}"}} {admission.active[name]}' for name in PRIORITIES]
+    lines += ["# HELP proxy_queue_wait_seconds Time spent waiting for an upstream slot.",
+              "# TYPE proxy_queue_wait_seconds histogram"]
+    for name in PRIORITIES:
+        cumulative = 0
+        for bound, count in zip(WAIT_BUCKETS, admission.wait_buckets[name]):
+            cumulative += count
+            lines.append(f'proxy_queue_wait_seconds_bucket{{priority="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'proxy_queue_wait_seconds_bucket{{priority="{name}",le="+Inf"}} {admission.admitted[name]}')
+        lines.append(f'proxy_queue_wait_seconds_sum{{priority="{name}"}} {admission.wait_sum[name]:.6f}')
+        lines.append(f'proxy_queue_wait_seconds_count{{priority="{name}"}} {admission.admitted[name]}')
+    lines += ["# HELP proxy_rejected_total Requests rejected with 429.",
+              "# TYPE proxy_rejected_total counter",
+              f'proxy_rejected_total{{reason="rate_limit"}} {limiter.rejected}',
+              f'proxy_rejected_total{{reason="queue_full"}} {admission.rejected}']
+    return "\n".join(lines) + "\n"
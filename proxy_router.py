@@ -0,0 +1,374 @@
+# 多上游路由：按模型映射到上游池，最少在途请求/EWMA延迟负载均衡，健康检查、熔断、故障转移和对冲请求
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败 failure_threshold 次后打开，reset_timeout 秒内不再发送请求；
+    之后进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开
+
+    ready() 只查看状态，用于筛选候选上游；真正发请求前调用 allow()，半开状态下在同一步中占用探测名额，
+    避免多个并发请求在筛选和发送之间都通过检查
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def ready(self) -> bool:
+        """是否可以发送请求（不占用半开探测名额）"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probing = False
+        return self.state == self.HALF_OPEN and not self._probing
+
+    def allow(self) -> bool:
+        """允许发送时返回True；半开状态下同时占用唯一的探测名额"""
+        if not self.ready():
+            return False
+        if self.state == self.HALF_OPEN:
+            self._probing = True
+        return True
+
+    def release(self):
+        """探测请求被取消、没有结果时归还名额"""
+        if self.state == self.HALF_OPEN:
+            self._probing = False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class Upstream:
+    """一个OpenAI兼容的上游服务，持有自己的连接池和负载统计"""
+
+    def __init__(self, name: str, base_url: str, api_key: str, max_connections: int = 100,
+                 timeout: float = 120, ewma_alpha: float = 0.3,
+                 failure_threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key or "EMPTY"
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout, connect=10),
+        )
+        self.client = AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=base_url,
+            # 故障转移由路由器负责，客户端自身不重试
+            max_retries=0,
+            http_client=self.http_client,
+        )
+        self.ewma_alpha = ewma_alpha
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.healthy = True
+        self.outstanding = 0
+        self.ewma_latency: Optional[float] = None
+        self.requests = 0
+        self.failures = 0
+
+    def observe_latency(self, seconds: float):
+        if self.ewma_latency is None:
+            self.ewma_latency = seconds
+        else:
+            self.ewma_latency = self.ewma_alpha * seconds + (1 - self.ewma_alpha) * self.ewma_latency
+
+    async def open_stream(self, path: str, payload: Dict) -> httpx.Response:
+        """
+        发送流式请求，收到响应头后返回未读取的响应，由调用方逐块读取原始字节并负责关闭
+
+        请求 identity 编码，保证 aiter_raw 读到的就是上游的SSE字节；上游返回错误状态码时抛出 httpx.HTTPStatusError
+        """
+        request = self.http_client.build_request(
+            "POST", f"{self.base_url.rstrip('/')}/{path.lstrip('/')}", json=payload,
+            headers={"Authorization": f"Bearer {self.api_key}", "Accept": "text/event-stream",
+                     "Accept-Encoding": "identity"},
+        )
+        response = await self.http_client.send(request, stream=True)
+        if response.status_code >= 400:
+            try:
+                await response.aread()
+            finally:
+                await response.aclose()
+            response.raise_for_status()
+        return response
+
+    @asynccontextmanager
+    async def hold(self):
+        """流式响应在整个流期间计入在途请求数"""
+        self.outstanding += 1
+        try:
+            yield
+        finally:
+            self.outstanding -= 1
+
+    def stats(self) -> Dict:
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "breaker": self.breaker.state,
+            "outstanding": self.outstanding,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+def is_retryable(error: BaseException) -> bool:
+    """连接错误、超时、429和5xx可以换上游重试；其他4xx是请求本身的问题，直接返回"""
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError, httpx.TransportError,
+                          asyncio.TimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return False
+
+
+class NoUpstreamAvailable(Exception):
+    pass
+
+
+class UpstreamRouter:
+    """
+    把请求的 model 路由到上游池
+
+    - strategy="least_outstanding": 选择在途请求最少的上游，相同时选EWMA延迟低的
+    - strategy="ewma": 按 EWMA延迟 × (在途请求数+1) 选择，兼顾速度和负载
+    - 熔断打开的上游不参与选择；健康检查失败的上游排在后面，只有全部不健康时才使用，
+      真实请求成功后恢复为健康
+    - 可重试的失败（连接错误、超时、429、5xx）自动换下一个上游，最多 max_attempts 个
+    - hedge_delay 秒内主请求未返回时，向下一个上游发出对冲请求，取先成功的结果，另一个取消
+    """
+
+    def __init__(self, upstreams: List[Upstream], routes: Dict[str, List[Tuple[str, str]]],
+                 default_route: List[Tuple[str, Optional[str]]] = None, strategy: str = "least_outstanding",
+                 max_attempts: int = 2, hedge_delay: Optional[float] = None, health_interval: float = 15):
+        """
+        Args:
+            upstreams: 上游列表
+            routes: {对外模型名: [(上游名, 上游模型名)]}
+            default_route: 未配置的模型使用的上游 [(上游名, None)]，None表示沿用请求中的模型名
+            strategy: "least_outstanding" 或 "ewma"
+            max_attempts: 一个请求最多尝试的上游数
+            hedge_delay: 对冲请求的等待时间（秒），None表示不对冲
+            health_interval: 健康检查间隔（秒）
+        """
+        if strategy not in ("least_outstanding", "ewma"):
+            raise ValueError(f"不支持的负载均衡策略: {strategy}")
+        self.upstreams = {upstream.name: upstream for upstream in upstreams}
+        self.routes = routes
+        self.default_route = default_route or []
+        self.strategy = strategy
+        self.max_attempts = max(1, max_attempts)
+        self.hedge_delay = hedge_delay
+        self.health_interval = health_interval
+        self.hedged = 0
+        self.failovers = 0
+        self._health_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_config(cls, config: Dict, **overrides) -> "UpstreamRouter":
+        """
+        从配置字典创建，格式见 proxy_upstreams.example.json；
+        上游的 api_key 可以直接写，也可以用 api_key_env 指定环境变量名
+        """
+        upstreams = []
+        for item in config["upstreams"]:
+            api_key = item.get("api_key") or os.environ.get(item.get("api_key_env", ""), "")
+            upstreams.append(Upstream(
+                item["name"], item["base_url"], api_key,
+                max_connections=item.get("max_connections", 100),
+                timeout=item.get("timeout", 120),
+            ))
+        routes = {
+            model: [(target["upstream"], target.get("model", model)) for target in targets]
+            for model, targets in config.get("routes", {}).items()
+        }
+        default_route = [(name, None) for name in config.get("default_route", [])]
+        options = {key: config[key] for key in ("strategy", "max_attempts", "hedge_delay", "health_interval")
+                   if key in config}
+        options.update(overrides)
+        return cls(upstreams, routes, default_route, **options)
+
+    @classmethod
+    def from_file(cls, path: str, **overrides) -> "UpstreamRouter":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_config(json.load(f), **overrides)
+
+    def models(self) -> List[str]:
+        return list(self.routes)
+
+    def _score(self, upstream: Upstream) -> Tuple:
+        latency = upstream.ewma_latency if upstream.ewma_latency is not None else 0.0
+        if self.strategy == "ewma":
+            return (latency * (upstream.outstanding + 1), upstream.outstanding)
+        return (upstream.outstanding, latency)
+
+    def candidates(self, model: str) -> List[Tuple[Upstream, str]]:
+        """按负载排序的可用上游 [(上游, 上游模型名)]，没有健康的上游时退回到未熔断的全部上游"""
+        targets = self.routes.get(model) or [(name, upstream_model or model)
+                                             for name, upstream_model in self.default_route]
+        ready = [(self.upstreams[name], upstream_model) for name, upstream_model in targets
+                 if name in self.upstreams and self.upstreams[name].breaker.ready()]
+        # 健康检查可能误判（例如只有 /models 出错），全部不健康时仍尝试，由真实请求的结果决定
+        available = [target for target in ready if target[0].healthy] or ready
+        return sorted(available, key=lambda target: self._score(target[0]))
+
+    async def _attempt(self, upstream: Upstream, upstream_model: str,
+                       fn: Callable[[Upstream, str], Awaitable[Any]]) -> Any:
+        upstream.outstanding += 1
+        upstream.requests += 1
+        start = time.monotonic()
+        try:
+            result = await fn(upstream, upstream_model)
+        except asyncio.CancelledError:
+            # 对冲中落选被取消：已等待的时间是该上游延迟的下限，计入EWMA避免继续优先选择它
+            upstream.observe_latency(time.monotonic() - start)
+            raise
+        except Exception as e:
+            if is_retryable(e):
+                upstream.failures += 1
+                upstream.breaker.record_failure()
+            else:
+                # 4xx说明上游正常响应，只是请求本身有问题：按成功处理，半开状态的探测也据此关闭熔断
+                upstream.breaker.record_success()
+            raise
+        finally:
+            upstream.outstanding -= 1
+        upstream.observe_latency(time.monotonic() - start)
+        upstream.breaker.record_success()
+        upstream.healthy = True
+        return result
+
+    async def call(self, model: str, fn: Callable[[Upstream, str], Awaitable[Any]],
+                   discard: Callable[[Any], Awaitable[None]] = None) -> Tuple[Any, Upstream]:
+        """
+        选择上游执行 fn(upstream, upstream_model)，返回 (结果, 实际使用的上游)
+
+        Args:
+            model: 请求中的模型名
+            fn: 对一个上游发起请求的协程函数
+            discard: 对冲请求中落选的结果的清理函数（例如关闭已打开的流）
+        """
+        targets = self.candidates(model)[:self.max_attempts]
+        if not targets:
+            raise NoUpstreamAvailable(f"模型 {model} 没有可用的上游")
+
+        pending: Dict[asyncio.Task, Upstream] = {}
+        next_target = 0
+        last_error: Optional[BaseException] = None
+
+        def launch() -> bool:
+            """向下一个熔断器放行的上游发出请求；没有可用上游时返回False"""
+            nonlocal next_target
+            while next_target < len(targets):
+                upstream, upstream_model = targets[next_target]
+                next_target += 1
+                if upstream.breaker.allow():
+                    task = asyncio.ensure_future(self._attempt(upstream, upstream_model, fn))
+                    # 被取消的请求（包括还没开始执行就被取消的）没有结果，归还半开探测名额
+                    task.add_done_callback(lambda t, breaker=upstream.breaker: t.cancelled() and breaker.release())
+                    pending[task] = upstream
+                    return True
+            return False
+
+        if not launch():
+            raise NoUpstreamAvailable(f"模型 {model} 没有可用的上游")
+        try:
+            while pending:
+                can_hedge = self.hedge_delay is not None and next_target < len(targets)
+                done, _ = await asyncio.wait(pending, timeout=self.hedge_delay if can_hedge else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # 对冲：主请求超过 hedge_delay 仍未返回
+                    if launch():
+                        self.hedged += 1
+                    continue
+                for task in done:
+                    upstream = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        return task.result(), upstream
+                    if not is_retryable(error):
+                        raise error
+                    last_error = error
+                if not pending and next_target < len(targets):
+                    # 故障转移：换下一个上游
+                    if launch():
+                        self.failovers += 1
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                results = await asyncio.gather(*pending, return_exceptions=True)
+                if discard is not None:
+                    for result in results:
+                        if not isinstance(result, BaseException):
+                            await discard(result)
+
+    async def _check(self, upstream: Upstream):
+        try:
+            await asyncio.wait_for(upstream.client.models.list(), timeout=5)
+            upstream.healthy = True
+        except Exception as e:
+            # 4xx（如上游未实现 /models）不代表服务不可用
+            if not is_retryable(e):
+                upstream.healthy = True
+                return
+            if upstream.healthy:
+                print(f"上游 {upstream.name} 健康检查失败: {e!r}")
+            upstream.healthy = False
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.gather(*(self._check(upstream) for upstream in self.upstreams.values()))
+            await asyncio.sleep(self.health_interval)
+
+    def start(self):
+        """在事件循环中启动后台健康检查"""
+        if self._health_task is None and self.health_interval:
+            self._health_task = asyncio.ensure_future(self._health_loop())
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for upstream in self.upstreams.values():
+            await upstream.client.close()
+
+    def stats(self) -> Dict:
+        return {
+            "strategy": self.strategy,
+            "hedged": self.hedged,
+            "failovers": self.failovers,
+            "upstreams": {name: upstream.stats() for name, upstream in self.upstreams.items()},
+        }
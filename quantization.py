@@ -0,0 +1,171 @@
+# 向量压缩：float16 / 8bit标量量化 / 乘积量化(PQ)，在压缩码上直接计算内积
+from typing import Dict
+
+import numpy as np
+
+
+class Float16Codec:
+    """float16存储，内存减半，计算时按块转换为float32"""
+
+    name = "fp16"
+
+    def train(self, vectors: np.ndarray):
+        pass
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float16)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32)
+
+    def score(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """返回 (Q, N) 近似内积"""
+        return queries @ codes.astype(np.float32).T
+
+    def bytes_per_vector(self, dim: int) -> int:
+        return 2 * dim
+
+    def get_params(self) -> Dict:
+        return {}
+
+
+class ScalarQuantizer:
+    """
+    8bit标量量化：每个维度独立记录最小值和步长，x ≈ vmin + scale * code
+
+    内积可以直接在码上计算: q·x = q·vmin + (q*scale)·code，每个向量只占 dim 字节
+    """
+
+    name = "sq8"
+
+    def __init__(self):
+        self.vmin = None
+        self.scale = None
+
+    def train(self, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.vmin = vectors.min(axis=0)
+        vmax = vectors.max(axis=0)
+        self.scale = np.maximum(vmax - self.vmin, 1e-12) / 255.0
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((np.asarray(vectors, dtype=np.float32) - self.vmin) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return self.vmin + codes.astype(np.float32) * self.scale
+
+    def score(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        offset = queries @ self.vmin
+        return (queries * self.scale) @ codes.astype(np.float32).T + offset[:, None]
+
+    def bytes_per_vector(self, dim: int) -> int:
+        return dim
+
+    def get_params(self) -> Dict:
+        return {}
+
+
+class ProductQuantizer:
+    """
+    乘积量化：把向量切成m个子空间，每个子空间用ksub个质心的编号表示
+
+    检索使用非对称距离计算(ADC)：查询保持原始精度，先为每个子空间计算查询与全部质心的内积表，
+    再按码查表求和。每个向量只占 m 字节（ksub<=256）。
+    """
+
+    name = "pq"
+
+    def __init__(self, m: int = 64, ksub: int = 256, train_iters: int = 15, seed: int = 0):
+        """
+        Args:
+            m: 子空间数量，必须整除向量维度（bge-m3的1024维常用 64 或 128）
+            ksub: 每个子空间的质心数量，最大256
+            train_iters: 每个子空间k-means的迭代次数
+            seed: 随机种子
+        """
+        if ksub > 256:
+            raise ValueError("ksub最大为256")
+        self.m = m
+        self.ksub = ksub
+        self.train_iters = train_iters
+        self.seed = seed
+        self.codebooks = None  # (m, ksub, dsub)
+
+    def train(self, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        dim = vectors.shape[1]
+        if dim % self.m != 0:
+            raise ValueError(f"子空间数量 m={self.m} 必须整除向量维度 {dim}")
+        dsub = dim // self.m
+        ksub = min(self.ksub, len(vectors))
+
+        self.codebooks = np.zeros((self.m, ksub, dsub), dtype=np.float32)
+        for j in range(self.m):
+            sub = vectors[:, j * dsub:(j + 1) * dsub]
+            self.codebooks[j] = train_kmeans_l2(sub, ksub, self.train_iters, self.seed + j)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        dsub = self.codebooks.shape[2]
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            sub = vectors[:, j * dsub:(j + 1) * dsub]
+            codes[:, j] = assign_l2(sub, self.codebooks[j])
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = [self.codebooks[j][codes[:, j]] for j in range(self.m)]
+        return np.hstack(parts)
+
+    def score(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        dsub = self.codebooks.shape[2]
+        # 内积查找表 (Q, m, ksub)
+        tables = np.einsum("qmd,mkd->qmk", queries.reshape(len(queries), self.m, dsub), self.codebooks)
+        subspaces = np.arange(self.m)
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for row, table in enumerate(tables):
+            scores[row] = table[subspaces, codes].sum(axis=1)
+        return scores
+
+    def bytes_per_vector(self, dim: int) -> int:
+        return self.m
+
+    def get_params(self) -> Dict:
+        return {"m": self.m, "ksub": self.ksub}
+
+
+def assign_l2(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """返回每个向量欧氏距离最近的质心编号"""
+    # ||x-c||^2 = ||x||^2 - 2x·c + ||c||^2，||x||^2 对argmin无影响
+    distances = (centroids ** 2).sum(axis=1) - 2 * vectors @ centroids.T
+    return np.argmin(distances, axis=1)
+
+
+def train_kmeans_l2(vectors: np.ndarray, k: int, iters: int = 15, seed: int = 0,
+                    max_samples_per_centroid: int = 256) -> np.ndarray:
+    """欧氏距离k-means，返回 (k, dim) 质心"""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > k * max_samples_per_centroid:
+        vectors = vectors[rng.choice(len(vectors), k * max_samples_per_centroid, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+
+    for _ in range(iters):
+        assignments = assign_l2(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=k)
+        empty = counts == 0
+        if empty.any():
+            # 空簇用随机样本重新初始化
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+            counts[empty] = 1
+        centroids = sums / counts[:, None]
+    return centroids.astype(np.float32)
+
+
+CODECS = {
+    "fp16": Float16Codec,
+    "sq8": ScalarQuantizer,
+    "pq": ProductQuantizer,
+}
@@ -0,0 +1,334 @@
+# 稀疏（词法）检索：BM25倒排索引，压缩倒排表 + Block-Max WAND top-k，以及稠密/稀疏结果融合
+import heapq
+import math
+import re
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 英文/数字词（保留 E-1001、v1.2、order_id 这类带连接符的整体），中文按单字切分
+TOKEN_PATTERN = re.compile(r"[0-9a-z]+(?:[._\-][0-9a-z]+)*|[\u4e00-\u9fff]")
+CJK_PATTERN = re.compile(r"[\u4e00-\u9fff]")
+
+
+def tokenize(text: str) -> List[str]:
+    """分词：英文按词、中文按单字，并为相邻汉字额外生成二元组"""
+    tokens = []
+    previous_cjk = None
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if CJK_PATTERN.match(token):
+            tokens.append(token)
+            if previous_cjk is not None:
+                tokens.append(previous_cjk + token)
+            previous_cjk = token
+        else:
+            tokens.append(token)
+            previous_cjk = None
+    return tokens
+
+
+def lexical_weights(text: str) -> Dict[str, float]:
+    """基于词频的词法权重（与 BGEM3FlagModel 的 lexical_weights 格式一致: {token: weight}）"""
+    counts = Counter(tokenize(text))
+    if not counts:
+        return {}
+    peak = max(counts.values())
+    return {token: count / peak for token, count in counts.items()}
+
+
+def _encode_varint(value: int, out: bytearray):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+class PostingList:
+    """
+    单个词的倒排表
+
+    按文档号递增追加，每 BLOCK_SIZE 条为一块；块内存储 (文档号差值, 词频) 的varint编码。
+    每块记录最后一个文档号、字节偏移、最大词频和最短文档长度，用于跳块和计算块内得分上界。
+    """
+
+    BLOCK_SIZE = 128
+
+    def __init__(self):
+        self.data = bytearray()
+        self.block_last_doc: List[int] = []
+        self.block_offset: List[int] = []
+        self.block_max_tf: List[int] = []
+        self.block_min_len: List[int] = []
+        self.count = 0
+        self._block_fill = 0
+
+    def append(self, doc_id: int, tf: int, doc_len: int):
+        if self._block_fill == 0 or self._block_fill == self.BLOCK_SIZE:
+            # 新块的第一个文档号存绝对值，块可独立解码
+            self.block_offset.append(len(self.data))
+            self.block_last_doc.append(doc_id)
+            self.block_max_tf.append(tf)
+            self.block_min_len.append(doc_len)
+            _encode_varint(doc_id, self.data)
+            self._block_fill = 1
+        else:
+            _encode_varint(doc_id - self.block_last_doc[-1], self.data)
+            self.block_last_doc[-1] = doc_id
+            self.block_max_tf[-1] = max(self.block_max_tf[-1], tf)
+            self.block_min_len[-1] = min(self.block_min_len[-1], doc_len)
+            self._block_fill += 1
+        _encode_varint(tf, self.data)
+        self.count += 1
+
+    def decode_block(self, block: int) -> Tuple[List[int], List[int]]:
+        """解码一个块，返回 (文档号列表, 词频列表)"""
+        start = self.block_offset[block]
+        end = self.block_offset[block + 1] if block + 1 < len(self.block_offset) else len(self.data)
+        data = self.data
+        doc_ids, tfs = [], []
+        values = []
+        value, shift = 0, 0
+        for pos in range(start, end):
+            byte = data[pos]
+            value |= (byte & 0x7F) << shift
+            if byte & 0x80:
+                shift += 7
+            else:
+                values.append(value)
+                value, shift = 0, 0
+        doc_id = 0
+        for i in range(0, len(values), 2):
+            doc_id = values[i] if i == 0 else doc_id + values[i]
+            doc_ids.append(doc_id)
+            tfs.append(values[i + 1])
+        return doc_ids, tfs
+
+    def nbytes(self) -> int:
+        return len(self.data)
+
+
+class _Cursor:
+    """检索时遍历一个词的倒排表"""
+
+    def __init__(self, postings: PostingList, idf: float, index: "BM25Index"):
+        self.postings = postings
+        self.idf = idf
+        self.index = index
+        self.block = -1
+        self.doc_ids: List[int] = []
+        self.tfs: List[int] = []
+        self.pos = 0
+        self.max_score = max(self.block_score(b) for b in range(len(postings.block_offset)))
+        self._load_block(0)
+
+    def _load_block(self, block: int):
+        if block >= len(self.postings.block_offset):
+            self.block = block
+            self.doc_ids, self.tfs, self.pos = [], [], 0
+            return
+        self.block = block
+        self.doc_ids, self.tfs = self.postings.decode_block(block)
+        self.pos = 0
+
+    def doc(self) -> float:
+        return self.doc_ids[self.pos] if self.pos < len(self.doc_ids) else math.inf
+
+    def score(self) -> float:
+        doc_id = self.doc_ids[self.pos]
+        return self.index.term_score(self.idf, self.tfs[self.pos], self.index.doc_lengths[doc_id])
+
+    def block_score(self, block: int) -> float:
+        return self.index.term_score(self.idf, self.postings.block_max_tf[block], self.postings.block_min_len[block])
+
+    def shallow_block(self, target: int) -> int:
+        """不解码，返回包含 >=target 的第一个文档的块号"""
+        return bisect_left(self.postings.block_last_doc, target, lo=max(self.block, 0))
+
+    def block_bound(self, target: int) -> Tuple[float, float]:
+        """返回包含 >=target 的块的 (得分上界, 最后文档号)，没有这样的块时为 (0, inf)"""
+        block = self.shallow_block(target)
+        if block >= len(self.postings.block_last_doc):
+            return 0.0, math.inf
+        return self.block_score(block), self.postings.block_last_doc[block]
+
+    def next(self):
+        self.pos += 1
+        if self.pos >= len(self.doc_ids):
+            self._load_block(self.block + 1)
+
+    def next_geq(self, target: int):
+        """移动到第一个文档号 >= target 的位置，按块跳过"""
+        if self.doc() >= target:
+            return
+        block = self.shallow_block(target)
+        if block != self.block:
+            self._load_block(block)
+        if self.doc_ids:
+            self.pos = bisect_left(self.doc_ids, target)
+            if self.pos >= len(self.doc_ids):
+                self._load_block(self.block + 1)
+
+
+class BM25Index:
+    """
+    BM25倒排索引
+
+    文档号即文档在检索系统中的位置，只支持追加；删除/更新文档后由调用方调用 build 重建
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, PostingList] = {}
+        self.doc_lengths = np.zeros(0, dtype=np.int32)
+        self.num_docs = 0
+        self.total_length = 0
+
+    def build(self, texts: Iterable[str]):
+        """清空并用全部文本重建索引"""
+        self.postings = {}
+        self.doc_lengths = np.zeros(0, dtype=np.int32)
+        self.num_docs = 0
+        self.total_length = 0
+        self.add_documents(texts)
+
+    def add_documents(self, texts: Iterable[str]):
+        """追加文档，文档号顺延"""
+        lengths = []
+        for text in texts:
+            tokens = tokenize(text)
+            doc_id = self.num_docs
+            for term, tf in Counter(tokens).items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = PostingList()
+                postings.append(doc_id, tf, max(len(tokens), 1))
+            lengths.append(max(len(tokens), 1))
+            self.num_docs += 1
+            self.total_length += len(tokens)
+        if lengths:
+            self.doc_lengths = np.concatenate([self.doc_lengths, np.array(lengths, dtype=np.int32)])
+
+    def idf(self, term: str) -> float:
+        postings = self.postings.get(term)
+        df = postings.count if postings is not None else 0
+        return math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+
+    def term_score(self, idf: float, tf: int, doc_len: int) -> float:
+        avg_len = self.total_length / self.num_docs if self.num_docs else 1.0
+        norm = self.k1 * (1 - self.b + self.b * doc_len / max(avg_len, 1e-9))
+        return idf * tf * (self.k1 + 1) / (tf + norm)
+
+    def search(self, query: str, top_k: int = 10, allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Block-Max WAND检索top_k
+
+        Args:
+            query: 查询文本
+            top_k: 返回数量
+            allowed: 可选的布尔数组，只返回 allowed[doc_id] 为True的文档
+
+        Returns:
+            按得分降序的 [(doc_id, score)]
+        """
+        terms = [term for term in set(tokenize(query)) if term in self.postings]
+        if not terms or top_k <= 0:
+            return []
+        cursors = [_Cursor(self.postings[term], self.idf(term), self) for term in terms]
+
+        heap: List[Tuple[float, int]] = []
+        threshold = 0.0
+        while True:
+            cursors.sort(key=lambda c: c.doc())
+            # 找到pivot：前缀得分上界之和首次超过当前阈值的位置
+            upper = 0.0
+            pivot = -1
+            for i, cursor in enumerate(cursors):
+                if cursor.doc() == math.inf:
+                    break
+                upper += cursor.max_score
+                if upper > threshold:
+                    pivot = i
+                    break
+            if pivot < 0:
+                break
+            pivot_doc = cursors[pivot].doc()
+            while pivot + 1 < len(cursors) and cursors[pivot + 1].doc() == pivot_doc:
+                pivot += 1
+
+            # 块级上界检查：pivot所在块的得分上界之和不超过阈值时，跳过这些块
+            bounds = [c.block_bound(pivot_doc) for c in cursors[:pivot + 1]]
+            if sum(bound for bound, _ in bounds) <= threshold:
+                next_doc = min(last_doc + 1 for _, last_doc in bounds)
+                if pivot + 1 < len(cursors):
+                    next_doc = min(next_doc, cursors[pivot + 1].doc())
+                for cursor in cursors[:pivot + 1]:
+                    cursor.next_geq(next_doc)
+                continue
+
+            if cursors[0].doc() == pivot_doc:
+                if allowed is None or allowed[pivot_doc]:
+                    score = sum(c.score() for c in cursors[:pivot + 1])
+                    if len(heap) < top_k:
+                        heapq.heappush(heap, (score, pivot_doc))
+                    elif score > heap[0][0]:
+                        heapq.heapreplace(heap, (score, pivot_doc))
+                    if len(heap) == top_k:
+                        threshold = heap[0][0]
+                for cursor in cursors[:pivot + 1]:
+                    cursor.next()
+            else:
+                for cursor in cursors[:pivot]:
+                    cursor.next_geq(pivot_doc)
+
+        return sorted(((doc_id, score) for score, doc_id in heap), key=lambda item: -item[1])
+
+    def get_statistics(self) -> Dict:
+        return {
+            "documents": self.num_docs,
+            "terms": len(self.postings),
+            "postings": sum(p.count for p in self.postings.values()),
+            "postings_bytes": sum(p.nbytes() for p in self.postings.values()),
+        }
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60,
+                           weights: List[float] = None) -> List[Tuple[int, float]]:
+    """
+    倒数排名融合(RRF)：score(d) = Σ w_i / (k + rank_i(d))
+
+    Args:
+        rankings: 多个按相关性排好序的文档号列表
+        k: 平滑常数
+        weights: 每个排序的权重，默认相同
+
+    Returns:
+        按融合得分降序的 [(doc_id, score)]
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores: Dict[int, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+def weighted_score_fusion(score_maps: List[Dict[int, float]], weights: List[float]) -> List[Tuple[int, float]]:
+    """
+    加权得分融合：每路得分先做min-max归一化，缺失的文档按0计
+
+    Returns:
+        按融合得分降序的 [(doc_id, score)]
+    """
+    fused: Dict[int, float] = {}
+    for scores, weight in zip(score_maps, weights):
+        if not scores:
+            continue
+        low, high = min(scores.values()), max(scores.values())
+        span = high - low
+        for doc_id, score in scores.items():
+            normalized = (score - low) / span if span > 0 else 1.0
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight * normalized
+    return sorted(fused.items(), key=lambda item: -item[1])
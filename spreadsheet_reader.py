@@ -0,0 +1,195 @@
+# 表格流式读取：按行（或每N行）生成带列名上下文的文档，大JSON单元格拆为独立文本块
+import csv
+import json
+import os
+from datetime import datetime, date, time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+SPREADSHEET_EXTENSIONS = {".xls", ".xlsx", ".xlsm", ".csv"}
+
+
+def _format_value(value: Any) -> str:
+    """单元格取值转为文本，整数形式的浮点数去掉.0，空值返回空串"""
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        if value != value:
+            return ""
+        if value.is_integer():
+            return str(int(value))
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return str(value).strip()
+
+
+def _iter_xls(path: str, sheets: Optional[List[str]]) -> Iterator[Tuple[str, int, List[Any]]]:
+    import xlrd
+
+    # on_demand: 工作表按需加载，处理完立即释放
+    book = xlrd.open_workbook(path, on_demand=True)
+    try:
+        for name in book.sheet_names():
+            if sheets is not None and name not in sheets:
+                continue
+            sheet = book.sheet_by_name(name)
+            for row in range(sheet.nrows):
+                values = []
+                for cell_type, value in zip(sheet.row_types(row), sheet.row_values(row)):
+                    if cell_type == xlrd.XL_CELL_DATE:
+                        value = xlrd.xldate_as_datetime(value, book.datemode)
+                    values.append(value)
+                yield name, row + 1, values
+            book.unload_sheet(name)
+    finally:
+        book.release_resources()
+
+
+def _iter_xlsx(path: str, sheets: Optional[List[str]]) -> Iterator[Tuple[str, int, List[Any]]]:
+    import openpyxl
+
+    # read_only: 逐行解析XML，不在内存中构建整个工作簿
+    book = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for name in book.sheetnames:
+            if sheets is not None and name not in sheets:
+                continue
+            for row_number, values in enumerate(book[name].iter_rows(values_only=True), 1):
+                yield name, row_number, list(values)
+    finally:
+        book.close()
+
+
+def _iter_csv(path: str, sheets: Optional[List[str]]) -> Iterator[Tuple[str, int, List[Any]]]:
+    name = os.path.splitext(os.path.basename(path))[0]
+    with open(path, "r", encoding="utf-8-sig", errors="replace", newline="") as f:
+        for row_number, values in enumerate(csv.reader(f), 1):
+            yield name, row_number, values
+
+
+def iter_rows(path: str, sheets: List[str] = None) -> Iterator[Tuple[str, int, List[Any]]]:
+    """
+    逐行读取表格文件
+
+    Args:
+        path: .xls / .xlsx / .xlsm / .csv 文件路径
+        sheets: 只读取这些工作表，默认全部
+
+    Yields:
+        (工作表名, 行号（从1开始）, 单元格取值列表)
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".xls":
+        return _iter_xls(path, sheets)
+    if extension in (".xlsx", ".xlsm"):
+        return _iter_xlsx(path, sheets)
+    if extension == ".csv":
+        return _iter_csv(path, sheets)
+    raise ValueError(f"不支持的表格格式: {extension}")
+
+
+def _parse_json_cell(text: str) -> Optional[Any]:
+    if not text or text[0] not in "{[":
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+
+def split_json_text(value: Any, max_chars: int) -> List[str]:
+    """把JSON格式化为缩进文本后按行切分，每段不超过max_chars（单行超长时单独成段）"""
+    lines = json.dumps(value, ensure_ascii=False, indent=1).splitlines()
+    parts, current, length = [], [], 0
+    for line in lines:
+        if current and length + len(line) + 1 > max_chars:
+            parts.append("\n".join(current))
+            current, length = [], 0
+        current.append(line)
+        length += len(line) + 1
+    if current:
+        parts.append("\n".join(current))
+    return parts
+
+
+def iter_row_documents(path: str, rows_per_doc: int = 1, header_row: int = 1,
+                       sheets: List[str] = None, json_cell_threshold: int = 300,
+                       json_chunk_chars: int = 400) -> Iterator[Dict]:
+    """
+    按行把表格转换为文档 {"text", "metadata"}，可直接作为 AdvancedRetrievalSystem.ingest 的数据源
+
+    每行渲染为 "列名: 取值" 的Markdown列表，空单元格省略；超过 json_cell_threshold 个字符的
+    JSON单元格不放在行文档里，而是格式化后按 json_chunk_chars 切成独立文档，
+    每段都带 工作表/行号/列名 作为上下文。整个过程只在内存中保留当前行。
+
+    Args:
+        path: 表格文件路径
+        rows_per_doc: 每个文档包含的行数
+        header_row: 列名所在的行号，之前的行忽略
+        sheets: 只读取这些工作表，默认全部
+        json_cell_threshold: 拆分为独立文档的JSON单元格的最小长度
+        json_chunk_chars: JSON文档每段的最大字符数，默认值小于 TextChunker 的块大小，导入时不会再被切分
+
+    Yields:
+        元数据包含 source / sheet / row（起始行号），JSON文档额外包含 column / part
+    """
+    headers: Dict[str, List[str]] = {}
+    pending: List[str] = []
+    pending_sheet, pending_row = None, None
+
+    def flush():
+        text = "\n\n".join(pending)
+        return {"text": text, "metadata": {"source": path, "sheet": pending_sheet, "row": pending_row}}
+
+    for sheet, row_number, values in iter_rows(path, sheets):
+        if sheet != pending_sheet and pending:
+            yield flush()
+            pending = []
+        if row_number < header_row:
+            continue
+        if row_number == header_row:
+            headers[sheet] = [_format_value(v) or f"列{i + 1}" for i, v in enumerate(values)]
+            continue
+        columns = headers.get(sheet, [])
+
+        lines, json_cells = [], []
+        for i, value in enumerate(values):
+            text = _format_value(value)
+            if not text:
+                continue
+            column = columns[i] if i < len(columns) else f"列{i + 1}"
+            parsed = _parse_json_cell(text) if len(text) > json_cell_threshold else None
+            if parsed is not None:
+                json_cells.append((column, parsed))
+                lines.append(f"- **{column}**: (JSON，见单独文本块)")
+            else:
+                lines.append(f"- **{column}**: {text}")
+        if not lines:
+            continue
+
+        if not pending:
+            pending_sheet, pending_row = sheet, row_number
+        pending.append(f"### {sheet} 第{row_number}行\n" + "\n".join(lines))
+        if len(pending) >= rows_per_doc:
+            yield flush()
+            pending = []
+
+        for column, parsed in json_cells:
+            parts = split_json_text(parsed, json_chunk_chars)
+            for part_index, part in enumerate(parts):
+                header = f"### {sheet} 第{row_number}行 {column}"
+                if len(parts) > 1:
+                    header += f" ({part_index + 1}/{len(parts)})"
+                yield {
+                    "text": f"{header}\n```json\n{part}\n```",
+                    "metadata": {"source": path, "sheet": sheet, "row": row_number,
+                                 "column": column, "part": part_index},
+                }
+
+    if pending:
+        yield flush()
+
+
+def iter_markdown(path: str, **kwargs) -> Iterator[str]:
+    """逐段输出表格的Markdown文本，用于替代一次性转换整张表"""
+    for document in iter_row_documents(path, **kwargs):
+        yield document["text"] + "\n\n"
@@ -0,0 +1,5 @@
+# 仓库模块都在根目录，测试直接按模块名导入
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,74 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+from advanced_retrieval_system import AdvancedRetrievalSystem
+from ingestion import TextChunker, ingest
+
+DIM = 8
+
+
+def fake_encode(texts, *args, **kwargs):
+    vectors = []
+    for text in texts:
+        seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+        vectors.append(np.random.default_rng(seed).standard_normal(DIM))
+    vectors = np.array(vectors, dtype=np.float32)
+    return {"dense_vecs": vectors / np.linalg.norm(vectors, axis=1, keepdims=True)}
+
+
+@pytest.fixture
+def system():
+    system = AdvancedRetrievalSystem()
+    system.model.encode = fake_encode
+    texts = [f"old chunk {i}" for i in range(10)]
+    system.add_embedded_documents(texts, fake_encode(texts)["dense_vecs"],
+                                  [{"source": "doc", "chunk_index": i} for i in range(10)])
+    return system
+
+
+def new_source():
+    text = "\n\n".join(f"New sentence {i:02d}." for i in range(10))
+    return (text, {"source": "doc"})
+
+
+def run_ingest(system):
+    return ingest(system, [new_source()], chunker=TextChunker(chunk_size=20, chunk_overlap=0),
+                  batch_size=2, replace_existing=True)
+
+
+def old_chunks(system):
+    return [text for text in system.documents if text.startswith("old chunk")]
+
+
+def test_replace_existing_after_normal_finish(system):
+    for _ in run_ingest(system):
+        pass
+    assert old_chunks(system) == []
+    assert len(system.documents) == 10
+
+
+def test_early_close_keeps_old_chunks(system):
+    progress = run_ingest(system)
+    next(progress)
+    progress.close()
+    assert len(old_chunks(system)) == 10
+    assert len(system.documents) == 12
+
+
+def test_failure_keeps_old_chunks(system):
+    calls = []
+
+    def failing_encode(texts, *args, **kwargs):
+        calls.append(texts)
+        if len(calls) == 2:
+            raise RuntimeError("embedding failed")
+        return fake_encode(texts)
+
+    system.model.encode = failing_encode
+    with pytest.raises(RuntimeError):
+        for _ in run_ingest(system):
+            pass
+    assert len(old_chunks(system)) == 10
+    assert len(system.documents) == 12
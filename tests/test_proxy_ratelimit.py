@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from proxy_ratelimit import RateLimiter
+
+
+def test_settle_uses_amount_actually_charged():
+    async def main():
+        limiter = RateLimiter(default_key={"tpm": 600, "burst_seconds": 10})
+        bucket = limiter._default_limit.tokens
+        # 预估超过桶容量（100）时只扣整桶，按实际用量修正后应只扣实际用量
+        reservation = await limiter.acquire("k", "m", 1000, "interactive")
+        reservation.settle(30)
+        assert bucket.tokens == pytest.approx(70, abs=0.5)
+        reservation.refund()
+        assert bucket.tokens == pytest.approx(100, abs=0.5)
+
+    asyncio.run(main())
+
+
+def test_cancelled_wait_refunds_reservation():
+    async def main():
+        limiter = RateLimiter(default_key={"rpm": 60, "tpm": 600, "burst_seconds": 1}, max_wait=30)
+        await limiter.acquire("k", "m", 10, "interactive")
+        requests, tokens = limiter._default_limit.requests, limiter._default_limit.tokens
+        waiting = asyncio.ensure_future(limiter.acquire("k", "m", 10, "interactive"))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert requests.tokens == pytest.approx(0, abs=0.1)
+        assert tokens.tokens == pytest.approx(0, abs=0.5)
+
+    asyncio.run(main())
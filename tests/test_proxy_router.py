@@ -0,0 +1,84 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from proxy_router import CircuitBreaker, NoUpstreamAvailable, Upstream, UpstreamRouter
+
+
+def make_router():
+    upstream = Upstream("a", "http://upstream.invalid/v1", "key")
+    router = UpstreamRouter([upstream], {}, [("a", None)], health_interval=0)
+    return router, upstream
+
+
+def open_breaker(upstream: Upstream):
+    upstream.breaker.state = CircuitBreaker.OPEN
+    upstream.breaker.opened_at = -upstream.breaker.reset_timeout
+
+
+def bad_request(*args):
+    response = httpx.Response(400, request=httpx.Request("POST", "http://upstream.invalid/v1/chat/completions"))
+    raise openai.BadRequestError("bad request", response=response, body=None)
+
+
+async def ok(upstream, model):
+    return upstream.name
+
+
+def test_half_open_probe_with_4xx_closes_breaker():
+    async def main():
+        router, upstream = make_router()
+        open_breaker(upstream)
+
+        async def probe(upstream, model):
+            bad_request()
+
+        with pytest.raises(openai.BadRequestError):
+            await router.call("m", probe)
+        assert upstream.breaker.state == CircuitBreaker.CLOSED
+        assert (await router.call("m", ok))[0] == "a"
+        await router.close()
+
+    asyncio.run(main())
+
+
+def test_half_open_allows_single_probe():
+    async def main():
+        router, upstream = make_router()
+        open_breaker(upstream)
+        release = asyncio.Event()
+
+        async def slow(upstream, model):
+            await release.wait()
+            return upstream.name
+
+        probe = asyncio.ensure_future(router.call("m", slow))
+        await asyncio.sleep(0)
+        with pytest.raises(NoUpstreamAvailable):
+            await router.call("m", ok)
+        release.set()
+        assert (await probe)[0] == "a"
+        assert upstream.breaker.state == CircuitBreaker.CLOSED
+        await router.close()
+
+    asyncio.run(main())
+
+
+def test_cancelled_probe_releases_slot():
+    async def main():
+        router, upstream = make_router()
+        open_breaker(upstream)
+
+        async def hang(upstream, model):
+            await asyncio.sleep(10)
+
+        probe = asyncio.ensure_future(router.call("m", hang))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+        assert (await router.call("m", ok))[0] == "a"
+        await router.close()
+
+    asyncio.run(main())
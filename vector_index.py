@@ -0,0 +1,456 @@
+# 向量索引：精确检索 / IVF-Flat / HNSW / 压缩存储(fp16、sq8、pq)，可插拔替换
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from quantization import Float16Codec, ScalarQuantizer, ProductQuantizer
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+def select_top_k(similarities: np.ndarray, top_k: int, threshold: float = None):
+    """
+    对每一行相似度选出top_k，只对k个候选排序
+
+    Args:
+        similarities: (Q, D) 相似度矩阵
+        top_k: 每行返回的数量
+        threshold: 相似度阈值，为None时不过滤
+
+    Returns:
+        (indices, scores, mask)，形状均为 (Q, k)，按相似度降序；mask标记达到阈值的位置
+    """
+    num_rows, num_docs = similarities.shape
+    k = max(0, min(top_k, num_docs))
+    if k == 0:
+        empty = np.empty((num_rows, 0))
+        return empty.astype(np.int64), empty, empty.astype(bool)
+
+    if k < num_docs:
+        candidates = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(num_docs), (num_rows, num_docs))
+    candidate_scores = np.take_along_axis(similarities, candidates, axis=1)
+
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    indices = np.take_along_axis(candidates, order, axis=1)
+    scores = np.take_along_axis(candidate_scores, order, axis=1)
+
+    if threshold is None:
+        mask = np.ones(scores.shape, dtype=bool)
+    else:
+        mask = scores >= threshold
+    return indices, scores, mask
+
+
+class VectorIndex:
+    """
+    向量索引基类（内积相似度，向量应已标准化）
+
+    行号即文档在检索系统中的位置；search 返回 (indices, scores)，形状为 (Q, k)，
+    结果不足k个时 indices 用 -1 填充、scores 用 -inf 填充
+    """
+
+    name = "base"
+
+    def build(self, embeddings: np.ndarray):
+        """用全部向量（重新）构建索引"""
+        raise NotImplementedError
+
+    def add(self, embeddings: np.ndarray):
+        """追加向量，行号接在已有向量之后"""
+        raise NotImplementedError
+
+    def search(self, queries: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+    def set_search_params(self, **params):
+        """调整检索参数（如 nprobe / ef_search），不需要重建索引"""
+        for key, value in params.items():
+            if not hasattr(self, key):
+                raise ValueError(f"{self.name} 索引不支持参数: {key}")
+            setattr(self, key, value)
+
+    def get_params(self) -> Dict:
+        return {}
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class FlatIndex(VectorIndex):
+    """精确检索：与全部向量做内积"""
+
+    name = "flat"
+
+    def __init__(self):
+        self.vectors = None
+
+    def build(self, embeddings: np.ndarray):
+        self.vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    def add(self, embeddings: np.ndarray):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        self.vectors = embeddings.copy() if self.vectors is None else np.vstack([self.vectors, embeddings])
+
+    def search(self, queries: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        similarities = np.asarray(queries, dtype=np.float32) @ self.vectors.T
+        indices, scores, _ = select_top_k(similarities, top_k)
+        return indices, scores
+
+    def __len__(self):
+        return 0 if self.vectors is None else len(self.vectors)
+
+
+class IVFFlatIndex(VectorIndex):
+    """
+    倒排文件索引：k-means将向量划分为nlist个簇，检索时只扫描与查询最接近的nprobe个簇
+
+    安装了 faiss-cpu 时使用 faiss.IndexIVFFlat，否则使用numpy实现
+    """
+
+    name = "ivf"
+
+    def __init__(self, nlist: int = 100, nprobe: int = 8, train_iters: int = 20,
+                 use_faiss: bool = True, seed: int = 0):
+        """
+        Args:
+            nlist: 簇的数量，通常取 sqrt(N) 到 4*sqrt(N)
+            nprobe: 检索时扫描的簇数量，越大召回越高、越慢
+            train_iters: k-means迭代次数
+            use_faiss: faiss可用时是否使用faiss
+            seed: k-means随机种子
+        """
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_iters = train_iters
+        self.use_faiss = use_faiss and faiss is not None
+        self.seed = seed
+        self.centroids = None
+        self._faiss_index = None
+        self._list_ids: List[np.ndarray] = []
+        self._list_vectors: List[np.ndarray] = []
+        self._count = 0
+
+    def build(self, embeddings: np.ndarray):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        nlist = max(1, min(self.nlist, len(embeddings)))
+        self._count = 0
+
+        if self.use_faiss:
+            quantizer = faiss.IndexFlatIP(embeddings.shape[1])
+            self._faiss_index = faiss.IndexIVFFlat(quantizer, embeddings.shape[1], nlist,
+                                                   faiss.METRIC_INNER_PRODUCT)
+            self._faiss_index.train(embeddings)
+            self._quantizer = quantizer  # faiss不持有quantizer的Python引用
+        else:
+            self.centroids = train_kmeans(embeddings, nlist, self.train_iters, self.seed)
+            self._list_ids = [np.empty(0, dtype=np.int64) for _ in range(nlist)]
+            self._list_vectors = [np.empty((0, embeddings.shape[1]), dtype=np.float32) for _ in range(nlist)]
+        self.add(embeddings)
+
+    def add(self, embeddings: np.ndarray):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if len(embeddings) == 0:
+            return
+        if self.use_faiss:
+            self._faiss_index.add(embeddings)
+        else:
+            ids = np.arange(self._count, self._count + len(embeddings), dtype=np.int64)
+            assignments = np.argmax(embeddings @ self.centroids.T, axis=1)
+            for cluster in np.unique(assignments):
+                members = assignments == cluster
+                self._list_ids[cluster] = np.concatenate([self._list_ids[cluster], ids[members]])
+                self._list_vectors[cluster] = np.vstack([self._list_vectors[cluster], embeddings[members]])
+        self._count += len(embeddings)
+
+    def search(self, queries: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        if self.use_faiss:
+            self._faiss_index.nprobe = self.nprobe
+            scores, indices = self._faiss_index.search(queries, top_k)
+            scores[indices < 0] = -np.inf
+            return indices.astype(np.int64), scores
+
+        nprobe = max(1, min(self.nprobe, len(self.centroids)))
+        coarse = queries @ self.centroids.T
+        probe_lists, _, _ = select_top_k(coarse, nprobe)
+
+        indices = np.full((len(queries), top_k), -1, dtype=np.int64)
+        scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        for row, lists in enumerate(probe_lists):
+            candidate_ids = np.concatenate([self._list_ids[c] for c in lists])
+            if len(candidate_ids) == 0:
+                continue
+            candidate_vectors = np.vstack([self._list_vectors[c] for c in lists])
+            similarities = candidate_vectors @ queries[row]
+            top, top_scores, _ = select_top_k(similarities[None, :], top_k)
+            indices[row, :top.shape[1]] = candidate_ids[top[0]]
+            scores[row, :top.shape[1]] = top_scores[0]
+        return indices, scores
+
+    def get_params(self) -> Dict:
+        return {"nlist": self.nlist, "nprobe": self.nprobe, "backend": "faiss" if self.use_faiss else "numpy"}
+
+    def __len__(self):
+        return self._count
+
+
+class HNSWIndex(VectorIndex):
+    """
+    HNSW图索引，需要安装 hnswlib 或 faiss-cpu（优先使用hnswlib）
+    """
+
+    name = "hnsw"
+
+    def __init__(self, M: int = 16, ef_construction: int = 200, ef_search: int = 64):
+        """
+        Args:
+            M: 每个节点的邻居数量，越大召回越高、内存越大
+            ef_construction: 构建时的候选队列长度
+            ef_search: 检索时的候选队列长度，至少为top_k
+        """
+        if hnswlib is None and faiss is None:
+            raise ImportError("HNSW索引需要安装 hnswlib 或 faiss-cpu: pip install hnswlib")
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._index = None
+        self._count = 0
+
+    def build(self, embeddings: np.ndarray):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        dim = embeddings.shape[1]
+        self._count = 0
+        if hnswlib is not None:
+            self._index = hnswlib.Index(space="ip", dim=dim)
+            self._index.init_index(max_elements=max(len(embeddings), 1),
+                                   ef_construction=self.ef_construction, M=self.M)
+        else:
+            self._index = faiss.IndexHNSWFlat(dim, self.M, faiss.METRIC_INNER_PRODUCT)
+            self._index.hnsw.efConstruction = self.ef_construction
+        self.add(embeddings)
+
+    def add(self, embeddings: np.ndarray):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if len(embeddings) == 0:
+            return
+        if hnswlib is not None:
+            required = self._count + len(embeddings)
+            if required > self._index.get_max_elements():
+                self._index.resize_index(max(required, self._index.get_max_elements() * 2))
+            self._index.add_items(embeddings, np.arange(self._count, required))
+        else:
+            self._index.add(embeddings)
+        self._count += len(embeddings)
+
+    def search(self, queries: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        k = min(top_k, self._count)
+        indices = np.full((len(queries), top_k), -1, dtype=np.int64)
+        scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        if k == 0:
+            return indices, scores
+
+        if hnswlib is not None:
+            self._index.set_ef(max(self.ef_search, k))
+            labels, distances = self._index.knn_query(queries, k=k)
+            # hnswlib的ip距离为 1 - 内积
+            indices[:, :k] = labels
+            scores[:, :k] = 1.0 - distances
+        else:
+            self._index.hnsw.efSearch = max(self.ef_search, k)
+            found_scores, found = self._index.search(queries, k)
+            indices[:, :k] = found
+            scores[:, :k] = np.where(found < 0, -np.inf, found_scores)
+        return indices, scores
+
+    def get_params(self) -> Dict:
+        return {"M": self.M, "ef_construction": self.ef_construction, "ef_search": self.ef_search,
+                "backend": "hnswlib" if hnswlib is not None else "faiss"}
+
+    def __len__(self):
+        return self._count
+
+
+class QuantizedIndex(VectorIndex):
+    """
+    在压缩码上暴力检索，可选对前 top_k*rescore_factor 个候选用原始向量精确重排
+
+    rescore_vectors 通常指向检索系统以内存映射方式加载的原始矩阵，此时常驻内存的只有压缩码，
+    重排只读取候选行
+    """
+
+    def __init__(self, codec, rescore: bool = False, rescore_factor: int = 4, chunk_size: int = 65536):
+        """
+        Args:
+            codec: quantization.py 中的编码器
+            rescore: 是否用原始向量对候选精确重排
+            rescore_factor: 重排候选数量为 top_k 的倍数
+            chunk_size: 每次解码/打分的向量行数，限制临时内存
+        """
+        self.codec = codec
+        self.rescore = rescore
+        self.rescore_factor = rescore_factor
+        self.chunk_size = chunk_size
+        self.rescore_vectors = None
+        self.codes = None
+
+    @property
+    def name(self):
+        return self.codec.name
+
+    def build(self, embeddings: np.ndarray):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        self.codec.train(embeddings)
+        self.codes = None
+        self.add(embeddings)
+
+    def add(self, embeddings: np.ndarray):
+        codes = self.codec.encode(np.asarray(embeddings, dtype=np.float32))
+        self.codes = codes if self.codes is None else np.concatenate([self.codes, codes])
+
+    def search(self, queries: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        rescoring = self.rescore and self.rescore_vectors is not None
+        k = top_k * self.rescore_factor if rescoring else top_k
+
+        # 分块打分并合并每块的top-k，避免一次性解码全部压缩码
+        best_indices = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(self.codes), self.chunk_size):
+            similarities = self.codec.score(self.codes[start:start + self.chunk_size], queries)
+            indices, scores, _ = select_top_k(similarities, k)
+            merged_indices = np.hstack([best_indices, indices + start])
+            merged_scores = np.hstack([best_scores, scores])
+            top, best_scores, _ = select_top_k(merged_scores, k)
+            best_indices = np.take_along_axis(merged_indices, top, axis=1)
+
+        if rescoring and best_indices.shape[1] > 0:
+            exact = np.einsum("qkd,qd->qk", np.asarray(self.rescore_vectors[best_indices], dtype=np.float32), queries)
+            top, best_scores, _ = select_top_k(exact, top_k)
+            best_indices = np.take_along_axis(best_indices, top, axis=1)
+
+        indices = np.full((len(queries), top_k), -1, dtype=np.int64)
+        scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        found = best_indices.shape[1]
+        indices[:, :found] = best_indices
+        scores[:, :found] = best_scores
+        return indices, scores
+
+    def memory_bytes(self) -> int:
+        """压缩码占用的内存"""
+        return 0 if self.codes is None else self.codes.nbytes
+
+    def get_params(self) -> Dict:
+        return {**self.codec.get_params(), "rescore": self.rescore, "rescore_factor": self.rescore_factor}
+
+    def __len__(self):
+        return 0 if self.codes is None else len(self.codes)
+
+
+class Float16Index(QuantizedIndex):
+    """float16存储，每个1024维向量2KB"""
+
+    def __init__(self, rescore: bool = False, rescore_factor: int = 4, chunk_size: int = 65536):
+        super().__init__(Float16Codec(), rescore, rescore_factor, chunk_size)
+
+
+class SQ8Index(QuantizedIndex):
+    """8bit标量量化，每个1024维向量1KB"""
+
+    def __init__(self, rescore: bool = False, rescore_factor: int = 4, chunk_size: int = 65536):
+        super().__init__(ScalarQuantizer(), rescore, rescore_factor, chunk_size)
+
+
+class PQIndex(QuantizedIndex):
+    """乘积量化，每个向量m字节，建议开启rescore"""
+
+    def __init__(self, m: int = 64, ksub: int = 256, train_iters: int = 15,
+                 rescore: bool = True, rescore_factor: int = 10, chunk_size: int = 65536):
+        super().__init__(ProductQuantizer(m, ksub, train_iters), rescore, rescore_factor, chunk_size)
+
+
+INDEX_TYPES = {
+    "flat": FlatIndex,
+    "ivf": IVFFlatIndex,
+    "hnsw": HNSWIndex,
+    "fp16": Float16Index,
+    "sq8": SQ8Index,
+    "pq": PQIndex,
+}
+
+
+def create_index(kind: str = "flat", **params) -> VectorIndex:
+    """按名称创建索引，params为对应索引类的构建/检索参数"""
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"未知的索引类型: {kind}，可选: {list(INDEX_TYPES)}")
+    return INDEX_TYPES[kind](**params)
+
+
+def train_kmeans(vectors: np.ndarray, k: int, iters: int = 20, seed: int = 0,
+                 max_samples_per_centroid: int = 256) -> np.ndarray:
+    """球面k-means（按内积分配），返回标准化后的 (k, dim) 质心"""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > k * max_samples_per_centroid:
+        vectors = vectors[rng.choice(len(vectors), k * max_samples_per_centroid, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+
+    for _ in range(iters):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=k)
+        empty = counts == 0
+        if empty.any():
+            # 空簇用随机样本重新初始化
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / (norms + 1e-12)
+    return centroids.astype(np.float32)
+
+
+def benchmark_index(index: VectorIndex, exact_index: VectorIndex, queries: np.ndarray,
+                    top_k: int = 10, search_params_list: List[Dict] = None) -> List[Dict]:
+    """
+    对比近似索引与精确索引，生成 recall@k 与延迟报告
+
+    Args:
+        index: 待评估的近似索引（已构建）
+        exact_index: 相同数据上的精确索引
+        queries: (Q, dim) 查询向量
+        top_k: 评估的k
+        search_params_list: 依次尝试的检索参数，如 [{"nprobe": 1}, {"nprobe": 8}]
+
+    Returns:
+        每组参数一条记录: params, recall@k, avg_latency_ms, qps
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    truth, _ = exact_index.search(queries, top_k)
+
+    report = []
+    for params in search_params_list or [{}]:
+        index.set_search_params(**params)
+        start = time.perf_counter()
+        found = np.vstack([index.search(queries[i:i + 1], top_k)[0] for i in range(len(queries))])
+        elapsed = time.perf_counter() - start
+
+        hits = sum(len(set(truth[i][truth[i] >= 0]) & set(found[i][found[i] >= 0]))
+                   for i in range(len(queries)))
+        relevant = int((truth >= 0).sum())
+        report.append({
+            "params": {**index.get_params(), **params},
+            f"recall@{top_k}": hits / relevant if relevant else 0.0,
+            "avg_latency_ms": elapsed / len(queries) * 1000,
+            "qps": len(queries) / elapsed if elapsed > 0 else float("inf"),
+        })
+    return report